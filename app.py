@@ -1,6 +1,5 @@
-import os, re, json, time, threading, queue
+import os, time, threading, queue
 import traceback
-from urllib.parse import urlparse, urljoin
 import tkinter as tk
 import ttkbootstrap as tb
 from ttkbootstrap import ttk
@@ -8,75 +7,13 @@ from ttkbootstrap.constants import *
 from ttkbootstrap.scrolled import ScrolledText
 from tkinter import filedialog, messagebox
 
-
-import requests
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
-
-# NEW: 用于 4:3 转换
-from PIL import Image
+# 抓取核心与界面无关，放在 scraper.py（命令行 cli.py 共用）
+from scraper import (
+    RUNTIME_DIR, PAD_FORMATS, PAD_BACKGROUNDS, JobOptions, Job, Crawl, BrowserPool, BrowserProvisioner,
+)
 # ---- DPI awareness & scaling helpers (Windows + 通用) ----
 # --- 放在 imports 后面 ---
-import sys, tarfile, pathlib, platform
-
-APP_NAME = "WebImageSaver"
-
-def _user_data_dir():
-    home = pathlib.Path.home()
-    if platform.system() == "Windows":
-        base = pathlib.Path(os.environ.get("LOCALAPPDATA", home / "AppData/Local"))
-        return base / APP_NAME
-    elif platform.system() == "Darwin":
-        return home / "Library/Application Support" / APP_NAME
-    else:
-        return home / ".local/share" / APP_NAME
-
-APP_ROOT   = pathlib.Path(getattr(sys, "_MEIPASS", os.path.dirname(sys.argv[0])))
-RUNTIME_DIR = _user_data_dir()
-MS_DIR      = RUNTIME_DIR / "ms-playwright"
-MS_TGZ_APP  = APP_ROOT / "ms-playwright.tgz"   # 跟 exe 同目录打包进去
-MS_TGZ_USER = RUNTIME_DIR / "ms-playwright.tgz"
-
-# 让 Playwright 永远使用“用户目录”的浏览器（可写）
-os.environ["PLAYWRIGHT_BROWSERS_PATH"] = str(MS_DIR)
-
-import subprocess  # 顶部 import
-def ensure_local_browsers():
-    RUNTIME_DIR.mkdir(parents=True, exist_ok=True)
-    if MS_DIR.exists() and any(MS_DIR.iterdir()):
-        return
-
-    if MS_TGZ_APP.exists():
-        try:
-            with tarfile.open(MS_TGZ_APP, "r:gz") as tf:
-                tf.extractall(RUNTIME_DIR)
-
-            # ✅ macOS: 清除隔离属性，避免内核被拦
-            if platform.system() == "Darwin":
-                try:
-                    subprocess.run(
-                        ["xattr", "-dr", "com.apple.quarantine", str(MS_DIR)],
-                        check=False,
-                    )
-                except Exception:
-                    pass
-
-            # 可选：留一份副本……
-            try:
-                if not MS_TGZ_USER.exists():
-                    MS_TGZ_USER.write_bytes(MS_TGZ_APP.read_bytes())
-            except Exception:
-                pass
-        except Exception as e:
-            raise SystemExit(f"[ERROR] 解压浏览器失败：{e}")
-
-        if MS_DIR.exists() and any(MS_DIR.iterdir()):
-            return
-        raise SystemExit("[ERROR] 浏览器解压后内容缺失。")
-
-    raise SystemExit("[ERROR] 缺少浏览器内核（ms-playwright.tgz）。")
-
-ensure_local_browsers()
-
+import sys, pathlib, platform
 
 
 def _apply_win_dpi_awareness():
@@ -105,172 +42,67 @@ def set_scaling_from_system(root, user_factor=1.0):
         # 失败就退回到手动倍率
         set_ui_scaling(root, 1.6 * user_factor)
 
+LOG_MAX_LINES = 5000         # 日志框最多保留的行数，更早的删掉（完整日志可另存文件）
+LOG_FILE_NAME = "webimagesaver.log"
+TICK_MS = 100                # 界面每隔多久取一次队列
+TICK_BUDGET = 20000          # 每次最多处理多少条事件，剩下的下一次再取，避免一次卡太久
+
+
+def fmt_eta(secs):
+    secs = int(secs)
+    if secs >= 3600:
+        return f"{secs // 3600}:{secs % 3600 // 60:02d}:{secs % 60:02d}"
+    return f"{secs // 60}:{secs % 60:02d}"
+
 
-def convert_to_4_3(input_path, output_path, background_color=(0, 0, 0, 0)):
+class ProgressRate:
     """
-    将图片转为 4:3 的 PNG（居中填充，不裁切），默认透明背景。
+    把任务的 progress(done, total) 变成限频的进度事件 emit(done, total, 张/秒, 剩余秒或 None)。
+    可被多个线程调用（整站抓取时每个页面线程都会报进度）；interval 内的重复调用直接丢弃，完成时总会发出。
     """
-    try:
-        with Image.open(input_path) as original_img:
-            # 统一到 RGBA，保证可以有透明背景
-            if original_img.mode != "RGBA":
-                original_img = original_img.convert("RGBA")
-
-            ow, oh = original_img.size
-            target_ratio = 4 / 3
-            original_ratio = ow / oh
-
-            if abs(original_ratio - target_ratio) < 1e-3:
-                # 已经接近 4:3，直接输出 PNG
-                original_img.save(output_path, "PNG")
+    def __init__(self, emit, interval=0.25):
+        self.emit = emit
+        self.interval = interval
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._t0 = self._done0 = None
+            self._last = 0.0
+
+    def __call__(self, done, total):
+        now = time.monotonic()
+        with self._lock:
+            if self._t0 is None or done < self._done0:
+                self._t0, self._done0 = now, done
+            if now - self._last < self.interval and done < total:
                 return
+            self._last = now
+            rate = (done - self._done0) / (now - self._t0) if now > self._t0 else 0.0
+        eta = (total - done) / rate if rate > 0 else None
+        self.emit(done, total, rate, eta)
 
-            if original_ratio > target_ratio:
-                # 图片更“宽”，补高度
-                new_h = int(round(ow / target_ratio))
-                new_w = ow
-            else:
-                # 图片更“高”，补宽度
-                new_w = int(round(oh * target_ratio))
-                new_h = oh
-
-            new_img = Image.new("RGBA", (new_w, new_h), background_color)
-            paste_x = (new_w - ow) // 2
-            paste_y = (new_h - oh) // 2
-            new_img.paste(original_img, (paste_x, paste_y))
-
-            new_img.save(output_path, "PNG")
-    except Exception as e:
-        # 不阻塞主流程，只记录
-        print(f"[WARN] 4:3 转换失败: {input_path} -> {e}")
-
-
-ILLEGAL = r'[\\/:*?"<>|]'
-CLICK_MORE_TEXTS = [
-    "加载更多","更多","下一页","更多内容","查看更多","展开",
-    "Load more","More","Next","Show more","See more","View more","Continue"
-]
-
-def sanitize(text: str, max_len=30):
-    if not text: return ""
-    text = re.sub(r'\s+', ' ', text).strip()
-    text = re.sub(ILLEGAL, ' ', text)
-    return text[:max_len]
-
-def choose_name(heading, caption, alt, fallback):
-    for s in (heading, caption, alt, fallback):
-        s = sanitize(s)
-        if s: return s
-    return "image"
-
-def ext_from_url(u: str):
-    path = urlparse(u).path.lower()
-    for ext in (".png",".jpg",".jpeg",".webp",".gif",".bmp",".svg"):
-        if path.endswith(ext): return ".png" if ext==".svg" else ext
-    return ".jpg"
-
-def fetch_bytes(url, headers=None):
-    r = requests.get(url, headers=headers or {}, timeout=20)
-    r.raise_for_status()
-    return r.content
-
-JS_COLLECT = r"""
-() => {
-  function textOf(el){ if(!el) return ""; const t = el.innerText||el.textContent||""; return t.trim().replace(/\s+/g,' '); }
-  function nearestHeading(el){
-    let n = el;
-    while(n){
-      let cur = n.previousElementSibling;
-      while(cur){
-        if(['H2','H3','H1','H4'].includes(cur.tagName) && textOf(cur)) return textOf(cur);
-        cur = cur.previousElementSibling;
-      }
-      n = n.parentElement;
-    }
-    return "";
-  }
-  function captionAround(el){
-    let p = el.closest('figure');
-    if(p){ const cap = p.querySelector('figcaption'); if(cap) return textOf(cap); }
-    const aria = el.getAttribute('aria-label')||''; if(aria.trim()) return aria.trim();
-    const descId = el.getAttribute('aria-describedby');
-    if(descId){ const d = document.getElementById(descId); if(d) return textOf(d); }
-    const near = el.closest('[class], [role], section, article, div');
-    if(near){ const cand = textOf(near); if(cand && cand.length<=80) return cand; }
-    return "";
-  }
-  function absUrl(u){ try { return new URL(u, location.href).href; } catch(e){ return ""; } }
-  function cssPath(el){
-    if (!(el instanceof Element)) return "";
-    const parts = [];
-    while (el && el.nodeType === Node.ELEMENT_NODE && parts.length < 8) {
-      let sel = el.nodeName.toLowerCase();
-      if (el.id) { sel += "#" + el.id; parts.unshift(sel); break; }
-      else {
-        let i = 1, sib = el;
-        while ((sib = sib.previousElementSibling) != null) if (sib.nodeName === el.nodeName) i++;
-        sel += `:nth-of-type(${i})`;
-      }
-      parts.unshift(sel);
-      el = el.parentElement;
-    }
-    return parts.join(" > ");
-  }
-
-  const out = [];
-
-  // <img>
-  document.querySelectorAll('img').forEach(img=>{
-    const src = img.currentSrc || img.src || "";
-    if(!src) return;
-    out.push({
-      kind:"img",
-      url:absUrl(src),
-      alt:img.alt||"",
-      caption:captionAround(img),
-      nearestHeading:nearestHeading(img),
-      css: cssPath(img)
-    });
-  });
-
-  // CSS 背景图
-  document.querySelectorAll('*').forEach(el=>{
-    const bg = getComputedStyle(el).backgroundImage;
-    if(bg && bg.includes('url(')){
-      const m = bg.match(/url\((['"]?)(.*?)\1\)/);
-      if(m && m[2]){
-        out.push({
-          kind:"bg",
-          url:absUrl(m[2]),
-          alt:"",
-          caption:captionAround(el),
-          nearestHeading:nearestHeading(el),
-          css: cssPath(el)
-        });
-      }
-    }
-  });
-
-  // 按 url 去重
-  const seen = new Set(); const dedup=[];
-  for(const it of out){
-    if(!it.url) continue;
-    const key = it.url.split('#')[0];
-    if(seen.has(key)) continue;
-    seen.add(key); dedup.push(it);
-  }
-  return dedup;
-}
-"""
 
 class App:
     def __init__(self, root):
         self.root = root
         root.title("Web Image Saver (GUI)")
         root.geometry("800x560")
+        # 工作线程 → 界面的唯一通道：("log", 行) / ("progress", done, total, 速度, 剩余) / ("idle",)
+        # 工作线程不直接碰任何 Tk 控件，全部由 tick 在主线程里批量处理
         self.q = queue.Queue()
+        self.progress = ProgressRate(lambda *ev: self.q.put(("progress",) + ev))
+        self._log_file = None
+        self._log_lock = threading.Lock()
+        # 任务线程长驻：Chromium 由它启动并在多次运行间复用（同步 API 不能跨线程）
+        self.jobs = queue.Queue()
         self.worker = None
+        self.busy = threading.Event()
         self.stop_flag = threading.Event()
+        # 浏览器内核在后台解压，窗口先出来；任务线程开浏览器前再等它
+        self._provision_pct = -1
+        self.provision = BrowserProvisioner(progress=self._provision_progress).start()
 
         # ===== 主题与基础样式 =====
         style = ttk.Style(self.root)
@@ -302,6 +134,23 @@ class App:
         self.mode = tk.StringVar(value="download")  # download / screenshot / both
         self.max_scrolls = tk.IntVar(value=30)
         self.pad_43 = tk.BooleanVar(value=False)
+        self.pad_fmt = tk.StringVar(value="PNG")
+        self.pad_bg = tk.StringVar(value="透明")
+        self.pad_max = tk.IntVar(value=0)      # 4:3 输出最长边，0 表示不缩放
+        self.png_level = tk.IntVar(value=6)
+        self.dl_workers = tk.IntVar(value=8)
+        self.dl_per_host = tk.IntVar(value=4)
+        self.max_mb = tk.IntVar(value=0)  # 单图上限（MB），0 表示不限
+        self.bg_scan = tk.StringVar(value="full")  # 背景图扫描：full / fast
+        self.use_cache = tk.BooleanVar(value=True)
+        self.cache_mb = tk.IntVar(value=1024)
+        self.resume = tk.BooleanVar(value=False)
+        self.net_capture = tk.BooleanVar(value=True)
+        self.block_res = tk.BooleanVar(value=False)
+        self.dedup = tk.BooleanVar(value=True)
+        self.crawl_depth = tk.IntVar(value=0)
+        self.crawl_pages = tk.IntVar(value=50)
+        self.save_log = tk.BooleanVar(value=False)
 
         ttk.Checkbutton(opt, text="可视浏览器（推荐）",
                         variable=self.headless, onvalue=False, offvalue=True,
@@ -323,10 +172,64 @@ class App:
         ttk.Radiobutton(opt, text="同时保存（二者都要）", variable=self.mode, value="both", bootstyle="toolbutton") \
             .grid(row=1, column=3, sticky=W, pady=(8, 0))
 
-        ttk.Checkbutton(opt, text="将全部图片转为 4:3 的 PNG（补边居中）",
+        ttk.Checkbutton(opt, text="将全部图片转为 4:3（补边居中）",
                         variable=self.pad_43, bootstyle="square-toggle") \
             .grid(row=2, column=0, columnspan=4, sticky=W, pady=(10, 0))
 
+        ttk.Label(opt, text="4:3 输出格式：").grid(row=3, column=0, sticky=E, pady=(8, 0))
+        ttk.Combobox(opt, textvariable=self.pad_fmt, values=list(PAD_FORMATS), width=6, state="readonly") \
+            .grid(row=3, column=1, sticky=W, padx=(6, 0), pady=(8, 0))
+        ttk.Label(opt, text="补边背景：").grid(row=3, column=2, sticky=E, pady=(8, 0))
+        ttk.Combobox(opt, textvariable=self.pad_bg, values=list(PAD_BACKGROUNDS), width=6, state="readonly") \
+            .grid(row=3, column=3, sticky=W, padx=(6, 0), pady=(8, 0))
+        ttk.Label(opt, text="4:3 最长边(px，0=不缩)：").grid(row=4, column=0, sticky=E, pady=(8, 0))
+        ttk.Spinbox(opt, from_=0, to=20000, increment=100, textvariable=self.pad_max, width=6) \
+            .grid(row=4, column=1, sticky=W, padx=(6, 0), pady=(8, 0))
+        ttk.Label(opt, text="PNG 压缩级别(0-9)：").grid(row=4, column=2, sticky=E, pady=(8, 0))
+        ttk.Spinbox(opt, from_=0, to=9, textvariable=self.png_level, width=6) \
+            .grid(row=4, column=3, sticky=W, padx=(6, 0), pady=(8, 0))
+
+        ttk.Label(opt, text="并发下载数：").grid(row=5, column=0, sticky=E, pady=(8, 0))
+        ttk.Spinbox(opt, from_=1, to=64, textvariable=self.dl_workers, width=6) \
+            .grid(row=5, column=1, sticky=W, padx=(6, 0), pady=(8, 0))
+        ttk.Label(opt, text="单域名并发：").grid(row=5, column=2, sticky=E, pady=(8, 0))
+        ttk.Spinbox(opt, from_=1, to=32, textvariable=self.dl_per_host, width=6) \
+            .grid(row=5, column=3, sticky=W, padx=(6, 0), pady=(8, 0))
+        ttk.Label(opt, text="单图上限(MB，0=不限)：").grid(row=6, column=0, sticky=E, pady=(8, 0))
+        ttk.Spinbox(opt, from_=0, to=4096, textvariable=self.max_mb, width=6) \
+            .grid(row=6, column=1, sticky=W, padx=(6, 0), pady=(8, 0))
+        ttk.Checkbutton(opt, text="快速背景图扫描（只查样式表/行内样式命中的元素）",
+                        variable=self.bg_scan, onvalue="fast", offvalue="full",
+                        bootstyle="round-toggle") \
+            .grid(row=6, column=2, columnspan=2, sticky=W, pady=(8, 0))
+        ttk.Checkbutton(opt, text="启用下载缓存（条件请求，未变化的图片不再重复下载）",
+                        variable=self.use_cache, bootstyle="round-toggle") \
+            .grid(row=7, column=0, columnspan=2, sticky=W, pady=(8, 0))
+        ttk.Label(opt, text="缓存上限(MB)：").grid(row=7, column=2, sticky=E, pady=(8, 0))
+        ttk.Spinbox(opt, from_=64, to=65536, increment=256, textvariable=self.cache_mb, width=6) \
+            .grid(row=7, column=3, sticky=W, padx=(6, 0), pady=(8, 0))
+        ttk.Checkbutton(opt, text="断点续传（读取输出目录里的清单，只重试未完成的图片）",
+                        variable=self.resume, bootstyle="round-toggle") \
+            .grid(row=8, column=0, columnspan=4, sticky=W, pady=(8, 0))
+        ttk.Checkbutton(opt, text="复用浏览器已加载的图片（抓包，缺失的再重新下载）",
+                        variable=self.net_capture, bootstyle="round-toggle") \
+            .grid(row=9, column=0, columnspan=4, sticky=W, pady=(8, 0))
+        ttk.Checkbutton(opt, text="滚动时拦截视频/字体/统计广告（加快加载）",
+                        variable=self.block_res, bootstyle="round-toggle") \
+            .grid(row=10, column=0, columnspan=4, sticky=W, pady=(8, 0))
+        ttk.Checkbutton(opt, text="去重（同图多尺寸只下最大的，内容相同/相似的图只保留一张）",
+                        variable=self.dedup, bootstyle="round-toggle") \
+            .grid(row=11, column=0, columnspan=4, sticky=W, pady=(8, 0))
+        ttk.Label(opt, text="整站抓取层数(0=单页)：").grid(row=12, column=0, sticky=E, pady=(8, 0))
+        ttk.Spinbox(opt, from_=0, to=10, textvariable=self.crawl_depth, width=6) \
+            .grid(row=12, column=1, sticky=W, padx=(6, 0), pady=(8, 0))
+        ttk.Label(opt, text="最多页数：").grid(row=12, column=2, sticky=E, pady=(8, 0))
+        ttk.Spinbox(opt, from_=1, to=5000, increment=10, textvariable=self.crawl_pages, width=6) \
+            .grid(row=12, column=3, sticky=W, padx=(6, 0), pady=(8, 0))
+        ttk.Checkbutton(opt, text=f"完整日志另存到输出目录（{LOG_FILE_NAME}，界面只保留最近 {LOG_MAX_LINES} 行）",
+                        variable=self.save_log, bootstyle="round-toggle") \
+            .grid(row=13, column=0, columnspan=4, sticky=W, pady=(8, 0))
+
         for c in range(4):
             opt.columnconfigure(c, weight=1)
 
@@ -335,6 +238,8 @@ class App:
         bar.pack(fill="x", pady=(6, 4))
         ttk.Separator(root, orient=HORIZONTAL).pack(fill="x")
 
+        self.status_var = tk.StringVar(value="就绪")
+        ttk.Label(bar, textvariable=self.status_var).pack(side="left")
         right = ttk.Frame(bar)
         right.pack(side="right")
         ttk.Button(right, text="开始", bootstyle="primary", command=self.start).pack(side="left")
@@ -358,20 +263,73 @@ class App:
             self.dir_var.set(d)
 
     def log_put(self, msg):
-        self.q.put(msg)
+        """任意线程可调用：入队给界面，开了完整日志时同时写文件。"""
+        self.q.put(("log", msg))
+        if self._log_file is not None:
+            with self._log_lock:
+                if self._log_file is not None:
+                    self._log_file.write(msg + "\n")
+
+    def open_log_file(self, out_dir):
+        try:
+            f = open(os.path.join(out_dir, LOG_FILE_NAME), "a", encoding="utf-8", buffering=64 * 1024)
+        except OSError as e:
+            self.log_put(f"[WARN] 无法写日志文件：{e}")
+            return
+        f.write(f"\n==== {time.strftime('%Y-%m-%d %H:%M:%S')} ====\n")
+        with self._log_lock:
+            self._log_file = f
+
+    def close_log_file(self):
+        with self._log_lock:
+            f, self._log_file = self._log_file, None
+        if f is not None:
+            f.close()
 
     def tick(self):
+        """主线程：把这段时间攒下的事件合并处理——日志一次插入并裁掉旧行，进度只取最新一条。"""
+        lines, prog, idle = [], None, False
         try:
-            while True:
-                msg = self.q.get_nowait()
-                self.log.insert("end", msg + "\n")
-                self.log.see("end")
+            for _ in range(TICK_BUDGET):
+                ev = self.q.get_nowait()
+                if ev[0] == "log":
+                    lines.append(ev[1])
+                elif ev[0] == "progress":
+                    prog = ev[1:]
+                elif ev[0] == "idle":
+                    idle, prog = True, None
         except queue.Empty:
             pass
-        self.root.after(100, self.tick)
+        if lines:
+            if len(lines) > LOG_MAX_LINES:
+                lines = lines[-LOG_MAX_LINES:]
+            self.log.insert("end", "\n".join(lines) + "\n")
+            n = int(self.log.index("end-1c").split(".")[0]) - 1
+            if n > LOG_MAX_LINES:
+                self.log.delete("1.0", f"{n - LOG_MAX_LINES + 1}.0")
+            self.log.see("end")
+        if idle:
+            self.pbar.stop()
+            self.pbar.config(mode="indeterminate", value=0)
+            self.status_var.set("就绪")
+        if prog is not None:
+            self._show_progress(*prog)
+        self.root.after(TICK_MS, self.tick)
+
+    def _show_progress(self, done, total, rate, eta):
+        if str(self.pbar.cget("mode")) != "determinate":
+            self.pbar.stop()
+            self.pbar.config(mode="determinate")
+        self.pbar.config(maximum=max(1, total), value=done)
+        text = f"{done} / {total}"
+        if rate > 0:
+            text += f" · {rate:.1f} 张/s"
+        if eta is not None and done < total:
+            text += f" · 剩余 {fmt_eta(eta)}"
+        self.status_var.set(text)
 
     def start(self):
-        if self.worker and self.worker.is_alive():
+        if self.busy.is_set():
             messagebox.showinfo("提示", "任务正在进行中…")
             return
         url = self.url_var.get().strip()
@@ -381,153 +339,91 @@ class App:
             return
         os.makedirs(out_dir, exist_ok=True)
         self.stop_flag.clear()
-        self.worker = threading.Thread(target=self.run_job, args=(url, out_dir), daemon=True)
-        self.worker.start()
+        self.busy.set()
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self.job_loop, daemon=True)
+            self.worker.start()
+        self.jobs.put((url, out_dir, self.job_options(), self.save_log.get()))
+        self.pbar.config(mode="indeterminate")
         self.pbar.start(12)
+        self.status_var.set("运行中…")
 
     def stop(self):
         self.stop_flag.set()
         self.log_put("[INFO] 已请求停止，当前步骤完成后结束。")
 
-    def try_click_more(self, page):
-        if not self.try_more.get(): return False
-        clicked = False
-        buttons = page.locator("button, a, div[role=button]")
-        count = min(buttons.count(), 200)
-        for i in range(count):
-            el = buttons.nth(i)
-            try:
-                txt = el.inner_text(timeout=400).strip().lower()
-            except Exception:
-                continue
-            if any(k.lower() in txt for k in CLICK_MORE_TEXTS):
-                try:
-                    el.scroll_into_view_if_needed(timeout=1000)
-                    el.click(timeout=1500)
-                    clicked = True
-                except Exception:
-                    pass
-        return clicked
-
-    def auto_scroll_and_collect(self, page, max_scrolls):
-        seen_count, no_new = 0, 0
-        all_items = []
-        for r in range(max_scrolls):
-            if self.stop_flag.is_set(): break
-            if self.try_click_more(page):
-                time.sleep(0.8)
-            page.evaluate("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(0.8)
+    def _provision_progress(self, done, total):
+        # 解压线程回调：每 10% 记一行日志，经队列交给主线程
+        pct = done * 100 // max(1, total) // 10 * 10
+        if pct != self._provision_pct:
+            self._provision_pct = pct
+            self.log_put(f"[INFO] 正在准备浏览器内核… {pct}%")
+
+    def job_options(self):
+        """把界面上的开关读成 JobOptions（在主线程调用，工作线程不碰 Tk 变量）。"""
+        return JobOptions(
+            mode=self.mode.get(),
+            headless=self.headless.get(),
+            try_more=self.try_more.get(),
+            max_scrolls=self.max_scrolls.get(),
+            bg_scan=self.bg_scan.get(),
+            workers=self.dl_workers.get(),
+            per_host=self.dl_per_host.get(),
+            max_mb=self.max_mb.get(),
+            use_cache=self.use_cache.get(),
+            cache_mb=self.cache_mb.get(),
+            resume=self.resume.get(),
+            net_capture=self.net_capture.get(),
+            block_resources=self.block_res.get(),
+            dedup=self.dedup.get(),
+            crawl_depth=self.crawl_depth.get(),
+            crawl_max_pages=self.crawl_pages.get(),
+            pad_43=self.pad_43.get(),
+            pad_fmt=self.pad_fmt.get(),
+            pad_bg=self.pad_bg.get(),
+            pad_max=self.pad_max.get(),
+            png_level=self.png_level.get(),
+        )
+
+    def job_loop(self):
+        """任务线程：依次执行排队的任务，浏览器池跨任务复用；可视/无头切换或浏览器被关掉时重建。"""
+        pool = None
+        while True:
+            url, out_dir, opts, save_log = self.jobs.get()
+            self.progress.reset()
+            if save_log:
+                self.open_log_file(out_dir)
             try:
-                items = page.evaluate(JS_COLLECT)
-            except Exception:
-                items = []
-            if len(items) > seen_count:
-                seen_count, no_new = len(items), 0
-            else:
-                no_new += 1
-            by_url = { it["url"]: it for it in all_items }
-            for it in items:
-                by_url[it["url"]] = it
-            all_items = list(by_url.values())
-            self.log_put(f"[SCROLL] 第{r+1}次，累计图片{len(all_items)}")
-            if no_new >= 2: break
-        return all_items
-
-    def run_job(self, url, out_dir):
-        mode = self.mode.get()
-        max_scrolls = self.max_scrolls.get()
-        self.log_put("[INFO] 启动浏览器…")
-        used = set()
-
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=self.headless.get())
-            ctx = browser.new_context()
-            page = ctx.new_page()
-            try:
-                page.goto(url, timeout=45000, wait_until="domcontentloaded")
-                page.wait_for_load_state("networkidle", timeout=15000)
-                self.log_put("[INFO] 页面已加载，开始自动滚动/加载更多…")
-            except PWTimeout:
-                self.log_put("[WARN] 页面加载超时，继续尝试采集…")
-
-            items = self.auto_scroll_and_collect(page, max_scrolls)
-
-            # 保存清单
-            manifest = os.path.join(out_dir, "images_manifest.json")
-            with open(manifest, "w", encoding="utf-8") as f:
-                json.dump(items, f, ensure_ascii=False, indent=2)
-            self.log_put(f"[INFO] 采集到 {len(items)} 张图片，已写入清单：{manifest}")
-
-            self.pbar.config(maximum=max(1, len(items)))
-            idx = 0
-            for i, it in enumerate(items, start=1):
-                if self.stop_flag.is_set(): break
-                heading = it.get("nearestHeading") or ""
-                caption = it.get("caption") or ""
-                alt = it.get("alt") or ""
-                fallback = os.path.splitext(os.path.basename(urlparse(it["url"]).path))[0]
-                base = f"{i:03d}-" + choose_name(heading, caption, alt, fallback)
-                name = base
-                k = 2
-                while name.lower() in used:
-                    name = f"{base}-{k}"; k += 1
-                used.add(name.lower())
-
-                # ------- 从这里开始替换：三种模式（含 both） -------
-                def do_download(name_base):
-                    ext = ext_from_url(it["url"])
-                    raw_path = os.path.join(out_dir, name_base + ("-orig" + ext if mode == "both" else ext))
-                    try:
-                        content = fetch_bytes(it["url"])
-                        with open(raw_path, "wb") as fp:
-                            fp.write(content)
-                        self.log_put(f"[SAVE] {raw_path}")
-                        # 4:3：下载原图时，转为 PNG（输出 .png）
-                        if self.pad_43.get():
-                            png_out = raw_path.rsplit(".", 1)[0] + ".png"
-                            convert_to_4_3(raw_path, png_out, background_color=(0, 0, 0, 0))
-                            self.log_put(f"[4:3] {png_out}")
-                        return True
-                    except Exception as e:
-                        self.log_put(f"[ERR ] 下载失败：{it['url']}  {e}")
-                        return False
-
-                def do_capture(name_base):
-                    cap_path = os.path.join(out_dir, name_base + ("-cap.png" if mode == "both" else ".png"))
+                if not self.provision.done:
+                    self.log_put("[INFO] 等待浏览器内核准备完成…")
+                if not self.provision.wait():
+                    self.log_put(self.provision.error)
+                    continue
+                # 整站抓取时多个页面线程同时租 context，池要够大，且要开放跨线程连接（调试端口）；
+                # 单页任务只在本线程租借，不开调试端口
+                crawl = opts.crawl_depth > 0
+                size = opts.crawl_workers if crawl else 1
+                if pool is not None and (pool.headless != opts.headless or pool.size < size
+                                         or pool.cross_thread != crawl or not pool.alive()):
                     try:
-                        # 有 css 选择器就做元素级截图；没有就退化到视窗截图
-                        if it.get("css"):
-                            page.locator(it["css"]).first.scroll_into_view_if_needed(timeout=2000)
-                            page.locator(it["css"]).first.screenshot(path=cap_path)
-                        else:
-                            page.screenshot(path=cap_path, full_page=False)
-                        self.log_put(f"[CAP ] {cap_path}")
-                        if self.pad_43.get():
-                            convert_to_4_3(cap_path, cap_path, background_color=(0, 0, 0, 0))
-                            self.log_put(f"[4:3] {cap_path}")
-                        return True
-                    except Exception as e:
-                        self.log_put(f"[ERR ] 截图失败：{e}")
-                        return False
-
-                mode = self.mode.get()
-                if mode == "download":
-                    do_download(name)
-                elif mode == "screenshot":
-                    do_capture(name)
-                else:  # both
-                    do_download(name)
-                    do_capture(name)
-                # ------- 替换到这里结束 -------
-                idx += 1
-                self.pbar["value"] = idx
-                self.root.update_idletasks()
-
-            browser.close()
-            self.log_put("[DONE] 任务完成。")
-            self.pbar.stop()
-            self.pbar["value"] = 0
+                        pool.close()
+                    except Exception:
+                        pass
+                    pool = None
+                if pool is None:
+                    pool = BrowserPool(size=size, headless=opts.headless, cross_thread=crawl).start()
+                if crawl:
+                    Crawl(url, out_dir, opts, log=self.log_put, progress=self.progress,
+                          stop_flag=self.stop_flag, pool=pool).run()
+                else:
+                    Job(url, out_dir, opts, log=self.log_put, progress=self.progress,
+                        stop_flag=self.stop_flag, pool=pool).run()
+            except Exception as e:
+                self.log_put(f"[ERR ] 任务异常结束：{e}")
+            finally:
+                self.close_log_file()
+                self.q.put(("idle",))
+                self.busy.clear()
 
 def _log_crash():
     try:
@@ -537,6 +433,10 @@ def _log_crash():
         pass
 
 if __name__ == "__main__":
+    # 打包后的可执行文件里，4:3 进程池的子进程需要这一步才能正常启动
+    import multiprocessing
+    multiprocessing.freeze_support()
+
     def _maybe_set_tcltk_env():
         # Nuitka 会把我们 include 的 tcl/ tk 复制到可执行所在目录
         APP_ROOT = pathlib.Path(getattr(sys, "_MEIPASS", os.path.dirname(sys.argv[0])))
@@ -0,0 +1,88 @@
+"""
+背景图扫描基准：在合成的大 DOM 上比较 full（逐元素 getComputedStyle）与 fast（样式表候选）两种策略。
+页面由本地夹具服务器（bench/fixtures.py）提供，相对 url(...) 才能解析成绝对地址。
+
+用法：
+    python bench/bench_bg_scan.py --nodes 50000 --repeat 3
+"""
+import os, sys, time, argparse, statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+from scraper import JS_COLLECT_DELTA, BG_SCAN_MODES  # noqa: E402
+from fixtures import FixtureServer  # noqa: E402
+from playwright.sync_api import sync_playwright  # noqa: E402
+
+
+def synthetic_html(nodes, bg_every=200, inline_every=500, img_every=400):
+    """生成 nodes 个节点的页面：部分元素由 class 命中背景图规则，部分用行内 style，部分是 <img>。"""
+    css = "\n".join(
+        f".bg{k} {{ background-image: url('/bg/{k}.jpg'); width: 10px; height: 10px; }}" for k in range(50)
+    )
+    parts = []
+    for i in range(nodes):
+        if i % bg_every == 0:
+            parts.append(f'<div class="bg{(i // bg_every) % 50} n{i}"></div>')
+        elif i % inline_every == 0:
+            parts.append(f'<span style="background:url(/inline/{i}.png)">x</span>')
+        elif i % img_every == 0:
+            parts.append(f'<img src="/img/{i}.jpg" alt="img {i}">')
+        elif i % 25 == 0:
+            parts.append(f"<h3>Section {i}</h3>")
+        else:
+            parts.append(f'<div class="c{i % 7}"><span>{i}</span></div>')
+    return f"<html><head><style>{css}</style></head><body>{''.join(parts)}</body></html>"
+
+
+def run(nodes, repeat, headless=True):
+    # set_content 的文档地址是 about:blank，相对 url() 无法解析，两种策略都会采到 0 张；改为真实页面
+    html = synthetic_html(nodes)
+    srv = FixtureServer(pages={"/bgscan": lambda q: html}).start()
+    results = {}
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=headless)
+            for mode in BG_SCAN_MODES:
+                results[mode] = _measure(browser, srv.base + "/bgscan", mode, repeat)
+            browser.close()
+    finally:
+        srv.close()
+    return results
+
+
+def _measure(browser, url, mode, repeat):
+    times, count = [], 0
+    for _ in range(repeat):
+        page = browser.new_page()
+        page.goto(url, wait_until="domcontentloaded")
+        t0 = time.perf_counter()
+        res = page.evaluate(JS_COLLECT_DELTA, {"bg": mode})
+        times.append(time.perf_counter() - t0)
+        count = len(res["items"])
+        page.close()
+    return statistics.median(times), min(times), count
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--nodes", type=int, default=50000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--headed", action="store_true")
+    args = ap.parse_args()
+
+    results = run(args.nodes, args.repeat, headless=not args.headed)
+    print(f"nodes={args.nodes} repeat={args.repeat}")
+    print(f"{'mode':<6} {'median(s)':>10} {'min(s)':>8} {'items':>6}")
+    for mode, (med, best, count) in results.items():
+        print(f"{mode:<6} {med:>10.3f} {best:>8.3f} {count:>6}")
+    full, fast = results["full"], results["fast"]
+    if not full[2] or not fast[2]:
+        raise SystemExit("[ERR ] 采集数量为 0，页面没有正确加载，对比无意义")
+    if full[2] != fast[2]:
+        print(f"[WARN] 两种策略采集数量不一致：full={full[2]} fast={fast[2]}")
+    print(f"speedup: {full[0] / max(fast[0], 1e-9):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+4:3 补边基准：比较旧路径（统一 RGBA + 默认 PNG）与各种省内存/省编码的组合。
+
+用法：
+    python bench/bench_pad43.py --size 6000x3000 --repeat 3
+"""
+import os, sys, time, argparse, statistics, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper import convert_to_4_3  # noqa: E402
+from PIL import Image  # noqa: E402
+
+# 名称 -> convert_to_4_3 参数；legacy 与改动前的行为一致
+CASES = {
+    "legacy-rgba-png": dict(background_color=(0, 0, 0, 0)),
+    "opaque-png-l1": dict(background_color=(255, 255, 255), compress_level=1),
+    "opaque-png-l6": dict(background_color=(255, 255, 255), compress_level=6),
+    "opaque-webp": dict(background_color=(255, 255, 255), fmt="WEBP", quality=85),
+    "opaque-jpeg": dict(background_color=(255, 255, 255), fmt="JPEG", quality=90),
+    "draft-2000-jpeg": dict(background_color=(255, 255, 255), fmt="JPEG", max_size=2000),
+}
+
+
+def make_source(path, w, h):
+    """生成一张带渐变和噪点的 JPEG（接近照片的可压缩程度）。"""
+    grad = Image.linear_gradient("L").resize((w, h))
+    noise = Image.effect_noise((w, h), 40)
+    Image.merge("RGB", (grad, noise, grad.transpose(Image.FLIP_LEFT_RIGHT))).save(path, "JPEG", quality=92)
+
+
+def run(w, h, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as d:
+        src = os.path.join(d, "src.jpg")
+        make_source(src, w, h)
+        for name, opts in CASES.items():
+            ext = {"WEBP": ".webp", "JPEG": ".jpg"}.get(opts.get("fmt", "PNG"), ".png")
+            out = os.path.join(d, name + ext)
+            times = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                if not convert_to_4_3(src, out, **opts):
+                    raise SystemExit(f"[ERR ] {name} 转换失败")
+                times.append(time.perf_counter() - t0)
+            with Image.open(out) as im:
+                size, mode = im.size, im.mode
+            results[name] = (statistics.median(times), os.path.getsize(out), size, mode)
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--size", default="6000x3000", help="源图尺寸 WxH")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    w, h = (int(x) for x in args.size.lower().split("x"))
+
+    results = run(w, h, args.repeat)
+    base = results["legacy-rgba-png"][0]
+    print(f"source={w}x{h} JPEG repeat={args.repeat}")
+    print(f"{'case':<18} {'median(s)':>10} {'speedup':>8} {'out size':>10} {'out dim':>12} mode")
+    for name, (med, nbytes, (ow, oh), mode) in results.items():
+        print(f"{name:<18} {med:>10.3f} {base / med:>7.1f}x {nbytes / 1024 / 1024:>8.1f}MB {f'{ow}x{oh}':>12} {mode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+端到端 + 分阶段基准：对本地夹具网站（bench/fixtures.py）跑完整任务和热点函数，
+记录墙钟时间、峰值内存、请求数和各阶段指标，结果存成 JSON，可与其他提交的结果对比。
+
+用法：
+    python bench/bench_suite.py --out bench-HEAD.json
+    python bench/bench_suite.py --only infinite,large --repeat 3
+    python bench/bench_suite.py --out bench-new.json --compare bench-old.json --tolerance 0.15
+
+每个场景在独立子进程里运行，峰值内存互不干扰；请求数由夹具服务器统计。
+--compare 时任一场景中位耗时比基线慢超过 tolerance，退出码为 1。
+"""
+import os, sys, json, time, argparse, platform, statistics, subprocess, tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+try:
+    import resource
+except ImportError:     # Windows 没有 resource，峰值内存记为 None
+    resource = None
+
+# 场景名 -> (类型, 参数)。job：对夹具页面跑完整 Job；async：同样的任务交给 AsyncRunner；stage：单独跑某个热点函数
+SCENARIOS = {
+    "infinite":       ("job", dict(path="/infinite?pages=8&per=20", opts=dict(mode="download"))),
+    "infinite-seq":   ("job", dict(path="/infinite?pages=8&per=20", opts=dict(mode="download", pipeline=False))),
+    "infinite-async": ("async", dict(path="/infinite?pages=8&per=20", opts=dict(mode="download"), copies=4)),
+    "bigdom":         ("job", dict(path="/bigdom?nodes=10000", opts=dict(mode="download"))),
+    "cssbg-full":     ("job", dict(path="/cssbg?nodes=3000&rules=300", opts=dict(mode="download", bg_scan="full"))),
+    "cssbg-fast":     ("job", dict(path="/cssbg?nodes=3000&rules=300", opts=dict(mode="download", bg_scan="fast"))),
+    "large-pad":      ("job", dict(path="/large?n=12&w=4000&h=3000", opts=dict(mode="download", pad_43=True))),
+    "slow":           ("job", dict(path="/slow?n=30&delay=0.3", opts=dict(mode="download"))),
+    "screenshot":     ("job", dict(path="/large?n=24&w=800&h=600", opts=dict(mode="screenshot"))),
+    "collect-js":     ("stage", dict(fn="collect", path="/bigdom?nodes=10000")),
+    "fetch":          ("stage", dict(fn="fetch", n=12, w=4000, h=3000)),
+    "pad43":          ("stage", dict(fn="pad43", w=4000, h=3000)),
+}
+
+
+def peak_rss_mb():
+    """(本进程峰值, 已回收子进程中的最大峰值)，单位 MB；Linux 上 ru_maxrss 是 KB，macOS 是字节。"""
+    if resource is None:
+        return None, None
+    scale = 1 / 1024 / 1024 if sys.platform == "darwin" else 1 / 1024
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+# ---- 子进程：实际执行一个场景 ----
+def run_job(base, params, work):
+    from scraper import JobOptions, Job
+    opts = JobOptions(use_cache=False, **params["opts"])
+    job = Job(base + params["path"], work, opts, log=lambda msg: None)
+    man = job.run()
+    return {"items": len(man.items), "done": man.count("done"), "failed": man.count("failed"),
+            "metrics": job.metrics.series()}
+
+
+def run_async(base, params, work):
+    """同一页面开 copies 份，由一个事件循环并行驱动。"""
+    from scraper import JobOptions, AsyncRunner, Metrics
+    opts = JobOptions(use_cache=False, **params["opts"])
+    metrics = Metrics()
+    tasks = [(base + params["path"], os.path.join(work, str(k)), lambda msg: None) for k in range(params["copies"])]
+    mans = AsyncRunner(opts, concurrency=params["copies"], metrics=metrics).run(tasks)
+    errors = [m for m in mans if isinstance(m, BaseException)]
+    if errors:
+        raise errors[0]
+    return {"items": sum(len(m.items) for m in mans), "done": sum(m.count("done") for m in mans),
+            "failed": sum(m.count("failed") for m in mans), "metrics": metrics.series()}
+
+
+def run_stage(base, params, work):
+    import scraper
+    fn = params["fn"]
+    if fn == "collect":
+        from playwright.sync_api import sync_playwright
+        with sync_playwright() as p:
+            browser = p.chromium.launch()
+            page = browser.new_page()
+            page.goto(base + params["path"])
+            t0 = time.perf_counter()
+            res = page.evaluate(scraper.JS_COLLECT_DELTA, {"bg": "full"})
+            secs = time.perf_counter() - t0
+            browser.close()
+        return {"items": len(res["items"]), "stage_s": round(secs, 4)}
+    if fn == "fetch":
+        t0 = time.perf_counter()
+        total = 0
+        for i in range(params["n"]):
+            url = f"{base}/img/{500000 + i}.jpg?w={params['w']}&h={params['h']}"
+            n, _, _, _ = scraper.fetch_to_file(url, os.path.join(work, f"{i}.jpg"))
+            total += n
+        return {"items": params["n"], "bytes": total, "stage_s": round(time.perf_counter() - t0, 4)}
+    if fn == "pad43":
+        from fixtures import make_image
+        src = os.path.join(work, "src.jpg")
+        with open(src, "wb") as f:
+            f.write(make_image(1, params["w"], params["h"]))
+        t0 = time.perf_counter()
+        ok = scraper.convert_to_4_3(src, os.path.join(work, "out.png"))
+        return {"items": int(ok), "stage_s": round(time.perf_counter() - t0, 4)}
+    raise SystemExit(f"未知阶段：{fn}")
+
+
+def child(name, base):
+    kind, params = SCENARIOS[name]
+    with tempfile.TemporaryDirectory() as work:
+        t0 = time.perf_counter()
+        res = {"job": run_job, "async": run_async, "stage": run_stage}[kind](base, params, work)
+        # 分阶段场景只计被测函数本身（stage_s），准备数据的时间记在 total_s
+        res["total_s"] = round(time.perf_counter() - t0, 4)
+        res["wall_s"] = res.pop("stage_s", res["total_s"])
+    res["rss_mb"], res["rss_children_mb"] = peak_rss_mb()
+    print(json.dumps(res, ensure_ascii=False))
+
+
+# ---- 父进程：启动夹具服务器，逐个场景起子进程 ----
+def run_scenario(name, srv, repeat, browsers_path=None, warmup=1):
+    """先跑 warmup 次不计入（夹具图片首次生成、磁盘缓存预热），再跑 repeat 次取中位数。"""
+    runs = []
+    for k in range(warmup + repeat):
+        before = srv.snapshot()
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", name, "--base", srv.base]
+        if browsers_path:
+            cmd += ["--browsers-path", browsers_path]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {"error": (proc.stderr or proc.stdout).strip().splitlines()[-1:]}
+        res = json.loads(proc.stdout.strip().splitlines()[-1])
+        after = srv.snapshot()
+        res["requests"] = {k: v - before["requests"].get(k, 0) for k, v in after["requests"].items()
+                           if v - before["requests"].get(k, 0)}
+        res["bytes_served"] = after["bytes"] - before["bytes"]
+        if k >= warmup:
+            runs.append(res)
+    walls = [r["wall_s"] for r in runs]
+    out = dict(runs[-1])
+    out.update(wall_s=round(statistics.median(walls), 4), wall_min_s=min(walls), runs=len(runs))
+    return out
+
+
+def compare(results, base_path, tolerance):
+    """对比基线，打印每个场景的耗时/内存变化，返回是否有回退。"""
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    print(f"\n对比基线 {base.get('commit')}（容忍 {tolerance:.0%}）")
+    print(f"{'scenario':<14} {'base(s)':>9} {'now(s)':>9} {'Δ':>8} {'rss Δ(MB)':>10}")
+    regressed = False
+    for name, now in results["scenarios"].items():
+        old = base.get("scenarios", {}).get(name)
+        if not old or "wall_s" not in old or "wall_s" not in now:
+            continue
+        delta = now["wall_s"] / max(old["wall_s"], 1e-9) - 1
+        rss = (now.get("rss_mb") or 0) - (old.get("rss_mb") or 0)
+        flag = "  <-- 回退" if delta > tolerance else ""
+        regressed = regressed or bool(flag)
+        print(f"{name:<14} {old['wall_s']:>9.3f} {now['wall_s']:>9.3f} {delta:>+7.0%} {rss:>+10.1f}{flag}")
+    return regressed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--only", help="只跑这些场景，逗号分隔：" + ",".join(SCENARIOS))
+    ap.add_argument("--repeat", type=int, default=1, help="每个场景重复次数，取中位数")
+    ap.add_argument("--warmup", type=int, default=1, help="每个场景先跑几次不计入，默认 1")
+    ap.add_argument("--out", help="结果写到这个 JSON 文件")
+    ap.add_argument("--compare", help="与这个基线 JSON 对比")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="耗时回退的容忍比例，默认 0.10")
+    ap.add_argument("--browsers-path", help="使用已安装的 Playwright 浏览器目录")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--base", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    import scraper
+    if args.child:
+        # scraper 导入时会把浏览器目录指向用户目录，这里再覆盖
+        if args.browsers_path:
+            os.environ["PLAYWRIGHT_BROWSERS_PATH"] = args.browsers_path
+        return child(args.child, args.base)
+
+    from fixtures import FixtureServer
+    if not args.browsers_path:
+        scraper.ensure_local_browsers()
+
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        ap.error(f"未知场景：{', '.join(unknown)}")
+
+    srv = FixtureServer().start()
+    results = {"commit": git_commit(), "python": platform.python_version(), "machine": platform.machine(),
+               "system": platform.system(), "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+               "scenarios": {}}
+    print(f"{'scenario':<14} {'wall(s)':>9} {'rss(MB)':>8} {'child(MB)':>9} {'reqs':>6} {'items':>6}")
+    try:
+        for name in names:
+            res = run_scenario(name, srv, args.repeat, args.browsers_path, args.warmup)
+            results["scenarios"][name] = res
+            if "error" in res:
+                print(f"{name:<14} [ERR ] {' '.join(res['error'])}")
+                continue
+            print(f"{name:<14} {res['wall_s']:>9.3f} {res['rss_mb'] or 0:>8.1f} {res['rss_children_mb'] or 0:>9.1f} "
+                  f"{sum(res['requests'].values()):>6} {res.get('items', 0):>6}")
+    finally:
+        srv.close()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.out}")
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+基准用的本地夹具网站：页面和图片都由代码生成，内容只取决于参数，跨提交可复现。
+
+页面：
+    /infinite?pages=8&per=20     无限滚动：滚到底部时 fetch /api/more 追加一批图片，共 pages 批
+    /bigdom?nodes=10000          大 DOM：nodes 个节点，每 50 个里有一张 <img>
+    /cssbg?nodes=3000&rules=300  重 CSS 背景：rules 条背景图规则 + 行内 style 背景
+    /large?n=12&w=4000&h=3000    大图：n 张 w×h 的 JPEG
+    /slow?n=30&delay=0.3         慢响应：每张图延迟 delay 秒才返回
+图片：/img/<i>.jpg?w=&h=&delay=  按 i 生成、互不相似的 JPEG（不会被 dHash 去重合并），带 ETag。
+
+用法（单独启动，浏览器里看看）：
+    python bench/fixtures.py --port 8765
+"""
+import io, time, random, hashlib, argparse, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image
+
+
+_noise = {}
+
+
+def make_image(i, w, h, quality=85):
+    """第 i 张图：粗粒度随机色块放大 + 噪点，不同 i 的感知哈希差别足够大。噪点层按尺寸复用。"""
+    rnd = random.Random(i)
+    coarse = Image.new("RGB", (6, 5))
+    coarse.putdata([tuple(rnd.randrange(256) for _ in range(3)) for _ in range(30)])
+    base = coarse.resize((w, h), Image.BILINEAR)
+    noise = _noise.get((w, h))
+    if noise is None:
+        # 固定种子的噪点，保证同样参数的图片在任何机器、任何提交上字节完全一致
+        gray = Image.frombytes("L", (w, h), random.Random(w * 100003 + h).randbytes(w * h))
+        noise = _noise[(w, h)] = gray.convert("RGB")
+    buf = io.BytesIO()
+    Image.blend(base, noise, 0.15).save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def _img(i, w=320, h=240, delay=0.0, lazy=False):
+    src = f"/img/{i}.jpg?w={w}&h={h}" + (f"&delay={delay}" if delay else "")
+    attr = f'data-src="{src}" src="data:image/gif;base64,R0lGODlhAQABAAAAACw="' if lazy else f'src="{src}"'
+    return f'<figure><img {attr} alt="img {i}" width="{w // 2}" height="{h // 2}"><figcaption>图片 {i}</figcaption></figure>'
+
+
+def page_infinite(q):
+    pages, per = int(q.get("pages", 8)), int(q.get("per", 20))
+    first = "".join(_img(i) for i in range(per))
+    return f"""<html><body><h2>无限滚动</h2><div id="feed">{first}</div>
+<script>
+let p = 1;
+function more(){{
+  if(p >= {pages}) return;
+  const k = p++;
+  fetch('/api/more?p=' + k + '&per={per}').then(r => r.text())
+    .then(h => document.getElementById('feed').insertAdjacentHTML('beforeend', h));
+}}
+addEventListener('scroll', () => {{ if(innerHeight + scrollY >= document.body.scrollHeight - 300) more(); }});
+</script></body></html>"""
+
+
+def api_more(q):
+    p, per = int(q.get("p", 1)), int(q.get("per", 20))
+    time.sleep(0.05)
+    return "".join(_img(p * per + i, lazy=(i % 2 == 1)) for i in range(per))
+
+
+def page_bigdom(q):
+    nodes = int(q.get("nodes", 10000))
+    parts = []
+    for i in range(nodes):
+        if i % 50 == 0:
+            parts.append(_img(i, 200, 150))
+        elif i % 20 == 0:
+            parts.append(f"<h3>Section {i}</h3>")
+        else:
+            parts.append(f'<div class="c{i % 7}"><span>{i}</span></div>')
+    return f"<html><body>{''.join(parts)}</body></html>"
+
+
+def page_cssbg(q):
+    nodes, rules = int(q.get("nodes", 3000)), int(q.get("rules", 300))
+    css = "\n".join(f".bg{k} {{ background-image: url('/img/{100000 + k}.jpg?w=64&h=64'); width: 16px; height: 16px; }}"
+                    for k in range(rules))
+    parts = []
+    for i in range(nodes):
+        if i % 10 == 0:
+            parts.append(f'<div class="bg{(i // 10) % rules}"></div>')
+        elif i % 25 == 0:
+            parts.append(f'<span style="background:url(/img/{200000 + i}.jpg?w=64&h=64)">x</span>')
+        else:
+            parts.append(f'<div class="c{i % 5}"><b>{i}</b></div>')
+    return f"<html><head><style>{css}</style></head><body>{''.join(parts)}</body></html>"
+
+
+def page_large(q):
+    n, w, h = int(q.get("n", 12)), int(q.get("w", 4000)), int(q.get("h", 3000))
+    return "<html><body>" + "".join(_img(300000 + i, w, h) for i in range(n)) + "</body></html>"
+
+
+def page_slow(q):
+    n, delay = int(q.get("n", 30)), float(q.get("delay", 0.3))
+    return "<html><body>" + "".join(_img(400000 + i, delay=delay) for i in range(n)) + "</body></html>"
+
+
+PAGES = {
+    "/infinite": page_infinite,
+    "/bigdom": page_bigdom,
+    "/cssbg": page_cssbg,
+    "/large": page_large,
+    "/slow": page_slow,
+    "/api/more": api_more,
+}
+
+
+class FixtureServer:
+    """
+    后台线程里的夹具服务器。requests 按路径前缀（/img、/infinite…）计数，
+    snapshot() 取当前计数，用来算一次运行发了多少请求、传了多少字节。
+    pages 可以追加/覆盖页面：{路径: fn(查询参数 dict) -> html}。
+    """
+    def __init__(self, host="127.0.0.1", port=0, pages=None):
+        self.pages = dict(PAGES, **(pages or {}))
+        self.counts = {}
+        self.bytes_out = 0
+        self._images = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def snapshot(self):
+        with self._lock:
+            return {"requests": dict(self.counts), "bytes": self.bytes_out}
+
+    def image(self, i, w, h):
+        key = (i, w, h)
+        with self._lock:
+            data = self._images.get(key)
+        if data is None:
+            data = make_image(i, w, h)
+            with self._lock:
+                self._images[key] = data
+        return data
+
+    def _count(self, path, nbytes):
+        prefix = "/" + path.strip("/").split("/", 1)[0]
+        with self._lock:
+            self.counts[prefix] = self.counts.get(prefix, 0) + 1
+            self.bytes_out += nbytes
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, code, ctype, body, etag=None):
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                if etag:
+                    self.send_header("ETag", etag)
+                    self.send_header("Cache-Control", "max-age=0")
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+                server._count(urlparse(self.path).path, len(body))
+
+            def do_GET(self):
+                u = urlparse(self.path)
+                q = {k: v[-1] for k, v in parse_qs(u.query).items()}
+                if u.path.startswith("/img/"):
+                    try:
+                        i = int(u.path.rsplit("/", 1)[-1].split(".")[0])
+                        w, h = int(q.get("w", 320)), int(q.get("h", 240))
+                    except ValueError:
+                        return self.send_body(404, "text/plain", b"bad image")
+                    if q.get("delay"):
+                        time.sleep(float(q["delay"]))
+                    data = server.image(i, w, h)
+                    etag = '"' + hashlib.md5(data).hexdigest() + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        return self.send_body(304, "image/jpeg", b"", etag)
+                    return self.send_body(200, "image/jpeg", data, etag)
+                fn = server.pages.get(u.path)
+                if fn is None:
+                    return self.send_body(404, "text/plain", b"not found")
+                ctype = "text/html; charset=utf-8"
+                self.send_body(200, ctype, fn(q).encode("utf-8"))
+
+            do_HEAD = do_GET
+
+        return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+    srv = FixtureServer(port=args.port).start()
+    print(f"夹具网站：{srv.base}/  （Ctrl+C 退出）")
+    for path in PAGES:
+        if not path.startswith("/api"):
+            print(f"  {srv.base}{path}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+命令行批量入口（无需 Tk）：读取网址列表，每个网址输出到单独的子目录。
+
+用法：
+    python cli.py urls.txt -o out -j 4
+    cat urls.txt | python cli.py - -o out --mode both --pad-43
+    python cli.py urls.txt -o out --crawl-depth 2 --crawl-include "/gallery/"
+    python cli.py urls.txt -o out --async-pages 8
+
+网址列表每行一个，空行和 # 开头的行忽略。-j 个任务并行，共用同一个 Chromium（从 context 池租借）；
+--async-pages 时改由一个 asyncio 事件循环同时驱动多个页面（只支持下载模式）。
+退出码：0 全部成功；1 有任务异常或有图片失败；2 参数错误；130 被中断。
+"""
+import os, re, sys, threading, queue, argparse
+
+import scraper
+from scraper import (JobOptions, Job, Crawl, AsyncRunner, BrowserPool, BrowserProvisioner, Metrics, BG_SCAN_MODES,
+                     SRC_POLICIES, PAD_FORMATS, PAD_BACKGROUNDS, url_dir_name, shared_cache)
+
+
+def read_urls(path):
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with f:
+        return [ln.strip() for ln in f if ln.strip() and not ln.lstrip().startswith("#")]
+
+
+def build_parser():
+    d = JobOptions()
+    ap = argparse.ArgumentParser(description="批量抓取网页图片（无界面）")
+    ap.add_argument("urls", help="网址列表文件，- 表示从标准输入读取")
+    ap.add_argument("-o", "--out", required=True, help="输出根目录，每个网址一个子目录")
+    ap.add_argument("-j", "--jobs", type=int, help="并行任务数（共用一个 Chromium），默认 2")
+    ap.add_argument("--mode", choices=("download", "screenshot", "both"), default=d.mode)
+    ap.add_argument("--headed", action="store_true", help="显示浏览器窗口（默认无头）")
+    ap.add_argument("--no-click-more", action="store_true", help="不尝试点击“加载更多/下一页”")
+    ap.add_argument("--max-scrolls", type=int, default=d.max_scrolls)
+    ap.add_argument("--scroll-quiet-ms", type=int, default=d.scroll_quiet_ms, help="DOM 静止多久算加载完（毫秒）")
+    ap.add_argument("--scroll-timeout", type=float, default=d.scroll_timeout, help="每轮滚动最多等待秒数")
+    ap.add_argument("--scroll-patience", type=int, default=d.scroll_patience, help="连续几轮无变化后停止滚动")
+    ap.add_argument("--bg-scan", choices=BG_SCAN_MODES, default=d.bg_scan)
+    ap.add_argument("--workers", type=int, default=d.workers, help="每个任务的并发下载数")
+    ap.add_argument("--per-host", type=int, default=d.per_host, help="单域名并发")
+    ap.add_argument("--max-mb", type=int, default=d.max_mb, help="单图上限（MB），0 表示不限")
+    ap.add_argument("--no-cache", action="store_true", help="不使用下载缓存")
+    ap.add_argument("--cache-mb", type=int, default=d.cache_mb)
+    ap.add_argument("--no-net-capture", action="store_true", help="不复用浏览器已下载的图片，全部重新走 HTTP")
+    ap.add_argument("--block", action="store_true", help="滚动时拦截视频/字体/统计广告等与图片无关的请求")
+    ap.add_argument("--block-types", default=",".join(d.block_types),
+                    help="--block 时拦截的资源类型，逗号分隔（media,font,stylesheet,script,xhr,fetch,other…）")
+    ap.add_argument("--block-domains", default="", help="额外拦截的域名，逗号分隔（按后缀匹配）")
+    ap.add_argument("--allow-domains", default="", help="始终放行的域名，逗号分隔（优先于拦截）")
+    ap.add_argument("--src-policy", choices=SRC_POLICIES, default=d.src_policy,
+                    help="srcset/懒加载有多个候选地址时选哪个：最大、最接近 --src-target、最小、浏览器当前显示的")
+    ap.add_argument("--src-target", type=int, default=d.src_target, help="closest 策略的目标宽度（像素）")
+    ap.add_argument("--no-dedup", action="store_true", help="不去重（尺寸变体和内容相同/相似的图都保存）")
+    ap.add_argument("--dedup-distance", type=int, default=d.dedup_distance,
+                    help="相似图判定的 dHash 汉明距离，-1 表示只去完全相同的")
+    ap.add_argument("--no-pipeline", action="store_true", help="滚动全部结束后再开始下载（不边滚动边下载）")
+    ap.add_argument("--pipeline-depth", type=int, default=d.pipeline_depth, help="边滚动边下载时在途下载数上限")
+    ap.add_argument("--async-pages", type=int, default=0,
+                    help="用 asyncio 在一个线程里同时驱动这么多页面（代替 -j，仅 download 模式，不支持整站）")
+    ap.add_argument("--no-batch-capture", action="store_true", help="截图时逐个元素截图，不做整页分块裁剪")
+    ap.add_argument("--crawl-depth", type=int, default=d.crawl_depth,
+                    help="整站抓取：沿同站链接跟进的层数，0 表示只抓列表里的页面")
+    ap.add_argument("--crawl-max-pages", type=int, default=d.crawl_max_pages, help="每个起始网址最多抓多少页")
+    ap.add_argument("--crawl-include", default=d.crawl_include, help="只跟进匹配该正则的链接")
+    ap.add_argument("--crawl-exclude", default=d.crawl_exclude, help="不跟进匹配该正则的链接")
+    ap.add_argument("--crawl-workers", type=int, default=d.crawl_workers, help="每个起始网址同时处理的页面数")
+    ap.add_argument("--crawl-delay", type=float, default=d.crawl_delay, help="同一域名两次打开页面的最小间隔（秒）")
+    ap.add_argument("--resume", action="store_true", help="读取各子目录已有清单，只重试未完成的图片")
+    ap.add_argument("--pad-43", action="store_true", help="转为 4:3（补边居中）")
+    ap.add_argument("--pad-format", choices=list(PAD_FORMATS), default=d.pad_fmt)
+    ap.add_argument("--pad-bg", choices=list(PAD_BACKGROUNDS), default=d.pad_bg)
+    ap.add_argument("--pad-max", type=int, default=d.pad_max, help="4:3 输出最长边，0 表示不缩放")
+    ap.add_argument("--png-level", type=int, choices=range(10), default=d.png_level, metavar="0-9")
+    ap.add_argument("--recycle-pages", type=int, help="一个 context 开过多少个页面后重建，默认 20")
+    ap.add_argument("--recycle-heap-mb", type=int, help="页面 JS 堆超过多少 MB 时重建 context，0 表示不看，默认 512")
+    ap.add_argument("--metrics-jsonl", default="", help="每个任务结束时把各阶段指标追加到这个 JSON Lines 文件")
+    ap.add_argument("--metrics-prom", help="全部结束后把汇总指标写成 Prometheus 文本格式（node_exporter textfile）")
+    ap.add_argument("--browsers-path", help="使用已安装的 Playwright 浏览器目录，而不是解压自带的内核")
+    return ap
+
+
+def _split(csv):
+    return tuple(x.strip() for x in csv.split(",") if x.strip())
+
+
+def _provision_progress():
+    """解压进度写到 stderr，每 10% 一行。"""
+    last = [-1]
+
+    def progress(done, total):
+        pct = done * 100 // max(1, total) // 10 * 10
+        if pct != last[0]:
+            last[0] = pct
+            print(f"[INFO] 正在准备浏览器内核… {pct}%", file=sys.stderr, flush=True)
+    return progress
+
+
+def options_from_args(args):
+    return JobOptions(
+        mode=args.mode,
+        headless=not args.headed,
+        try_more=not args.no_click_more,
+        max_scrolls=args.max_scrolls,
+        scroll_quiet_ms=args.scroll_quiet_ms,
+        scroll_timeout=args.scroll_timeout,
+        scroll_patience=args.scroll_patience,
+        bg_scan=args.bg_scan,
+        workers=args.workers,
+        per_host=args.per_host,
+        max_mb=args.max_mb,
+        use_cache=not args.no_cache,
+        cache_mb=args.cache_mb,
+        resume=args.resume,
+        crawl_depth=args.crawl_depth,
+        crawl_max_pages=args.crawl_max_pages,
+        crawl_include=args.crawl_include,
+        crawl_exclude=args.crawl_exclude,
+        crawl_workers=args.crawl_workers,
+        crawl_delay=args.crawl_delay,
+        src_policy=args.src_policy,
+        src_target=args.src_target,
+        dedup=not args.no_dedup,
+        dedup_distance=args.dedup_distance,
+        batch_capture=not args.no_batch_capture,
+        pipeline=not args.no_pipeline,
+        pipeline_depth=args.pipeline_depth,
+        net_capture=not args.no_net_capture,
+        block_resources=args.block,
+        block_types=_split(args.block_types),
+        block_domains=scraper.TRACKER_DOMAINS + _split(args.block_domains),
+        allow_domains=_split(args.allow_domains),
+        pad_43=args.pad_43,
+        pad_fmt=args.pad_format,
+        pad_bg=args.pad_bg,
+        pad_max=args.pad_max,
+        png_level=args.png_level,
+        metrics_jsonl=args.metrics_jsonl,
+    )
+
+
+def run_async(args, urls, opts, stop_flag, log_for, metrics, cache):
+    """--async-pages：全部网址交给一个事件循环，同时最多开 args.async_pages 个页面。"""
+    tasks = []
+    for i, url in enumerate(urls, start=1):
+        out_dir = os.path.join(args.out, url_dir_name(i, url))
+        log_for(i)(f"[INFO] {url} -> {out_dir}")
+        tasks.append((url, out_dir, log_for(i)))
+    runner = AsyncRunner(opts, concurrency=args.async_pages, stop_flag=stop_flag, metrics=metrics, cache=cache)
+    try:
+        results = runner.run(tasks)
+    except KeyboardInterrupt:
+        stop_flag.set()
+        print("[INFO] 已中断", file=sys.stderr)
+        return 130
+    finally:
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+    failures = [url for url, man in zip(urls, results) if isinstance(man, BaseException) or man.count("failed")]
+    print(f"[DONE] {len(urls)} 个网址，失败 {len(failures)}（asyncio，{runner.concurrency} 个页面并行）")
+    if len(urls) > 1:
+        for line in metrics.table():
+            print(f"[STAT] 合计 {line}")
+    for url in failures:
+        print(f"[FAIL] {url}")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    ap = build_parser()
+    args = ap.parse_args(argv)
+    # 浏览器内核先在后台解压，读网址列表、校验参数的同时进行
+    if args.browsers_path:
+        os.environ["PLAYWRIGHT_BROWSERS_PATH"] = args.browsers_path
+        provision = None
+    else:
+        provision = BrowserProvisioner(progress=_provision_progress()).start()
+    try:
+        urls = read_urls(args.urls)
+    except OSError as e:
+        ap.error(f"无法读取网址列表：{e}")
+    if not urls:
+        ap.error("网址列表为空")
+
+    for pat in (args.crawl_include, args.crawl_exclude):
+        try:
+            re.compile(pat)
+        except re.error as e:
+            ap.error(f"正则无效：{pat}（{e}）")
+    if args.async_pages > 0:
+        # 抓包和 --block 由 AsyncRunner 照常处理；下面这些它用不上，不能默默忽略
+        unsupported = [flag for flag, given in (
+            (f"--mode {args.mode}", args.mode != "download"),
+            ("--crawl-depth", args.crawl_depth > 0),
+            ("-j/--jobs", args.jobs is not None),
+            ("--recycle-pages", args.recycle_pages is not None),
+            ("--recycle-heap-mb", args.recycle_heap_mb is not None),
+        ) if given]
+        if unsupported:
+            ap.error(f"--async-pages 不能与 {'、'.join(unsupported)} 同用")
+    if args.jobs is None:
+        args.jobs = 2
+    if args.recycle_pages is None:
+        args.recycle_pages = 20
+    if args.recycle_heap_mb is None:
+        args.recycle_heap_mb = 512
+
+    if provision is not None and not provision.wait():
+        print(provision.error, file=sys.stderr)
+        return 1
+
+    opts = options_from_args(args)
+    stop_flag = threading.Event()
+    print_lock = threading.Lock()
+    todo = queue.Queue()
+    for i, url in enumerate(urls, start=1):
+        todo.put((i, url))
+    failures = []
+    metrics = Metrics()
+    # 所有任务共用一个下载缓存：各自建实例会互相覆盖 index.json
+    cache = shared_cache(opts.cache_mb * 1024 * 1024) if opts.use_cache else None
+
+    def log_for(i):
+        def log(msg):
+            with print_lock:
+                print(f"[{i:03d}] {msg}", flush=True)
+        return log
+
+    def worker(pool):
+        # 每个线程一个 Playwright 连接，顺序处理分到的网址
+        try:
+            while not stop_flag.is_set():
+                try:
+                    i, url = todo.get_nowait()
+                except queue.Empty:
+                    return
+                out_dir = os.path.join(args.out, url_dir_name(i, url))
+                log = log_for(i)
+                log(f"[INFO] {url} -> {out_dir}")
+                try:
+                    if opts.crawl_depth > 0:
+                        crawl = Crawl(url, out_dir, opts, log=log, stop_flag=stop_flag, pool=pool, metrics=metrics,
+                                      cache=cache)
+                        crawl.run()
+                        if crawl.failures:
+                            failures.append(url)
+                    else:
+                        man = Job(url, out_dir, opts, log=log, stop_flag=stop_flag, pool=pool, metrics=metrics,
+                                  cache=cache).run()
+                        if man.count("failed"):
+                            failures.append(url)
+                except Exception as e:
+                    log(f"[ERR ] 任务异常结束：{e}")
+                    failures.append(url)
+        finally:
+            pool.release_thread()
+
+    if args.async_pages > 0:
+        return run_async(args, urls, opts, stop_flag, log_for, metrics, cache)
+
+    n_threads = max(1, min(args.jobs, len(urls)))
+    # 整站抓取时每个起始网址内部还有 crawl_workers 个页面线程，一起从池里租 context
+    n_leases = n_threads * (max(1, opts.crawl_workers) if opts.crawl_depth > 0 else 1)
+    pool = BrowserPool(size=n_leases, headless=opts.headless,
+                       max_pages=args.recycle_pages, max_heap_mb=args.recycle_heap_mb).start()
+    threads = [threading.Thread(target=worker, args=(pool,), daemon=True) for _ in range(n_threads)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(0.5)
+    except KeyboardInterrupt:
+        stop_flag.set()
+        print("[INFO] 已请求停止，等待当前步骤结束…", file=sys.stderr)
+        for t in threads:
+            t.join()
+        return 130
+    finally:
+        pool.close()
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+
+    print(f"[DONE] {len(urls)} 个网址，失败 {len(failures)}，"
+          f"context 创建 {pool.contexts_created} / 回收 {pool.contexts_recycled}")
+    if len(urls) > 1:
+        for line in metrics.table():
+            print(f"[STAT] 合计 {line}")
+    for url in failures:
+        print(f"[FAIL] {url}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
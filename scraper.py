@@ -0,0 +1,3269 @@
+"""
+网页图片抓取核心（不依赖 Tk）：采集脚本、下载/缓存/清单、4:3 转换，以及 Job 任务接口。
+GUI（app.py）与命令行（cli.py）都只是在这里之上包一层。
+"""
+import os, io, re, sys, json, time, queue, random, threading, tempfile
+import hashlib, shutil, inspect, contextlib, multiprocessing
+import tarfile, pathlib, platform, subprocess
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+# requests / Playwright / Pillow 都比较重，在用到的函数里再导入：
+# 界面和命令行可以先起来，4:3 子进程也不必加载 Playwright。
+
+APP_NAME = "WebImageSaver"
+
+def _user_data_dir():
+    home = pathlib.Path.home()
+    if platform.system() == "Windows":
+        base = pathlib.Path(os.environ.get("LOCALAPPDATA", home / "AppData/Local"))
+        return base / APP_NAME
+    elif platform.system() == "Darwin":
+        return home / "Library/Application Support" / APP_NAME
+    else:
+        return home / ".local/share" / APP_NAME
+
+APP_ROOT   = pathlib.Path(getattr(sys, "_MEIPASS", os.path.dirname(sys.argv[0])))
+RUNTIME_DIR = _user_data_dir()
+MS_DIR      = RUNTIME_DIR / "ms-playwright"
+MS_TGZ_APP  = APP_ROOT / "ms-playwright.tgz"   # 跟 exe 同目录打包进去
+MS_TGZ_USER = RUNTIME_DIR / "ms-playwright.tgz"
+
+# 让 Playwright 永远使用“用户目录”的浏览器（可写）
+os.environ["PLAYWRIGHT_BROWSERS_PATH"] = str(MS_DIR)
+
+BUNDLE_STAMP = MS_DIR / ".bundle-stamp"     # 记录解压自哪个归档（大小:mtime），启动时只需 stat + 读一行
+
+
+def _bundle_id(path):
+    st = path.stat()
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+class _CountingReader:
+    """包一层文件对象，按已读的压缩字节数回调进度 (已读, 总数)。"""
+    def __init__(self, f, total, progress):
+        self.f, self.total, self.progress = f, total, progress
+        self.done = 0
+
+    def read(self, n=-1):
+        data = self.f.read(n)
+        self.done += len(data)
+        if self.progress and data:
+            self.progress(self.done, self.total)
+        return data
+
+
+def ensure_local_browsers(progress=None):
+    """
+    保证用户目录里有可用的浏览器内核。
+    已解压过且归档没变时只做一次 stat 和一次小文件读取；否则边读边解压（不把归档整个读进内存），
+    先解到同级临时目录，完整后再换到 MS_DIR，中途失败不会留下半套内核。
+    progress(已读字节, 总字节) 可选，解压时按读取进度回调。
+    """
+    RUNTIME_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        stamp = BUNDLE_STAMP.read_text(encoding="utf-8").strip()
+    except OSError:
+        stamp = None
+
+    if not MS_TGZ_APP.exists():
+        # 没有随包归档（开发环境或已删）：有解压过的内核就直接用
+        if stamp is not None or (MS_DIR.exists() and any(MS_DIR.iterdir())):
+            return
+        raise SystemExit("[ERROR] 缺少浏览器内核（ms-playwright.tgz）。")
+
+    bundle = _bundle_id(MS_TGZ_APP)
+    if stamp == bundle:
+        return
+
+    tmp = pathlib.Path(tempfile.mkdtemp(prefix=".ms-extract-", dir=RUNTIME_DIR))
+    try:
+        total = MS_TGZ_APP.stat().st_size
+        with open(MS_TGZ_APP, "rb") as raw:
+            # "r|gz" 是流式模式：顺序读一遍，不回头 seek
+            with tarfile.open(fileobj=_CountingReader(raw, total, progress), mode="r|gz") as tf:
+                if hasattr(tarfile, "data_filter"):
+                    tf.extractall(tmp, filter="data")
+                else:
+                    tf.extractall(tmp)
+        extracted = tmp / MS_DIR.name
+        if not extracted.is_dir() or not any(extracted.iterdir()):
+            raise SystemExit("[ERROR] 浏览器解压后内容缺失。")
+
+        # ✅ macOS: 清除隔离属性，避免内核被拦
+        if platform.system() == "Darwin":
+            try:
+                subprocess.run(
+                    ["xattr", "-dr", "com.apple.quarantine", str(extracted)],
+                    check=False,
+                )
+            except Exception:
+                pass
+
+        (extracted / BUNDLE_STAMP.name).write_text(bundle, encoding="utf-8")
+        if MS_DIR.exists():
+            shutil.rmtree(MS_DIR, ignore_errors=True)
+        os.replace(extracted, MS_DIR)
+    except SystemExit:
+        raise
+    except Exception as e:
+        raise SystemExit(f"[ERROR] 解压浏览器失败：{e}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    # 可选：留一份副本……（分块复制，不整个读进内存）
+    try:
+        if not MS_TGZ_USER.exists() or MS_TGZ_USER.stat().st_size != total:
+            shutil.copyfile(MS_TGZ_APP, MS_TGZ_USER)
+    except Exception:
+        pass
+
+
+class BrowserProvisioner:
+    """
+    在后台线程里跑 ensure_local_browsers，界面/命令行不必等解压完才能用。
+    wait() 阻塞到结束，返回是否就绪；失败原因在 error 里。progress 同 ensure_local_browsers。
+    """
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.error = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="browser-provision", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            ensure_local_browsers(self.progress)
+        except SystemExit as e:
+            self.error = str(e)
+        except Exception as e:
+            self.error = f"[ERROR] 准备浏览器失败：{e}"
+        finally:
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self._done.is_set() and self.error is None
+
+
+# 4:3 输出格式 -> 扩展名
+PAD_FORMATS = {"PNG": ".png", "WEBP": ".webp", "JPEG": ".jpg"}
+# 补边背景色：透明需要 RGBA；纯色背景可以保留源图的 L/RGB 模式
+PAD_BACKGROUNDS = {"透明": (0, 0, 0, 0), "白色": (255, 255, 255), "黑色": (0, 0, 0)}
+
+
+def _is_opaque(color):
+    return len(color) == 3 or color[3] == 255
+
+
+def convert_to_4_3(input_path, output_path, background_color=(0, 0, 0, 0), fmt="PNG",
+                   max_size=None, compress_level=6, optimize=False, quality=90):
+    """
+    将图片转为 4:3（居中填充，不裁切），默认透明背景的 PNG。成功返回 True。
+    - 背景不透明（或输出 JPEG）时保留源图的 L/RGB 模式，不再升到 RGBA；带透明通道的源图用 alpha 贴到纯色底上。
+    - max_size 为最长边上限：JPEG 用 Image.draft 在解码时直接缩小，其它格式解码后再缩。
+    - fmt 为 PNG / WEBP / JPEG；PNG 用 compress_level / optimize，WEBP / JPEG 用 quality。
+    先写临时文件，关闭源图后再原子替换：输出可能与下载缓存共用硬链接，不能原地覆盖。
+    """
+    from PIL import Image
+    fmt = fmt.upper()
+    if fmt == "JPEG" and not _is_opaque(background_color):
+        background_color = tuple(background_color[:3])  # JPEG 没有透明通道
+    opaque = _is_opaque(background_color)
+    tmp = output_path + ".tmp"
+    try:
+        with Image.open(input_path) as original_img:
+            if max_size and original_img.format == "JPEG":
+                # 解码时按 1/2、1/4、1/8 缩小，省掉大图的完整解码
+                original_img.draft(original_img.mode, (max_size, max_size))
+            img = original_img
+            if max_size and max(img.size) > max_size:
+                img = img.copy()
+                img.thumbnail((max_size, max_size), Image.LANCZOS)
+
+            has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+            if not opaque:
+                # 透明背景：统一到 RGBA
+                mode = "RGBA"
+            elif has_alpha:
+                mode = "RGB"
+            else:
+                mode = img.mode if img.mode in ("L", "RGB") else "RGB"
+            if has_alpha and opaque:
+                img = img.convert("RGBA")
+            elif img.mode != mode:
+                img = img.convert(mode)
+
+            ow, oh = img.size
+            target_ratio = 4 / 3
+            original_ratio = ow / oh
+
+            if abs(original_ratio - target_ratio) < 1e-3 and img.mode == mode:
+                # 已经接近 4:3，直接输出
+                out = img
+            else:
+                if original_ratio > target_ratio:
+                    # 图片更“宽”，补高度
+                    new_h = int(round(ow / target_ratio))
+                    new_w = ow
+                else:
+                    # 图片更“高”，补宽度
+                    new_w = int(round(oh * target_ratio))
+                    new_h = oh
+
+                if mode == "RGBA":
+                    bg = background_color
+                elif mode == "L":
+                    bg = Image.new("RGB", (1, 1), tuple(background_color[:3])).convert("L").getpixel((0, 0))
+                else:
+                    bg = tuple(background_color[:3])
+                out = Image.new(mode, (new_w, new_h), bg)
+                paste_x = (new_w - ow) // 2
+                paste_y = (new_h - oh) // 2
+                if img.mode == "RGBA" and mode != "RGBA":
+                    out.paste(img, (paste_x, paste_y), img)
+                else:
+                    out.paste(img, (paste_x, paste_y))
+
+            if fmt == "PNG":
+                out.save(tmp, "PNG", compress_level=compress_level, optimize=optimize)
+            elif fmt == "WEBP":
+                out.save(tmp, "WEBP", quality=quality, method=4)
+            else:
+                out.save(tmp, "JPEG", quality=quality, optimize=optimize)
+        os.replace(tmp, output_path)
+        return True
+    except Exception as e:
+        # 不阻塞主流程，只记录
+        print(f"[WARN] 4:3 转换失败: {input_path} -> {e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+
+
+class StageStats:
+    """
+    流水线某一阶段的吞吐统计：件数、字节数、从第一件开始到最后一件结束的用时。线程安全。
+    提交第一件任务时要调用 start()，否则第一件的耗时不计入用时。
+    """
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.bytes = 0
+        self.t_first = None
+        self.t_last = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.t_first is None:
+                self.t_first = time.monotonic()
+
+    def add(self, nbytes=0):
+        with self._lock:
+            now = time.monotonic()
+            if self.t_first is None:
+                self.t_first = now
+            self.t_last = now
+            self.count += 1
+            self.bytes += nbytes
+
+    def summary(self):
+        secs = (self.t_last or 0) - (self.t_first or 0)
+        text = f"{self.name} {self.count} 张，{secs:.1f}s"
+        # 用时太短时速率没有意义（只有一件、或都来自缓存），不打印
+        fast = secs < 0.01
+        if not fast:
+            text += f"，{self.count / secs:.1f} 张/s"
+        if self.bytes:
+            text += f"，{fmt_size(self.bytes)}" + ("" if fast else f"（{fmt_size(self.bytes / secs)}/s）")
+        return text
+
+
+# ---- 指标：各阶段计时/计数/字节/错误分类，任务结束时打印汇总表，可导出 JSON Lines / Prometheus 文本 ----
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_export_lock = threading.Lock()
+
+
+def error_class(e):
+    """错误归类：HTTP 错误按状态码，其余用异常类名。"""
+    resp = getattr(e, "response", None)
+    if type(e).__name__ == "HTTPError" and resp is not None:
+        return f"HTTP{resp.status_code}"
+    return type(e).__name__
+
+
+class Timer:
+    """单个阶段的耗时分布：累计直方图（导出用）+ 最多 max_samples 个抽样（算分位数用）。"""
+    def __init__(self, max_samples=2000):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.samples = []
+        self.max_samples = max_samples
+
+    def observe(self, secs):
+        self.count += 1
+        self.sum += secs
+        self.max = max(self.max, secs)
+        for i, b in enumerate(LATENCY_BUCKETS):
+            if secs <= b:
+                self.buckets[i] += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append(secs)
+        else:
+            # 蓄水池抽样，样本保持均匀
+            j = random.randrange(self.count)
+            if j < self.max_samples:
+                self.samples[j] = secs
+
+    def quantile(self, q):
+        if not self.samples:
+            return 0.0
+        xs = sorted(self.samples)
+        return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.samples = (self.samples + other.samples)[:self.max_samples]
+
+
+class Metrics:
+    """
+    按阶段（stage）记录的指标，线程安全：
+    - time(stage) / observe(stage, secs)：耗时分布；块内抛异常时同时按 error_class 计入错误；
+    - inc(name, n, stage=…)：计数，如 bytes、items；
+    - error(stage, exc)：错误按类别计数。
+    table() 生成汇总表；write_jsonl() 追加一行一个序列；write_prometheus() 原子写出文本格式。
+    """
+    def __init__(self):
+        self.timers = {}            # stage -> Timer
+        self.counters = {}          # (name, stage, key) -> 数值
+        self.errors = {}            # (stage, 错误类别) -> 次数
+        self._lock = threading.Lock()
+
+    def observe(self, stage, secs):
+        with self._lock:
+            self.timers.setdefault(stage, Timer()).observe(secs)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        t0 = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.error(stage, e)
+            raise
+        finally:
+            self.observe(stage, time.monotonic() - t0)
+
+    def inc(self, name, n=1, stage="", key=""):
+        with self._lock:
+            k = (name, stage, key)
+            self.counters[k] = self.counters.get(k, 0) + n
+
+    def error(self, stage, exc):
+        cls = exc if isinstance(exc, str) else error_class(exc)
+        with self._lock:
+            self.errors[(stage, cls)] = self.errors.get((stage, cls), 0) + 1
+
+    def merge(self, other):
+        with other._lock:
+            timers = dict(other.timers)
+            counters = dict(other.counters)
+            errors = dict(other.errors)
+        with self._lock:
+            for stage, t in timers.items():
+                self.timers.setdefault(stage, Timer()).merge(t)
+            for k, v in counters.items():
+                self.counters[k] = self.counters.get(k, 0) + v
+            for k, v in errors.items():
+                self.errors[k] = self.errors.get(k, 0) + v
+
+    def table(self):
+        """汇总表（文本行）：每个阶段的次数、总耗时、p50/p95/最大、错误数，以及字节数。"""
+        with self._lock:
+            rows = [("阶段", "次数", "总耗时", "p50", "p95", "最大", "错误")]
+            for stage, t in self.timers.items():
+                errs = sum(v for (s, _), v in self.errors.items() if s == stage)
+                rows.append((stage, str(t.count), f"{t.sum:.2f}s", f"{t.quantile(0.5):.3f}s",
+                             f"{t.quantile(0.95):.3f}s", f"{t.max:.3f}s", str(errs)))
+            widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+            lines = ["  ".join(c.ljust(w) for c, w in zip(r, widths)) for r in rows]
+            for (name, stage, key), v in sorted(self.counters.items()):
+                label = "/".join(x for x in (stage, key) if x)
+                val = fmt_size(v) if name == "bytes" else str(v)
+                lines.append(f"{name}[{label}] = {val}")
+            for (stage, cls), v in sorted(self.errors.items()):
+                lines.append(f"errors[{stage}/{cls}] = {v}")
+        return lines
+
+    def series(self):
+        """所有序列的扁平列表（dict），导出用。"""
+        out = []
+        with self._lock:
+            for stage, t in self.timers.items():
+                out.append({"metric": "stage_seconds", "stage": stage, "count": t.count,
+                            "sum": round(t.sum, 6), "p50": round(t.quantile(0.5), 6),
+                            "p95": round(t.quantile(0.95), 6), "max": round(t.max, 6)})
+            for (name, stage, key), v in self.counters.items():
+                out.append({"metric": name, "stage": stage, "key": key, "value": v})
+            for (stage, cls), v in self.errors.items():
+                out.append({"metric": "errors", "stage": stage, "class": cls, "value": v})
+        return out
+
+    def write_jsonl(self, path, **extra):
+        ts = time.time()
+        with _export_lock, open(path, "a", encoding="utf-8") as f:
+            for row in self.series():
+                f.write(json.dumps(dict(extra, ts=ts, **row), ensure_ascii=False) + "\n")
+
+    def write_prometheus(self, path, prefix="webimagesaver"):
+        def esc(v):
+            return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+        with self._lock:
+            for stage, t in sorted(self.timers.items()):
+                lab = f'stage="{esc(stage)}"'
+                for b, n in zip(LATENCY_BUCKETS, t.buckets):
+                    lines.append(f'{prefix}_stage_seconds_bucket{{{lab},le="{b}"}} {n}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{{lab},le="+Inf"}} {t.count}')
+                lines.append(f"{prefix}_stage_seconds_sum{{{lab}}} {t.sum:.6f}")
+                lines.append(f"{prefix}_stage_seconds_count{{{lab}}} {t.count}")
+            names = sorted({k[0] for k in self.counters})
+            for name in names:
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                for (n, stage, key), v in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f'{prefix}_{name}_total{{stage="{esc(stage)}",key="{esc(key)}"}} {v}')
+            lines.append(f"# TYPE {prefix}_errors_total counter")
+            for (stage, cls), v in sorted(self.errors.items()):
+                lines.append(f'{prefix}_errors_total{{stage="{esc(stage)}",class="{esc(cls)}"}} {v}')
+        tmp = path + ".tmp"
+        with _export_lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp, path)
+
+
+_pad_pool = None
+_pad_pool_lock = threading.Lock()
+
+
+def _pad_executor(workers):
+    """
+    4:3 用的进程池一律用 spawn 起子进程：父进程里跑着 Playwright 和下载线程，
+    fork 会把别的线程持有的锁原样拷进子进程，子进程可能一启动就死锁。
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def shared_pad_pool(broken=None):
+    """
+    本进程内唯一的 4:3 进程池（cpu_count 个进程），-j、整站、asyncio 的各个任务共用，不再各起一套。
+    broken 是调用方发现已损坏（BrokenProcessPool）的池：还是当前这个时换一个新的。
+    """
+    global _pad_pool
+    with _pad_pool_lock:
+        if _pad_pool is None or _pad_pool is broken:
+            _pad_pool = _pad_executor(os.cpu_count() or 2)
+        return _pad_pool
+
+
+class PadStage:
+    """
+    4:3 补边阶段：convert_to_4_3 放到 ProcessPoolExecutor 里跑满多核，不再占用下载/截图线程。
+    不指定 workers 时用 shared_pad_pool()，close() 只等本阶段提交的任务；指定了就自建进程池，close() 时关掉。
+    在途任务数受 max_pending 限制（有界队列），满了 submit 会阻塞，对上游形成背压。
+    on_done(output_path, ok) 在结果回调线程里调用；convert_opts 原样传给 convert_to_4_3。
+    给了 metrics 时记录每张从提交到完成的耗时（阶段名 pad）。
+    """
+    def __init__(self, workers=None, max_pending=None, on_done=None, metrics=None, **convert_opts):
+        self.shared = not workers
+        self.convert_opts = convert_opts
+        self.ext = PAD_FORMATS[convert_opts.get("fmt", "PNG").upper()]
+        self.pool = shared_pad_pool() if self.shared else _pad_executor(workers)
+        self._slots = threading.BoundedSemaphore(max_pending or (workers or os.cpu_count() or 2) * 4)
+        self._pending = set()       # 已提交、回调还没跑完的任务
+        self._idle = threading.Condition()
+        self.on_done = on_done
+        self.stats = StageStats("4:3")
+        self.metrics = metrics
+        self.failed = 0
+
+    def output_for(self, path):
+        """同名换成输出格式的扩展名。"""
+        return path.rsplit(".", 1)[0] + self.ext
+
+    def submit(self, input_path, output_path):
+        self._slots.acquire()
+        self.stats.start()
+        t0 = time.monotonic()
+        try:
+            try:
+                fut = self.pool.submit(convert_to_4_3, input_path, output_path, **self.convert_opts)
+            except BrokenProcessPool:
+                if not self.shared:
+                    raise
+                # 共用的池里有进程异常退出过，换一个新池再提交
+                self.pool = shared_pad_pool(broken=self.pool)
+                fut = self.pool.submit(convert_to_4_3, input_path, output_path, **self.convert_opts)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._idle:
+            self._pending.add(fut)
+
+        def done(f):
+            try:
+                finish(f)
+            finally:
+                with self._idle:
+                    self._pending.discard(f)
+                    self._idle.notify_all()
+
+        def finish(f):
+            self._slots.release()
+            ok = not f.cancelled() and f.exception() is None and f.result()
+            if ok:
+                self.stats.add()
+            else:
+                # 结果回调在进程池的结果线程里跑，共用进程池时多个阶段的回调可能并发
+                with self._idle:
+                    self.failed += 1
+            if self.metrics is not None:
+                self.metrics.observe("pad", time.monotonic() - t0)
+                if not ok:
+                    exc = None if f.cancelled() else f.exception()
+                    self.metrics.error("pad", exc if exc is not None else "Failed")
+            if self.on_done:
+                self.on_done(output_path, ok)
+        fut.add_done_callback(done)
+        return fut
+
+    def close(self):
+        if not self.shared:
+            self.pool.shutdown(wait=True)
+            return
+        with self._idle:
+            self._idle.wait_for(lambda: not self._pending)
+
+
+ILLEGAL = r'[\\/:*?"<>|]'
+CLICK_MORE_TEXTS = [
+    "加载更多","更多","下一页","更多内容","查看更多","展开",
+    "Load more","More","Next","Show more","See more","View more","Continue"
+]
+
+def sanitize(text: str, max_len=30):
+    if not text: return ""
+    text = re.sub(r'\s+', ' ', text).strip()
+    text = re.sub(ILLEGAL, ' ', text)
+    return text[:max_len]
+
+def choose_name(heading, caption, alt, fallback):
+    for s in (heading, caption, alt, fallback):
+        s = sanitize(s)
+        if s: return s
+    return "image"
+
+def plan_name(i, it, used):
+    """第 i 张图的文件名（不含扩展名）：NNN-标题/说明/alt/原文件名，与 used 中已有名字冲突时追加 -2、-3…"""
+    heading = it.get("nearestHeading") or ""
+    caption = it.get("caption") or ""
+    alt = it.get("alt") or ""
+    fallback = os.path.splitext(os.path.basename(urlparse(it["url"]).path))[0]
+    base = f"{i:03d}-" + choose_name(heading, caption, alt, fallback)
+    name = base
+    k = 2
+    while name.lower() in used:
+        name = f"{base}-{k}"; k += 1
+    used.add(name.lower())
+    return name
+
+def url_dir_name(i, url):
+    """第 i 个网址的输出子目录：NNN-域名-路径（清理掉非法字符）。"""
+    u = urlparse(url)
+    slug = sanitize((u.netloc + u.path).replace("/", "-").strip("-"), max_len=60).replace(" ", "_")
+    return f"{i:03d}-{slug or 'page'}"
+
+def ext_from_url(u: str):
+    path = urlparse(u).path.lower()
+    for ext in (".png",".jpg",".jpeg",".webp",".gif",".bmp",".svg"):
+        if path.endswith(ext): return ".png" if ext==".svg" else ext
+    return ".jpg"
+
+# 有多个候选地址（srcset / <picture> / 懒加载属性）时选哪一个：
+#   largest —— 宽度最大的（没有宽度信息时优先懒加载属性里的原图）；
+#   closest —— 宽度最接近 src_target 像素的；
+#   smallest —— 宽度最小的（拿宽度近似字节数，不额外发请求）；
+#   current —— 浏览器当前显示的那个（旧行为）。
+SRC_POLICIES = ("largest", "closest", "smallest", "current")
+
+
+def pick_candidate(it, policy="largest", target=0):
+    """按策略从 it["candidates"] 里选下载地址；没有候选时就是 it["url"]。"""
+    cands = [c for c in it.get("candidates") or () if c.get("url")]
+    if not cands or policy == "current":
+        return it["url"]
+    sized = candidate_widths(cands)
+    dense = [c for c in cands if c.get("x")]
+    lazy = [c for c in cands if not c.get("w") and not c.get("x") and c.get("from", "").startswith("data-")]
+    if policy == "closest" and target and sized:
+        return min(sized, key=lambda cw: abs(cw[1] - target))[0]["url"]
+    if policy == "smallest":
+        if sized:
+            return min(sized, key=lambda cw: cw[1])[0]["url"]
+        if dense:
+            return min(dense, key=lambda c: c["x"])["url"]
+        return it["url"]
+    if sized:
+        return max(sized, key=lambda cw: cw[1])[0]["url"]
+    if lazy:
+        return lazy[0]["url"]
+    if dense:
+        return max(dense, key=lambda c: c["x"])["url"]
+    return it["url"]
+
+
+def candidate_widths(cands):
+    """
+    返回 [(候选, 像素宽度)]，只含能算出宽度的候选。w 描述符直接用；
+    x 描述符按 1x 宽度换算——1x 宽度取当前显示那张的 nw（浏览器的 naturalWidth，已按密度折算），
+    没有 nw 时 x 候选算不出宽度，由调用方单独按 x 排。旧清单里 current 的 w 就是 naturalWidth，按 nw 处理。
+    """
+    cur = next((c for c in cands if c.get("from") == "current"), None)
+    base = 0
+    if cur is not None:
+        base = cur["nw"] if "nw" in cur else cur.get("w", 0)
+    out = []
+    for c in cands:
+        legacy = c is cur and "nw" not in c
+        if c.get("w") and not legacy:
+            out.append((c, c["w"]))
+        elif c.get("x") and base:
+            out.append((c, c["x"] * base))
+        elif c is cur and base:
+            out.append((c, base))   # 没有描述符的 src，按 1x
+    return out
+
+def fetch_bytes(url, headers=None, session=None):
+    import requests
+    r = (session or requests).get(url, headers=headers or {}, timeout=20)
+    r.raise_for_status()
+    return r.content
+
+
+class DownloadTooLarge(Exception):
+    """超过单图大小上限（Content-Length 或实际读取字节数）。"""
+
+
+def fmt_size(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def fetch_to_file(url, path, headers=None, session=None, max_bytes=None, chunk_size=256 * 1024, cache=None):
+    """
+    流式下载到 path：分块写入同目录的 .part 临时文件，完成后原子 rename。
+    max_bytes 为单图上限（None/0 表示不限），先看 Content-Length，再按实际读取字节数兜底。
+    cache 为 DownloadCache 时发条件请求：304 直接从缓存链接/复制到 path，不再传输内容。
+    返回 (字节数, 耗时秒, 来源 "net" | "cache", sha256)。
+    """
+    import requests
+    t0 = time.monotonic()
+    req_headers = dict(headers or {})
+    if cache is not None:
+        req_headers.update(cache.conditional_headers(url))
+    tmp = path + ".part"
+    with (session or requests).get(url, headers=req_headers, timeout=20, stream=True) as r:
+        if r.status_code == 304 and cache is not None:
+            hit = cache.materialize(url, path)
+            if hit is not None:
+                return hit[0], time.monotonic() - t0, "cache", hit[1]
+            # 缓存里的 blob 丢了：cache 已忘掉该 URL，不带条件头重下一次
+            return fetch_to_file(url, path, headers, session, max_bytes, chunk_size, cache)
+        r.raise_for_status()
+        if max_bytes:
+            length = r.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise DownloadTooLarge(f"Content-Length {fmt_size(int(length))} 超过上限 {fmt_size(max_bytes)}")
+        n = 0
+        digest = hashlib.sha256()
+        try:
+            with open(tmp, "wb") as fp:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    if not chunk:
+                        continue
+                    n += len(chunk)
+                    if max_bytes and n > max_bytes:
+                        raise DownloadTooLarge(f"已读取 {fmt_size(n)}，超过上限 {fmt_size(max_bytes)}")
+                    digest.update(chunk)
+                    fp.write(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+    if cache is not None:
+        cache.store(url, path, digest.hexdigest(), n, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+    return n, time.monotonic() - t0, "net", digest.hexdigest()
+
+
+# ---- 下载缓存：按内容哈希存 blob，按 URL 记录 ETag/Last-Modified 做条件请求 ----
+CACHE_DIR = RUNTIME_DIR / "cache"
+
+
+class DownloadCache:
+    """
+    目录结构：blobs/<sha256 前两位>/<sha256> + index.json。
+    index 记录 URL -> {etag, last_modified, sha256, size}，以及每个 blob 的大小和最近使用时间；
+    总大小超过 max_bytes 时按最近使用时间（LRU）淘汰 blob。
+    输出文件优先硬链接到 blob，跨盘等失败时退回复制。线程安全。
+    save() 整体替换 index.json，同一目录只能有一个实例，否则后写的覆盖先写的、
+    没登记的 blob 永远不会被淘汰——进程内请用 shared_cache() 取共用的那个。
+    """
+    def __init__(self, root=CACHE_DIR, max_bytes=1024 * 1024 * 1024):
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.index_path = self.root / "index.json"
+        self._lock = threading.Lock()
+        self.urls, self.blobs = {}, {}
+        self.hits = self.misses = self.revalidated = 0
+        try:
+            data = json.loads(self.index_path.read_text(encoding="utf-8"))
+            self.urls, self.blobs = data.get("urls", {}), data.get("blobs", {})
+        except Exception:
+            pass
+
+    def _blob_path(self, sha):
+        return self.root / "blobs" / sha[:2] / sha
+
+    def _link(self, src, dest):
+        tmp = f"{dest}.link"
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+
+    def conditional_headers(self, url):
+        with self._lock:
+            e = self.urls.get(url)
+            if not e or e["sha256"] not in self.blobs:
+                return {}
+            h = {}
+            if e.get("etag"):
+                h["If-None-Match"] = e["etag"]
+            if e.get("last_modified"):
+                h["If-Modified-Since"] = e["last_modified"]
+            return h
+
+    def materialize(self, url, dest):
+        """304 时把缓存内容放到 dest，返回 (字节数, sha256)；blob 缺失或大小不符时忘掉该 URL 并返回 None。"""
+        with self._lock:
+            e = self.urls.get(url)
+            sha = e and e["sha256"]
+            blob = self._blob_path(sha) if sha else None
+            try:
+                if blob is None or blob.stat().st_size != e["size"]:
+                    raise OSError("blob missing")
+                self._link(blob, dest)
+            except OSError:
+                self.urls.pop(url, None)
+                if sha:
+                    self.blobs.pop(sha, None)
+                return None
+            self.blobs[sha]["used"] = time.time()
+            self.hits += 1
+            self.revalidated += 1
+            return e["size"], sha
+
+    def store(self, url, path, sha, size, etag=None, last_modified=None):
+        """登记刚下载到 path 的内容；内容已存在（同哈希）时 path 改为指向已有 blob。"""
+        with self._lock:
+            blob = self._blob_path(sha)
+            try:
+                if sha in self.blobs and blob.exists():
+                    self._link(blob, path)
+                    self.hits += 1
+                else:
+                    blob.parent.mkdir(parents=True, exist_ok=True)
+                    self._link(path, blob)
+                    self.misses += 1
+            except OSError:
+                return
+            self.blobs[sha] = {"size": size, "used": time.time()}
+            self.urls[url] = {"etag": etag, "last_modified": last_modified, "sha256": sha, "size": size}
+            self._evict(keep=sha)
+
+    def total_bytes(self):
+        return sum(b["size"] for b in self.blobs.values())
+
+    def _evict(self, keep=None):
+        total = self.total_bytes()
+        if not self.max_bytes or total <= self.max_bytes:
+            return
+        dropped = set()
+        for sha, b in sorted(self.blobs.items(), key=lambda kv: kv[1]["used"]):
+            if total <= self.max_bytes:
+                break
+            if sha == keep:
+                continue
+            try:
+                os.remove(self._blob_path(sha))
+            except OSError:
+                pass
+            total -= b["size"]
+            dropped.add(sha)
+        for sha in dropped:
+            self.blobs.pop(sha, None)
+        self.urls = {u: e for u, e in self.urls.items() if e["sha256"] not in dropped}
+
+    def save(self):
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"urls": self.urls, "blobs": self.blobs}), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+
+    def summary(self):
+        return (f"命中 {self.hits}（304 {self.revalidated} / 相同内容 {self.hits - self.revalidated}），"
+                f"未命中 {self.misses}，缓存占用 {fmt_size(self.total_bytes())}")
+
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def shared_cache(max_bytes=1024 * 1024 * 1024, root=CACHE_DIR):
+    """本进程内 root 目录对应的唯一 DownloadCache（-j、整站、asyncio 的各个任务共用）；max_bytes 以最后一次为准。"""
+    key = str(pathlib.Path(root).resolve())
+    with _shared_caches_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = _shared_caches[key] = DownloadCache(root, max_bytes)
+        cache.max_bytes = max_bytes
+        return cache
+
+
+# ---- 抓包：复用浏览器已经下载过的图片 ----
+class ResponseBuffer:
+    """
+    挂在 page.on("response") 上，把图片响应体按 URL（去掉 #）存下来，下载阶段优先从这里写盘，
+    省掉重复下载，也能拿到需要 cookie / Referer 的图片。
+    内存里最多放 max_mem 字节，超出的写到临时目录；磁盘也超过 max_disk 后新响应直接丢弃（回退 HTTP）。线程安全。
+    """
+    def __init__(self, max_mem=128 * 1024 * 1024, max_disk=2 * 1024 * 1024 * 1024):
+        self.max_mem = max_mem
+        self.max_disk = max_disk
+        self.mem_used = self.disk_used = 0
+        self.hits = self.misses = self.dropped = 0
+        self._mem = {}
+        self._disk = {}
+        self._writing = set()       # 正在落盘的 key：写完并 rename 后才登记进 _disk
+        self._seq = 0
+        self._dir = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url):
+        return url.split("#")[0]
+
+    def attach(self, page):
+        page.on("response", self._on_response)
+
+    def attach_async(self, page):
+        """async Page 版本：回调是协程，body() 要 await；put 可能落盘，放到线程里做。"""
+        page.on("response", self._on_response_async)
+
+    def _on_response(self, resp):
+        try:
+            if resp.request.resource_type != "image" or resp.status != 200:
+                return
+            self.put(resp.url, resp.body())
+        except Exception:
+            # 跳转、被取消、已被浏览器回收的响应拿不到 body，下载阶段回退 HTTP 即可
+            pass
+
+    async def _on_response_async(self, resp):
+        import asyncio
+        try:
+            if resp.request.resource_type != "image" or resp.status != 200:
+                return
+            await asyncio.to_thread(self.put, resp.url, await resp.body())
+        except Exception:
+            pass
+
+    def put(self, url, body):
+        """
+        存一份响应体。溢出到磁盘时先写临时文件、fsync、rename，完整落盘后才在锁内登记，
+        并发的 write_to 不会读到写了一半的文件（期间算未命中，回退 HTTP）。
+        """
+        key, n = self._key(url), len(body)
+        with self._lock:
+            if key in self._mem or key in self._disk or key in self._writing:
+                return
+            if self.mem_used + n <= self.max_mem:
+                self._mem[key] = body
+                self.mem_used += n
+                return
+            if self.disk_used + n > self.max_disk:
+                self.dropped += 1
+                return
+            if self._dir is None:
+                self._dir = tempfile.mkdtemp(prefix="wis-net-")
+            spill_dir = self._dir
+            self._seq += 1
+            path = os.path.join(spill_dir, f"{self._seq:06d}")
+            self._writing.add(key)
+            self.disk_used += n     # 先占额度，避免并发写入一起超过 max_disk
+        ok = False
+        try:
+            tmp = path + ".part"
+            with open(tmp, "wb") as fp:
+                fp.write(body)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp, path)
+            ok = True
+        except OSError:
+            pass
+        with self._lock:
+            self._writing.discard(key)
+            if ok and self._dir == spill_dir:
+                self._disk[key] = (path, n)
+                return
+            self.disk_used -= n
+            if ok:
+                # 写盘期间已经 close()，临时目录已删或换了新的
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def write_to(self, url, dest, max_bytes=None):
+        """命中时把响应体原子写到 dest，返回 (字节数, sha256)；未命中返回 None。"""
+        key = self._key(url)
+        with self._lock:
+            body = self._mem.get(key)
+            spilled = self._disk.get(key)
+            if body is None and spilled is None:
+                self.misses += 1
+                return None
+            n = len(body) if body is not None else spilled[1]
+            if not (max_bytes and n > max_bytes):
+                self.hits += 1      # 超过上限的不算命中，也没有回退 HTTP
+        if max_bytes and n > max_bytes:
+            raise DownloadTooLarge(f"已读取 {fmt_size(n)}，超过上限 {fmt_size(max_bytes)}")
+        tmp = dest + ".part"
+        if body is not None:
+            with open(tmp, "wb") as fp:
+                fp.write(body)
+            sha = hashlib.sha256(body).hexdigest()
+        else:
+            digest = hashlib.sha256()
+            with open(spilled[0], "rb") as src, open(tmp, "wb") as fp:
+                for chunk in iter(lambda: src.read(256 * 1024), b""):
+                    digest.update(chunk)
+                    fp.write(chunk)
+            sha = digest.hexdigest()
+        os.replace(tmp, dest)
+        return n, sha
+
+    def summary(self):
+        with self._lock:
+            return (f"抓包命中 {self.hits}，回退 HTTP {self.misses}，"
+                    f"缓冲 {len(self._mem) + len(self._disk)} 张（内存 {fmt_size(self.mem_used)} / 磁盘 {fmt_size(self.disk_used)}）"
+                    + (f"，超限丢弃 {self.dropped}" if self.dropped else ""))
+
+    def close(self):
+        with self._lock:
+            self._mem.clear()
+            self._disk.clear()
+            if self._dir is not None:
+                shutil.rmtree(self._dir, ignore_errors=True)
+                self._dir = None
+
+
+# ---- 请求拦截：滚动时挡掉与图片无关的重资源 ----
+# 常见统计/广告域名（按后缀匹配）
+TRACKER_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "adservice.google.com", "facebook.net", "connect.facebook.net", "hotjar.com", "segment.io",
+    "mixpanel.com", "scorecardresearch.com", "criteo.com", "taboola.com", "outbrain.com",
+    "hm.baidu.com", "cnzz.com", "growingio.com",
+)
+# 被挡掉的请求按类型粗估的体积（拦截时拿不到真实大小，仅用于日志里的“约省”）
+_BLOCKED_SIZE_GUESS = {"media": 2 * 1024 * 1024, "font": 60 * 1024, "script": 40 * 1024,
+                       "stylesheet": 20 * 1024, "xhr": 5 * 1024, "fetch": 5 * 1024}
+
+
+class RoutePolicy:
+    """
+    page.route 拦截策略：block_types 里的资源类型（如 media/font）和 block_domains 里的域名一律 abort，
+    allow_domains 命中的域名始终放行（优先级最高）。统计挡掉的请求数和按类型估算的体积。
+    注意：挂了 route 的页面会绕过浏览器 HTTP 缓存。
+    """
+    def __init__(self, block_types=("media", "font"), block_domains=TRACKER_DOMAINS, allow_domains=()):
+        self.block_types = set(block_types)
+        self.block_domains = tuple(d.lower().lstrip(".") for d in block_domains)
+        self.allow_domains = tuple(d.lower().lstrip(".") for d in allow_domains)
+        self.blocked = {}
+        self.passed = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _match(host, domains):
+        return any(host == d or host.endswith("." + d) for d in domains)
+
+    def should_block(self, url, resource_type):
+        host = (urlparse(url).hostname or "").lower()
+        if self._match(host, self.allow_domains):
+            return False
+        return resource_type in self.block_types or self._match(host, self.block_domains)
+
+    def attach(self, page):
+        page.route("**/*", self._handle)
+
+    async def attach_async(self, page):
+        """async Page 版本。"""
+        await page.route("**/*", self._handle_async)
+
+    def _count(self, req):
+        """判定并计数，返回是否拦截。"""
+        block = self.should_block(req.url, req.resource_type)
+        with self._lock:
+            if block:
+                self.blocked[req.resource_type] = self.blocked.get(req.resource_type, 0) + 1
+            else:
+                self.passed += 1
+        return block
+
+    def _handle(self, route):
+        if self._count(route.request):
+            route.abort("blockedbyclient")
+        else:
+            route.continue_()
+
+    async def _handle_async(self, route):
+        if self._count(route.request):
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    def summary(self):
+        total = sum(self.blocked.values())
+        saved = sum(_BLOCKED_SIZE_GUESS.get(t, 10 * 1024) * n for t, n in self.blocked.items())
+        detail = "，".join(f"{t} {n}" for t, n in sorted(self.blocked.items(), key=lambda kv: -kv[1]))
+        return f"拦截 {total} 个请求（{detail or '无'}），约省 {fmt_size(saved)}，放行 {self.passed}"
+
+
+# ---- 并发下载：全局有界线程池 + 按 host 复用 Session 连接池 ----
+class HostSessions:
+    """每个 host 一个 requests.Session（keep-alive 复用），并用信号量限制单域名并发。"""
+    def __init__(self, per_host=4):
+        self.per_host = max(1, int(per_host))
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._slots = {}
+
+    def get(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            s = self._sessions.get(host)
+            if s is None:
+                import requests
+                s = requests.Session()
+                # 连接池大小与单域名并发一致，避免 urllib3 丢弃多余连接
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.per_host)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                self._sessions[host] = s
+                self._slots[host] = threading.BoundedSemaphore(self.per_host)
+            return s, self._slots[host]
+
+    def close(self):
+        with self._lock:
+            for s in self._sessions.values():
+                try:
+                    s.close()
+                except Exception:
+                    pass
+            self._sessions.clear()
+            self._slots.clear()
+
+
+class Downloader:
+    """
+    下载阶段：workers 为全局并发上限，per_host 为单域名并发上限。
+    fn(session, *args) 在工作线程中执行；stop_flag 置位后尚未开始的任务直接跳过。
+    """
+    def __init__(self, workers=8, per_host=4, stop_flag=None):
+        self.sessions = HostSessions(per_host)
+        self.stop_flag = stop_flag
+        self.pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="dl")
+
+    def submit(self, url, fn, *args):
+        def task():
+            if self.stop_flag is not None and self.stop_flag.is_set():
+                return None
+            session, slot = self.sessions.get(url)
+            with slot:
+                return fn(session, *args)
+        return self.pool.submit(task)
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.sessions.close()
+
+
+class FetchStage:
+    """
+    流水线里的下载阶段：采集 → 下载 → 4:3。滚动每轮采到的新图片马上 feed 进来，
+    选地址、去重后提交给 Downloader，不必等整页滚完；下载完成的图再交给 pad（PadStage，自带在途上限）。
+    在途下载数不超过 depth（有界队列）：满了 feed 会等，等待时调用 pump()（同步 Playwright 里是
+    page.wait_for_timeout，让页面事件继续处理），对滚动形成背压，内存不会随页面长度无限增长。
+    同一条目只会提交一次（seen）；尺寸变体只在同一批（加上磁盘上已有的图）里挑，跨批的由下载后的 dHash 去重兜底。
+    尺寸变体和同一地址的条目先挂在保留的那张上（DedupIndex.defer），它下载成功后才记 dup_of；
+    失败时同地址的跟着记失败（续传会重试），尺寸变体里挑最大的补下。
+    续传时清单里已下载、文件还在的图先登记进去重索引（seed），与它们重复的新图不再下载。
+    """
+    def __init__(self, job, man, cache=None, netbuf=None, pad=None, depth=64):
+        opts = job.opts
+        self.job, self.man, self.out_dir = job, man, job.out_dir
+        self.cache, self.netbuf, self.pad = cache, netbuf, pad
+        self.max_bytes = opts.max_mb * 1024 * 1024 or None
+        # 整站抓取时各页面共用 job.dedup；否则本阶段自己建一个
+        self.dedup = (job.dedup or DedupIndex(opts.dedup_distance)) if opts.dedup else None
+        self.stats = StageStats("下载")
+        self.futures = []
+        self.seen = set()           # 已经交给本阶段的条目（id），process_items 不再重复处理
+        self.downloader = None
+        self._slots = threading.BoundedSemaphore(max(1, int(depth)))
+        self._on_disk = {}          # variant_key -> [磁盘上已有的条目]，参与尺寸变体比较
+        if self.dedup is not None:
+            self._seed()
+
+    def _seed(self):
+        owner = (self.man, self.out_dir)
+        n = 0
+        for it in self.man.items:
+            if it.get("dup_of") or not it.get("path"):
+                continue
+            path = os.path.join(self.out_dir, it["path"])
+            if not os.path.exists(path):
+                continue
+            self.dedup.seed(it, path, owner)
+            self._on_disk.setdefault(variant_key(it.get("src") or it["url"]), []).append(it)
+            n += 1
+        if n:
+            self.job.log_put(f"[DEDUP] 已登记磁盘上的 {n} 张图，与它们重复的新图不再下载")
+
+    def feed(self, items, pump=None, bounded=True):
+        """
+        提交 items 里还需要下载的条目，返回实际提交的数量。
+        bounded=False 时不受 depth 限制（条目已全部在内存里，只是不想挡住后面的截图）。
+        """
+        opts, man, out_dir = self.job.opts, self.man, self.out_dir
+        todo = []
+        for it in items:
+            if id(it) in self.seen or not man.needs(it, out_dir)[0]:
+                continue
+            self.seen.add(id(it))
+            # 下载线程可能正在把清单写盘，加字段要在清单锁里做
+            man.set(it, status="pending", src=pick_candidate(it, opts.src_policy, opts.src_target))
+            todo.append(it)
+        owner = (man, out_dir)
+        if todo and self.dedup is not None:
+            # 同一下载地址（忽略 #片段；本页、磁盘上已有的或共用索引里的其他页面）只下载一次
+            todo = [it for it in todo if self._route(it, owner)]
+            # 同一张图的多个尺寸只下载最大的那个（磁盘上已有的也参与比较），其余等它下载成功再记 dup_of
+            on_disk = {id(d): d for it in todo for d in self._on_disk.get(variant_key(it["src"]), ())}
+            pairs = [(dup, keep) for dup, keep in pick_variants(todo + list(on_disk.values()))
+                     if id(dup) not in on_disk]
+            if pairs:
+                self.job.log_put(f"[DEDUP] {len(pairs)} 张是同一图片的其他尺寸，只下载最大的")
+            skip = {id(dup) for dup, keep in pairs if not self._park(dup, owner, keep)}
+            todo = [it for it in todo if id(it) not in skip]
+        for it in todo:
+            self._submit(it, owner, pump if bounded else None, bounded)
+        return len(todo)
+
+    def _route(self, it, owner):
+        """登记 it 的下载地址。返回 True 表示要自己下载；False 表示已挂到同地址的条目上或已记为重复。"""
+        prev = self.dedup.claim(it["src"], it, owner)
+        return prev is None or self._park(it, owner, prev[0])
+
+    def _park(self, it, owner, keep):
+        """把 it 挂到 keep 上等结果；keep 已有结果时立即处理。返回 True 表示 it 还得自己下载。"""
+        res = self.dedup.defer(it, owner, keep)
+        if res is None:
+            return False
+        ok, holder, holder_owner = res
+        if not ok:
+            return True             # 那张已经下载失败，自己再试一次
+        self._resolved(it, owner, keep, holder, holder_owner)
+        return False
+
+    def _resolved(self, it, owner, keep, holder, holder_owner):
+        """挂在 keep 上的 it 确定不用下载：记成 holder 的重复、计数，再处理挂在 it 上的条目。"""
+        self.job._mark_dup(it, owner, holder, holder_owner)
+        self.dedup.count_skip(it, keep, holder)
+        self._settled(it, owner, True, holder, holder_owner)
+
+    def _submit(self, it, owner, pump=None, bounded=False):
+        if self.downloader is None:
+            opts = self.job.opts
+            self.downloader = Downloader(opts.workers, opts.per_host, self.job.stop_flag)
+            self.job.log_put(f"[INFO] 并发下载：{opts.workers} 线程，单域名 {opts.per_host}")
+        self.stats.start()
+        if bounded:
+            self._acquire(pump)
+        fut = self.downloader.submit(it["src"], self._fetch, it, owner)
+        if bounded:
+            fut.add_done_callback(lambda f: self._slots.release())
+        self.futures.append(fut)
+
+    def _fetch(self, session, it, owner):
+        """在下载线程中执行：下载 it，再处理挂在它上面的条目。"""
+        man, out_dir = owner
+        src = it["src"]
+        ok = self.job.download_item(session, man, it, out_dir, self.pad, self.max_bytes, self.cache, self.stats,
+                                    self.netbuf, self.dedup)
+        if self.dedup is not None:
+            self._settled(it, owner, ok, src=src)
+        if man is not self.man:
+            man.flush()
+        return ok
+
+    def _settled(self, it, owner, ok, holder=None, holder_owner=None, src=None):
+        """
+        it 有结果了（下载完，或被记为 holder 的重复）。成功时等它的条目都记成 holder 的重复；
+        失败时同一地址的跟着记失败，其余尺寸变体里挑最大的重新提交，剩下的改挂到它上面。
+        """
+        if holder is None:
+            holder, holder_owner = it, owner
+        waiters = self.dedup.settle(it, ok, holder, holder_owner)
+        if ok:
+            for w, w_owner in waiters:
+                self._resolved(w, w_owner, it, holder, holder_owner)
+            return
+        src = url_key(src or it["src"])
+        variants = []
+        for w, w_owner in waiters:
+            if url_key(w["src"]) != src:
+                variants.append((w, w_owner))
+                continue
+            w_man, w_dir = w_owner
+            w_man.mark(w, False, w_dir, error=f"与 {it['name']} 同一地址，下载失败")
+            if w_man is not self.man:
+                w_man.flush()
+            self._settled(w, w_owner, False)
+        if not variants:
+            return
+        best, best_owner = max(variants, key=lambda p: variant_width(p[0]["src"]))
+        self.job.log_put(f"[DEDUP] {it['name']} 下载失败，改下同一图片的其他尺寸 {best['name']}")
+        for w, w_owner in variants:
+            if w is not best:
+                self.dedup.defer(w, w_owner, best)
+        if self._route(best, best_owner):
+            self._submit(best, best_owner)
+
+    def _acquire(self, pump):
+        if self._slots.acquire(blocking=False):
+            return
+        t0 = time.monotonic()
+        if pump is None:
+            self._slots.acquire()
+        else:
+            while not self._slots.acquire(blocking=False):
+                pump()
+        self.job.metrics.observe("backpressure", time.monotonic() - t0)
+
+    def finished(self):
+        return sum(1 for f in self.futures if f.done())
+
+    def wait(self, tick=None):
+        """等全部下载结束；stop_flag 置位后不再等。tick() 每结束一张调用一次。"""
+        for f in self.futures:
+            if self.job.stop_flag.is_set(): break
+            try:
+                f.result()
+            except Exception:
+                pass
+            if tick is not None:
+                tick()
+
+    def close(self):
+        if self.downloader is not None:
+            self.downloader.close()
+
+# ---- 任务清单：记录每张图的处理状态，支持断点续传 ----
+MANIFEST_NAME = "images_manifest.json"
+
+
+class Manifest:
+    """
+    images_manifest.json 格式：{"version": 2, "url", "mode", "complete", "items": [...]}。
+    complete 表示滚动采集阶段已跑完；每个 item 在采集字段之外记录
+    name、status（pending/done/failed）、path、bytes、sha256、cap_path（路径相对输出目录），
+    被判为重复的图记 dup_of（保留下来的那张的 name），不再单独存文件。
+    <img> 的 candidates 是采集到的全部候选地址（带 w/x 描述符，当前显示的那个另记 nw），src 是实际下载用的那个。
+    旧版清单（纯列表）按“采集已完成、全部待处理”读入。可在下载线程里更新，写盘节流并原子替换。
+    """
+    def __init__(self, path, url="", mode="download"):
+        self.path = path
+        self.url = url
+        self.mode = mode
+        self.complete = False
+        self.items = []
+        self.links = []             # 整站抓取时页面上的链接，续传时不开浏览器也能继续扩展
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        m = cls(path)
+        if isinstance(data, list):
+            m.items, m.complete = data, True
+        else:
+            m.url = data.get("url", "")
+            m.mode = data.get("mode", "download")
+            m.complete = bool(data.get("complete"))
+            m.items = data.get("items", [])
+            m.links = data.get("links", [])
+        used = {it["name"].lower() for it in m.items if it.get("name")}
+        for i, it in enumerate(m.items, start=1):
+            it.setdefault("status", "pending")
+            if not it.get("name"):
+                it["name"] = plan_name(i, it, used)
+        return m
+
+    def merge(self, items):
+        """按 url 追加新采集到的图片并起名；已有条目保留名字和状态。返回新增的清单条目列表。"""
+        with self._lock:
+            known = {it["url"] for it in self.items}
+            used = {it["name"].lower() for it in self.items}
+            added = []
+            for it in items:
+                if it["url"] in known:
+                    continue
+                known.add(it["url"])
+                it = dict(it, status="pending")
+                it["name"] = plan_name(len(self.items) + 1, it, used)
+                self.items.append(it)
+                added.append(it)
+            return added
+
+    def needs(self, it, out_dir):
+        """返回 (是否还要下载, 是否还要截图)：按当前 mode，且对应文件不存在时才需要；重复图（dup_of）不再下载。"""
+        def missing(key):
+            return not (it.get(key) and os.path.exists(os.path.join(out_dir, it[key])))
+        return (self.mode in ("download", "both") and missing("path") and not it.get("dup_of"),
+                self.mode in ("screenshot", "both") and missing("cap_path"))
+
+    def set(self, it, **fields):
+        """直接改条目字段（不判定状态）；与写盘互斥。"""
+        with self._lock:
+            it.update(fields)
+
+    def mark(self, it, ok, out_dir, **fields):
+        """记录某一步（下载/截图）的结果；该 mode 需要的文件都齐了才算 done。"""
+        with self._lock:
+            it.update(fields)
+            if not ok:
+                it["status"] = "failed"
+            elif not any(self.needs(it, out_dir)):
+                it["status"] = "done"
+        self.flush(force=False)
+
+    def count(self, status):
+        return sum(1 for it in self.items if it.get("status") == status)
+
+    def flush(self, force=True):
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_flush < 1.0:
+                return
+            self._last_flush = now
+            data = {"version": 2, "url": self.url, "mode": self.mode,
+                    "complete": self.complete, "items": self.items}
+            if self.links:
+                data["links"] = self.links
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+
+
+# ---- 去重：下载前按 URL 尺寸变体挑一张，下载后按内容（sha256 + dHash）合并 ----
+# 常见 CDN/图床里只表示尺寸、质量、格式的查询参数；去掉它们后 URL 相同就视为同一张图的不同变体
+SIZE_PARAMS = frozenset(("w", "width", "h", "height", "size", "resize", "fit", "crop",
+                         "q", "quality", "dpr", "format", "fm", "auto", "imwidth", "imheight"))
+_WP_SIZE = re.compile(r"-(\d{2,5})x(\d{2,5})(?=\.\w+$)")    # WordPress 缩略图：name-300x200.jpg
+
+
+def variant_key(url):
+    u = urlparse(url)
+    q = [(k, v) for k, v in parse_qsl(u.query, keep_blank_values=True) if k.lower() not in SIZE_PARAMS]
+    return (u.netloc.lower(), _WP_SIZE.sub("", u.path), urlencode(sorted(q)))
+
+
+def variant_width(url):
+    """URL 上能看出的宽度；完全没有尺寸参数的当作原图排最前，只有看不出宽度的尺寸参数记 0。"""
+    u = urlparse(url)
+    qs = {k.lower(): v for k, v in parse_qsl(u.query)}
+    for k in ("w", "width", "imwidth"):
+        if qs.get(k, "").isdigit():
+            return int(qs[k])
+    m = _WP_SIZE.search(u.path)
+    if m:
+        return int(m.group(1))
+    return 0 if SIZE_PARAMS & qs.keys() else float("inf")
+
+
+def url_key(url):
+    """同一资源的地址：去掉 #片段。"""
+    return url.split("#")[0]
+
+
+def pick_variants(items):
+    """
+    同一张图的多个尺寸变体只保留宽度最大的一个（看选中的下载地址 src）；返回 [(不用下载的, 保留的)]。
+    只差 #片段 的地址是同一资源，不算尺寸变体：每个地址只取第一个条目参与，其余交给 DedupIndex.claim。
+    """
+    groups, seen = {}, set()
+    for it in items:
+        src = it.get("src") or it["url"]
+        if url_key(src) in seen:
+            continue
+        seen.add(url_key(src))
+        groups.setdefault(variant_key(src), []).append(it)
+    pairs = []
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        best = max(group, key=lambda it: variant_width(it.get("src") or it["url"]))
+        pairs.extend((it, best) for it in group if it is not best)
+    return pairs
+
+
+def dhash(path, size=8):
+    """差值感知哈希：灰度缩到 (size+1)×size，比较相邻像素。返回 (hash, 宽, 高)；不是位图时抛异常。"""
+    from PIL import Image
+    with Image.open(path) as im:
+        w, h = im.size
+        im.draft("L", ((size + 1) * 4, size * 4))     # JPEG 直接按缩小比例解码
+        small = im.convert("L").resize((size + 1, size), Image.BILINEAR)
+    px = list(small.getdata())
+    bits = 0
+    for y in range(size):
+        row = px[y * (size + 1):(y + 1) * (size + 1)]
+        for x in range(size):
+            bits = (bits << 1) | (row[x] > row[x + 1])
+    return bits, w, h
+
+
+class DedupIndex:
+    """
+    下载结果的内存索引：sha256 完全相同，或 dHash 汉明距离不超过 distance 的图视为重复，保留分辨率最大的一张。
+    太小（边长 < min_side）或纯色（哈希为 0）的图只做完全相同判断，避免图标、占位图互相误判。
+    add() 在下载线程里调用；被淘汰的文件先记在 discard，等 4:3 阶段结束后再由调用方删除。
+    owner 是调用方的不透明标记（整站抓取时是条目所属的 (清单, 目录)），原样随结果返回，
+    这样一个索引可以跨多个页面共用。
+    下载前判定的重复（尺寸变体、同一地址）不能马上记 dup_of：保留的那张可能下载失败。
+    这些条目用 defer() 挂在保留的那张上，等它 settle() 出结果后再由调用方处理，真正省掉时用 count_skip() 计数。
+    续传时磁盘上已有的图用 seed() 登记，新图与它们同地址、同内容的不再重复保存。
+    """
+    def __init__(self, distance=4, min_side=32):
+        self.distance = distance
+        self.min_side = min_side
+        self.by_sha = {}
+        self.by_url = {}            # 下载地址 -> (条目, owner)，跨页面时同一地址只下载一次
+        self.entries = []           # [{"hash", "pixels", "item", "owner", "path", "members"}]
+        self.discard = []
+        self.waiting = {}           # id(保留的条目) -> (条目, [(等它的条目, owner)])
+        self.settled = {}           # id(保留的条目) -> (条目, 成功?, 持有文件的条目, 其 owner)
+        self.exact = self.similar = self.same_url = self.variants = self.saved_bytes = 0
+        self._lock = threading.Lock()
+
+    def claim(self, url, it, owner=None):
+        """登记即将下载的地址（忽略 #片段）；已被别的条目登记过时返回 (那个条目, 它的 owner)，否则返回 None。"""
+        with self._lock:
+            prev = self.by_url.setdefault(url_key(url), (it, owner))
+            return None if prev[0] is it else prev
+
+    def seed(self, it, path, owner=None):
+        """登记磁盘上已有的图（续传）：它的地址算已下载成功，内容参与之后的去重。"""
+        hsh, pixels = self._fingerprint(path)
+        sha = it.get("sha256")
+        with self._lock:
+            self.by_url.setdefault(url_key(it.get("src") or it["url"]), (it, owner))
+            self.settled[id(it)] = (it, True, it, owner)
+            if sha and sha in self.by_sha:
+                return
+            e = {"hash": hsh, "pixels": pixels or 0, "item": it, "owner": owner, "path": path, "members": []}
+            self.entries.append(e)
+            if sha:
+                self.by_sha[sha] = e
+
+    def count_skip(self, dup, keep, holder):
+        """dup 挂在 keep 上、最终记成 holder 的重复，没有下载：按同地址 / 尺寸变体计数。"""
+        same = url_key(dup.get("src") or dup["url"]) == url_key(keep.get("src") or keep["url"])
+        with self._lock:
+            if same:
+                self.same_url += 1
+                self.saved_bytes += holder.get("bytes") or 0
+            else:
+                self.variants += 1
+
+    def defer(self, dup, dup_owner, keep):
+        """
+        dup 等 keep 的下载结果再定。已登记等待时返回 None；
+        keep 已经有结果时返回 (成功?, 持有文件的条目, 其 owner)，由调用方立即处理。
+        """
+        with self._lock:
+            res = self.settled.get(id(keep))
+            if res is not None:
+                return res[1:]
+            self.waiting.setdefault(id(keep), (keep, []))[1].append((dup, dup_owner))
+            return None
+
+    def settle(self, keep, ok, holder=None, holder_owner=None):
+        """
+        keep 有结果了：成功时文件在 holder（默认就是 keep）；失败时放开它登记的下载地址，后来者可以重试。
+        返回之前 defer 在它上面的 [(条目, owner)]。
+        """
+        with self._lock:
+            self.settled[id(keep)] = (keep, ok, holder or keep, holder_owner)
+            if not ok:
+                for url in [u for u, (it, _) in self.by_url.items() if it is keep]:
+                    del self.by_url[url]
+            entry = self.waiting.pop(id(keep), None)
+            return entry[1] if entry else []
+
+    def add(self, it, path, sha, owner=None):
+        """
+        登记一张刚下载的图。返回 [(重复的条目, 其 owner, 保留的条目, 其 owner)]，供调用方写清单：
+        新图是重复时返回已有的那张；新图更大而替换已有的时，已有那组的全部条目都指向 it。
+        """
+        hsh, pixels = self._fingerprint(path)
+        size = os.path.getsize(path)
+        with self._lock:
+            e = self.by_sha.get(sha)
+            if e is not None:
+                self.exact += 1
+                return self._drop_new(e, it, owner, path, size)
+            if hsh is not None:
+                for e in self.entries:
+                    if e["hash"] is not None and bin(e["hash"] ^ hsh).count("1") <= self.distance:
+                        self.similar += 1
+                        if pixels <= e["pixels"]:
+                            return self._drop_new(e, it, owner, path, size)
+                        # 新图分辨率更大：替换掉这一组原来保留的那张
+                        self.discard.append(e["path"])
+                        self.saved_bytes += os.path.getsize(e["path"]) if os.path.exists(e["path"]) else 0
+                        losers = [(e["item"], e["owner"])] + e["members"]
+                        e.update(hash=hsh, pixels=pixels, item=it, owner=owner, path=path, members=losers)
+                        self.by_sha[sha] = e
+                        return [(x, xo, it, owner) for x, xo in losers]
+            e = {"hash": hsh, "pixels": pixels or 0, "item": it, "owner": owner, "path": path, "members": []}
+            self.entries.append(e)
+            self.by_sha[sha] = e
+            return []
+
+    def _fingerprint(self, path):
+        """返回 (dHash, 像素数)；不做相似判断、图太小或纯色时 dHash 为 None。"""
+        hsh = pixels = None
+        if self.distance >= 0:
+            try:
+                hsh, w, h = dhash(path)
+                pixels = w * h
+                if min(w, h) < self.min_side or hsh == 0:
+                    hsh = None
+            except Exception:
+                hsh = None
+        return hsh, pixels
+
+    def _drop_new(self, e, it, owner, path, size):
+        e["members"].append((it, owner))
+        self.discard.append(path)
+        self.saved_bytes += size
+        return [(it, owner, e["item"], e["owner"])]
+
+    def take_discard(self):
+        with self._lock:
+            out, self.discard = self.discard, []
+            return out
+
+    def summary(self):
+        return (f"完全相同 {self.exact}，相似 {self.similar}，同地址 {self.same_url}，尺寸变体 {self.variants}，"
+                f"可省 {fmt_size(self.saved_bytes)}")
+
+
+def remove_discarded(paths, pad_ext=None):
+    """删除被去重淘汰的原图；做了 4:3 时连同同名的输出（pad_ext 扩展名）一起删。"""
+    for path in paths:
+        for p in {path, path.rsplit(".", 1)[0] + pad_ext if pad_ext else path}:
+            with contextlib.suppress(OSError):
+                os.remove(p)
+
+
+# 页面内公共函数：取文本、就近标题/说明、绝对地址、CSS 路径
+_JS_HELPERS = r"""
+  function textOf(el){ if(!el) return ""; const t = el.innerText||el.textContent||""; return t.trim().replace(/\s+/g,' '); }
+  function nearestHeading(el){
+    let n = el;
+    while(n){
+      let cur = n.previousElementSibling;
+      while(cur){
+        if(['H2','H3','H1','H4'].includes(cur.tagName) && textOf(cur)) return textOf(cur);
+        cur = cur.previousElementSibling;
+      }
+      n = n.parentElement;
+    }
+    return "";
+  }
+  function captionAround(el){
+    let p = el.closest('figure');
+    if(p){ const cap = p.querySelector('figcaption'); if(cap) return textOf(cap); }
+    const aria = el.getAttribute('aria-label')||''; if(aria.trim()) return aria.trim();
+    const descId = el.getAttribute('aria-describedby');
+    if(descId){ const d = document.getElementById(descId); if(d) return textOf(d); }
+    const near = el.closest('[class], [role], section, article, div');
+    if(near){ const cand = textOf(near); if(cand && cand.length<=80) return cand; }
+    return "";
+  }
+  function absUrl(u){ try { return new URL(u, location.href).href; } catch(e){ return ""; } }
+  function cssPath(el){
+    if (!(el instanceof Element)) return "";
+    const parts = [];
+    while (el && el.nodeType === Node.ELEMENT_NODE && parts.length < 8) {
+      let sel = el.nodeName.toLowerCase();
+      if (el.id) { sel += "#" + el.id; parts.unshift(sel); break; }
+      else {
+        let i = 1, sib = el;
+        while ((sib = sib.previousElementSibling) != null) if (sib.nodeName === el.nodeName) i++;
+        sel += `:nth-of-type(${i})`;
+      }
+      parts.unshift(sel);
+      el = el.parentElement;
+    }
+    return parts.join(" > ");
+  }
+  // <img> 的全部候选地址：currentSrc、<picture><source>、srcset、常见懒加载属性。
+  // 每个候选带 w（宽度描述符/实际宽度）或 x（像素密度描述符），from 记来源；data:/blob: 不下载，不算候选。
+  const LAZY_ATTRS = ['data-src','data-original','data-lazy-src','data-lazy','data-url','data-hi-res-src'];
+  const LAZY_SETS = ['data-srcset','data-lazy-srcset'];
+  function parseSrcset(s){
+    const out = [];
+    if(!s) return out;
+    let i = 0;
+    while(i < s.length){
+      while(i < s.length && /[\s,]/.test(s[i])) i++;
+      let j = i;
+      while(j < s.length && !/\s/.test(s[j])) j++;
+      let url = s.slice(i, j), desc = "";
+      if(url.endsWith(',')) url = url.replace(/,+$/, '');
+      else {
+        let k = s.indexOf(',', j);
+        if(k < 0) k = s.length;
+        desc = s.slice(j, k).trim();
+        j = k;
+      }
+      i = j + 1;
+      if(url) out.push({url:url, desc:desc});
+    }
+    return out;
+  }
+  function isPlaceholder(u){ return !u || u.startsWith('data:') || u.startsWith('blob:'); }
+  function imgCandidates(img){
+    const cands = [], seen = new Map();
+    function add(u, desc, from){
+      const url = absUrl(u);
+      if(isPlaceholder(url)) return;
+      // 同一地址后面又在 srcset 里出现时，把描述符补到先加入的候选上（current 就靠这个拿到 w/x）
+      let c = seen.get(url);
+      if(!c){ c = {url:url, from:from}; seen.set(url, c); cands.push(c); }
+      const m = /^([\d.]+)([wx])$/.exec((desc || "").split(/\s+/)[0]);
+      if(m && c.w === undefined && c.x === undefined){ if(m[2] === 'w') c.w = parseInt(m[1]); else c.x = parseFloat(m[1]); }
+      return c;
+    }
+    let lazy = "";
+    for(const a of LAZY_ATTRS){ const v = img.getAttribute(a); if(v && !isPlaceholder(v)){ lazy = absUrl(v); break; } }
+    const cur = img.currentSrc || img.src || "";
+    // 懒加载还没换图时 currentSrc 是占位图，它的实际宽度不代表真图
+    const curReal = !lazy || absUrl(cur) === lazy;
+    // naturalWidth 是按密度折算过的宽度（2x 图显示 400 CSS 像素时是 400），即 1x 宽度，记在 nw 上
+    const curC = cur ? add(cur, '', 'current') : null;
+    if(curC && curReal && img.naturalWidth) curC.nw = img.naturalWidth;
+    const pic = img.parentElement && img.parentElement.tagName === 'PICTURE' ? img.parentElement : null;
+    if(pic) pic.querySelectorAll('source').forEach(s=>{
+      for(const c of parseSrcset(s.getAttribute('srcset') || s.getAttribute('data-srcset'))) add(c.url, c.desc, 'source');
+    });
+    for(const c of parseSrcset(img.getAttribute('srcset'))) add(c.url, c.desc, 'srcset');
+    for(const a of LAZY_SETS) for(const c of parseSrcset(img.getAttribute(a))) add(c.url, c.desc, a);
+    for(const a of LAZY_ATTRS){ const v = img.getAttribute(a); if(v) add(v, '', a); }
+    const src = img.getAttribute('src');
+    if(src) add(src, '', 'src');
+    // 图片身份（清单里的 url）：优先懒加载的真实地址，其次浏览器当前选中的，最后随便一个候选
+    const id = lazy || (!isPlaceholder(cur) && absUrl(cur)) || (cands[0] && cands[0].url) || cur;
+    return {id: id, cands: cands, swapped: curReal};
+  }
+
+"""
+
+# 一次性全量采集（每次调用都遍历整个 DOM）
+JS_COLLECT = "() => {\n" + _JS_HELPERS + r"""
+  const out = [];
+
+  // <img>
+  document.querySelectorAll('img').forEach(img=>{
+    const c = imgCandidates(img);
+    if(!c.id) return;
+    out.push({
+      kind:"img",
+      url:absUrl(c.id),
+      alt:img.alt||"",
+      caption:captionAround(img),
+      nearestHeading:nearestHeading(img),
+      css: cssPath(img),
+      candidates: c.cands
+    });
+  });
+
+  // CSS 背景图
+  document.querySelectorAll('*').forEach(el=>{
+    const bg = getComputedStyle(el).backgroundImage;
+    if(bg && bg.includes('url(')){
+      const m = bg.match(/url\((['"]?)(.*?)\1\)/);
+      if(m && m[2]){
+        out.push({
+          kind:"bg",
+          url:absUrl(m[2]),
+          alt:"",
+          caption:captionAround(el),
+          nearestHeading:nearestHeading(el),
+          css: cssPath(el)
+        });
+      }
+    }
+  });
+
+  // 按 url 去重
+  const seen = new Set(); const dedup=[];
+  for(const it of out){
+    if(!it.url) continue;
+    const key = it.url.split('#')[0];
+    if(seen.has(key)) continue;
+    seen.add(key); dedup.push(it);
+  }
+  return dedup;
+}
+"""
+
+# 背景图扫描策略：
+#   full —— 对（脏子树里的）每个元素调用 getComputedStyle，最全但在大 DOM 上很慢；
+#   fast —— 先读 document.styleSheets 里带 url( 的背景规则选择器和行内 style，
+#            只对命中的候选元素做 getComputedStyle 复核。跨域样式表读不到规则，会计入 unreadable。
+BG_SCAN_MODES = ("full", "fast")
+
+# 增量采集：首轮全量扫描，之后只返回新出现的图片。参数 opts = {bg: "full" | "fast"}。
+# 页面内状态挂在 window.__wisCollect：已报告 URL 集合、<img> 上次 src（WeakMap），
+# 以及 MutationObserver 记录的新增/变化节点；背景图只在这些子树里重新扫描。
+# 页面跳转后状态丢失会自动退回全量，Python 侧按 url 去重即可。
+# 返回 {items: [...], unreadable: 读不到规则的样式表数}。
+JS_COLLECT_DELTA = "(opts) => {\n" + _JS_HELPERS + r"""
+  const bgMode = (opts && opts.bg) || "full";
+  let st = window.__wisCollect;
+  if(!st){
+    st = window.__wisCollect = {
+      seen: new Set(), imgSrc: new WeakMap(), dirty: [], full: true,
+      bgDone: new WeakSet(), sheetCount: -1, bgSel: "", unreadable: 0
+    };
+    new MutationObserver(recs=>{
+      for(const r of recs){
+        if(r.type === 'childList'){
+          r.addedNodes.forEach(n=>{ if(n.nodeType === 1) st.dirty.push(n); });
+        } else if(r.target.nodeType === 1){
+          st.dirty.push(r.target);
+          st.bgDone.delete(r.target);   // style/class 变了，fast 模式下需要重新复核
+        }
+      }
+    }).observe(document.documentElement, {
+      childList:true, subtree:true, attributes:true, attributeFilter:['src','srcset','style','class','data-src','data-srcset','data-original']
+    });
+  }
+
+  const out = [];
+  function emit(kind, el, u, alt, cands){
+    const url = absUrl(u);
+    if(!url) return;
+    const key = url.split('#')[0];
+    if(st.seen.has(key)) return;
+    st.seen.add(key);
+    const it = {
+      kind:kind,
+      url:url,
+      alt:alt||"",
+      caption:captionAround(el),
+      nearestHeading:nearestHeading(el),
+      css: cssPath(el)
+    };
+    if(cands) it.candidates = cands;
+    out.push(it);
+  }
+  function checkBg(el){
+    const bg = getComputedStyle(el).backgroundImage;
+    if(bg && bg.includes('url(')){
+      const m = bg.match(/url\((['"]?)(.*?)\1\)/);
+      if(m && m[2]) emit("bg", el, m[2], "");
+    }
+  }
+
+  // 样式表里声明了背景图的选择器，合并成一个选择器串；样式表数量变化时重建
+  function bgSelector(){
+    const sheets = document.styleSheets;
+    if(sheets.length === st.sheetCount) return st.bgSel;
+    const sels = new Set();
+    let unreadable = 0;
+    function walk(rules){
+      for(const rule of rules){
+        if(rule.styleSheet){ try { walk(rule.styleSheet.cssRules); } catch(e){ unreadable++; } continue; }
+        if(rule.cssRules && !rule.selectorText){ walk(rule.cssRules); continue; }
+        if(!rule.selectorText || !rule.style) continue;
+        const bg = rule.style.backgroundImage || rule.style.background || "";
+        if(!bg.includes('url(')) continue;
+        for(const sel of rule.selectorText.split(',')){
+          const s = sel.trim();
+          if(!s || s.includes('::')) continue;   // 伪元素的背景 full 模式同样拿不到
+          try { document.querySelector(s); sels.add(s); } catch(e){}
+        }
+      }
+    }
+    for(const sheet of sheets){
+      try { walk(sheet.cssRules); } catch(e){ unreadable++; }
+    }
+    st.sheetCount = sheets.length;
+    st.unreadable = unreadable;
+    st.bgSel = [...sels, '[style*="url("]'].join(',');
+    return st.bgSel;
+  }
+
+  // <img>：遍历很便宜，只处理地址变化过的（懒加载换图不一定触发属性变更）。
+  // 懒加载还没换上真图的先不交（不记 mark），等 currentSrc 变了、候选带上 nw 再采，宽度排序才准；
+  // opts.flush（最后一轮）时不再等，按现有候选交出来。
+  document.querySelectorAll('img').forEach(img=>{
+    const src = img.currentSrc || img.src || "";
+    const mark = src + '|' + (img.getAttribute('srcset') || '');
+    if(st.imgSrc.get(img) === mark) return;
+    const c = imgCandidates(img);
+    if(!c.swapped && !(opts && opts.flush)) return;
+    st.imgSrc.set(img, mark);
+    if(c.id) emit("img", img, c.id, img.alt, c.cands);
+  });
+
+  if(bgMode === "fast"){
+    // 一次原生 querySelectorAll 找候选，只对没复核过的元素算 computed style
+    st.full = false;
+    st.dirty = [];
+    document.querySelectorAll(bgSelector()).forEach(el=>{
+      if(st.bgDone.has(el)) return;
+      st.bgDone.add(el);
+      checkBg(el);
+    });
+  } else {
+    // CSS 背景图：首轮扫全量，之后只扫脏子树
+    let roots;
+    if(st.full){ roots = [document.documentElement]; st.full = false; }
+    else { roots = st.dirty; }
+    st.dirty = [];
+    const scanned = new Set();
+    for(const root of roots){
+      if(!root.isConnected) continue;
+      const els = [root, ...root.querySelectorAll('*')];
+      for(const el of els){
+        if(scanned.has(el)) continue;
+        scanned.add(el);
+        checkBg(el);
+      }
+    }
+  }
+  return {items: out, unreadable: st.unreadable};
+}
+"""
+
+
+# 在页面内一次性找“加载更多”候选：文字匹配、可见、未禁用。
+# 给命中的元素打上 data-wis-more 编号，返回 [data-wis-more="N"] 作为稳定选择器；
+# key 由标签、文字、href 组成，用来记住点了没反应的按钮。muts 是页面累计 DOM 变更次数。
+JS_FIND_MORE = r"""
+({texts, skip}) => {
+  const st = window.__wisMore || (window.__wisMore = {seq: 0, muts: 0});
+  if(!st.mo){
+    st.mo = new MutationObserver(recs => { st.muts += recs.length; });
+    st.mo.observe(document.documentElement, {childList:true, subtree:true});
+  }
+  const keys = texts.map(t => t.toLowerCase());
+  const skipSet = new Set(skip);
+  const out = [];
+  for(const el of document.querySelectorAll('button, a, [role=button]')){
+    if(out.length >= 10) break;
+    if(el.disabled || el.getAttribute('aria-disabled') === 'true') continue;
+    const txt = (el.innerText || '').trim().toLowerCase();
+    if(!txt || txt.length > 60 || !keys.some(k => txt.includes(k))) continue;
+    const r = el.getBoundingClientRect();
+    if(r.width <= 0 || r.height <= 0) continue;
+    const cs = getComputedStyle(el);
+    if(cs.visibility === 'hidden' || cs.display === 'none' || cs.pointerEvents === 'none') continue;
+    const key = el.tagName + '|' + txt + '|' + (el.getAttribute('href') || '');
+    if(skipSet.has(key)) continue;
+    if(!el.dataset.wisMore) el.dataset.wisMore = String(++st.seq);
+    out.push({sel: '[data-wis-more="' + el.dataset.wisMore + '"]', key: key, text: txt});
+  }
+  return {items: out, mutations: st.muts};
+}
+"""
+
+
+# 整站抓取用：页面上所有 http(s) 链接（含 rel=next），去掉 #片段
+JS_LINKS = r"""
+() => {
+  const out = new Set();
+  for(const a of document.querySelectorAll('a[href], link[rel=next][href]')){
+    try {
+      const u = new URL(a.getAttribute('href'), location.href);
+      if(u.protocol !== 'http:' && u.protocol !== 'https:') continue;
+      u.hash = '';
+      out.add(u.href);
+    } catch(e){}
+  }
+  return [...out];
+}
+"""
+
+
+# 截图批处理用：一次拿到所有元素的文档坐标（CSS 像素）。
+# 自身或祖先是 fixed/sticky、带 transform 的元素整页截图里位置不可靠，标记 single 让调用方逐个截图。
+JS_CAPTURE_BOXES = r"""
+(sels) => {
+  const out = sels.map(sel => {
+    let el = null;
+    try { el = document.querySelector(sel); } catch(e){}
+    if(!el) return null;
+    const r = el.getBoundingClientRect();
+    let single = r.width < 1 || r.height < 1;
+    for(let a = el; a && a !== document.documentElement && !single; a = a.parentElement){
+      const cs = getComputedStyle(a);
+      if(cs.position === 'fixed' || cs.position === 'sticky' || cs.transform !== 'none') single = true;
+    }
+    return {x: r.left + scrollX, y: r.top + scrollY, w: r.width, h: r.height, single: single};
+  });
+  const de = document.documentElement;
+  return {boxes: out, dpr: devicePixelRatio, width: de.scrollWidth, height: de.scrollHeight};
+}
+"""
+CAPTURE_TILE_PX = 4096   # 每块整页截图的最大高度（设备像素），控制单次截图的内存
+
+
+def plan_capture_tiles(boxes, tile_h):
+    """
+    把元素框按纵向分组成若干截图块：每块从第一个元素的顶端开始，高度不超过 tile_h（CSS 像素），
+    只收完整落在块内的元素。返回 [(clip, [下标…])]，clip 是 {x, y, width, height}。
+    """
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i]["y"])
+    tiles, cur, top = [], [], None
+    for i in order:
+        b = boxes[i]
+        if cur and b["y"] + b["h"] > top + tile_h:
+            tiles.append(cur)
+            cur = []
+        if not cur:
+            top = b["y"]
+        cur.append(i)
+    if cur:
+        tiles.append(cur)
+    plans = []
+    for idxs in tiles:
+        x0 = int(min(boxes[i]["x"] for i in idxs))
+        y0 = int(min(boxes[i]["y"] for i in idxs))
+        x1 = max(boxes[i]["x"] + boxes[i]["w"] for i in idxs)
+        y1 = max(boxes[i]["y"] + boxes[i]["h"] for i in idxs)
+        plans.append(({"x": x0, "y": y0, "width": int(x1 - x0 + 1), "height": int(y1 - y0 + 1)}, idxs))
+    return plans
+
+
+# 等页面“安静”下来：quietMs 内没有 DOM 变更、scrollHeight 不变、视口附近没有未加载完的 <img>，
+# 或者超过 timeoutMs。返回本次等待的耗时和页面状态，供调度器判断和记录。
+JS_SETTLE = r"""
+({quietMs, timeoutMs}) => new Promise(resolve => {
+  const t0 = performance.now();
+  let last = t0, muts = 0, h = document.documentElement.scrollHeight;
+  const h0 = h;
+  const mo = new MutationObserver(recs => { last = performance.now(); muts += recs.length; });
+  mo.observe(document.documentElement, {childList:true, subtree:true, attributes:true});
+  function pendingImgs(){
+    let n = 0;
+    for(const img of document.images){
+      if(img.complete) continue;
+      const r = img.getBoundingClientRect();
+      if(r.bottom > -innerHeight && r.top < 2 * innerHeight) n++;
+    }
+    return n;
+  }
+  (function tick(){
+    const now = performance.now();
+    const nh = document.documentElement.scrollHeight;
+    if(nh !== h){ h = nh; last = now; }
+    const pending = pendingImgs();
+    const timedOut = now - t0 >= timeoutMs;
+    if((now - last >= quietMs && pending === 0) || timedOut){
+      mo.disconnect();
+      resolve({ms: now - t0, grew: h - h0, height: h, mutations: muts, pending: pending, timedOut: timedOut});
+    } else {
+      setTimeout(tick, 50);
+    }
+  })();
+})
+"""
+
+
+def run_steps(gen, do):
+    """
+    驱动步骤生成器（Job._scroll_rounds、ScrollScheduler.settle_steps 等）：每个 yield 出来的 (操作, 参数)
+    交给 do（通常是 PageSteps）执行，结果 send 回去；do 抛出的异常 throw 回生成器，由它自己决定吞掉还是继续抛出。
+    返回生成器的返回值。
+    """
+    res, exc = None, None
+    while True:
+        try:
+            op, arg = gen.throw(exc) if exc is not None else gen.send(res)
+        except StopIteration as e:
+            return e.value
+        try:
+            res, exc = do(op, arg), None
+        except Exception as e:
+            res, exc = None, e
+
+
+async def run_steps_async(gen, do):
+    """run_steps 的 async 版本：do 的返回值是 awaitable 时先 await 再 send 回去。"""
+    res, exc = None, None
+    while True:
+        try:
+            op, arg = gen.throw(exc) if exc is not None else gen.send(res)
+        except StopIteration as e:
+            return e.value
+        try:
+            res = do(op, arg)
+            if inspect.isawaitable(res):
+                res = await res
+            exc = None
+        except Exception as e:
+            res, exc = None, e
+
+
+class PageSteps:
+    """
+    把步骤生成器 yield 出来的操作落到页面上，同步和 async Page 通用（async 时返回值由 run_steps_async 去 await）：
+    ("page", (方法名, args, kwargs)) → page.方法(...)；("element", (选择器, 方法名, kwargs)) → 第一个匹配元素上的方法；
+    ("items", 新图片列表) → on_items(列表)，没给 on_items 时忽略。
+    """
+    def __init__(self, page, on_items=None):
+        self.page = page
+        self.on_items = on_items
+
+    def __call__(self, op, arg):
+        if op == "page":
+            name, args, kwargs = arg
+            return getattr(self.page, name)(*args, **kwargs)
+        if op == "element":
+            sel, name, kwargs = arg
+            return getattr(self.page.locator(sel).first, name)(**kwargs)
+        if op == "items":
+            return self.on_items(arg) if self.on_items is not None else None
+        raise ValueError(f"未知的页面操作：{op}")
+
+
+class ScrollScheduler:
+    """
+    自适应滚动等待，替代固定的 sleep：
+    - 页面内 JS_SETTLE 等 DOM 变更平息、scrollHeight 稳定、视口附近图片加载完；
+    - Python 侧用 request / requestfinished / requestfailed 统计在途图片请求，等它们清空；
+    两者都满足或超过 round_timeout 秒即结束本轮等待。
+    注意等待期间必须用 page.wait_for_timeout（会处理事件），time.sleep 收不到请求事件。
+    等待逻辑写成步骤生成器 settle_steps()，同步和 async Page 共用；settle() 是同步 Page 的简便写法。
+    """
+    def __init__(self, page, quiet_ms=300, round_timeout=8.0):
+        self.page = page
+        self.quiet_ms = quiet_ms
+        self.round_timeout = round_timeout
+        self.inflight = 0
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+
+    def _on_request(self, req):
+        if req.resource_type == "image":
+            self.inflight += 1
+
+    def _on_done(self, req):
+        if req.resource_type == "image":
+            self.inflight = max(0, self.inflight - 1)
+
+    def settle_steps(self):
+        """等到页面安静的步骤（见 PageSteps），最后返回 {secs, grew, height, timed_out, inflight}。"""
+        t0 = time.monotonic()
+        deadline = t0 + self.round_timeout
+        try:
+            res = yield "page", ("evaluate", (JS_SETTLE, {"quietMs": self.quiet_ms,
+                                                          "timeoutMs": int(self.round_timeout * 1000)}), {})
+        except Exception:
+            res = {"grew": 0, "height": 0, "timedOut": False}
+        while self.inflight > 0 and time.monotonic() < deadline:
+            yield "page", ("wait_for_timeout", (50,), {})
+        return {"secs": time.monotonic() - t0, "grew": res["grew"], "height": res["height"],
+                "timed_out": res["timedOut"] or self.inflight > 0, "inflight": self.inflight}
+
+    def settle(self):
+        """同步 Page 上等到页面安静，返回值同 settle_steps()。"""
+        return run_steps(self.settle_steps(), PageSteps(self.page))
+
+    def close(self):
+        for event, fn in (("request", self._on_request), ("requestfinished", self._on_done),
+                          ("requestfailed", self._on_done)):
+            try:
+                self.page.remove_listener(event, fn)
+            except Exception:
+                pass
+
+
+@dataclass
+class JobOptions:
+    """一次任务的全部选项；GUI 的开关和 CLI 的参数都落到这里。"""
+    mode: str = "download"      # download / screenshot / both
+    headless: bool = True
+    try_more: bool = True       # 尝试点击“加载更多/下一页”
+    max_scrolls: int = 30
+    scroll_quiet_ms: int = 300  # DOM 连续这么久没有变化才算加载完
+    scroll_timeout: float = 8.0 # 每轮最多等待秒数
+    scroll_patience: int = 2    # 连续几轮没有任何变化就停止滚动
+    bg_scan: str = "full"       # 背景图扫描策略，见 BG_SCAN_MODES
+    workers: int = 8            # 全局并发下载数
+    per_host: int = 4           # 单域名并发
+    max_mb: int = 0             # 单图上限（MB），0 表示不限
+    use_cache: bool = True
+    cache_mb: int = 1024
+    resume: bool = False
+    net_capture: bool = True    # 优先用浏览器网络流量里已下载的图片，缺的再走 HTTP
+    block_resources: bool = False   # 滚动时拦截与图片无关的重资源，见 RoutePolicy
+    block_types: tuple = ("media", "font")
+    block_domains: tuple = TRACKER_DOMAINS
+    allow_domains: tuple = ()
+    src_policy: str = "largest" # 多个候选地址时怎么选，见 SRC_POLICIES
+    src_target: int = 0         # closest 策略的目标宽度（像素）
+    dedup: bool = True          # 下载前合并尺寸变体，下载后按内容去重，见 DedupIndex
+    dedup_distance: int = 4     # dHash 汉明距离阈值，-1 表示只去完全相同的
+    crawl_depth: int = 0        # 整站抓取的链接深度，0 表示只抓起始页，见 Crawl
+    crawl_max_pages: int = 50
+    crawl_include: str = ""     # 只跟进匹配这个正则的链接（空表示不限）
+    crawl_exclude: str = ""     # 不跟进匹配这个正则的链接
+    crawl_workers: int = 2      # 同时处理的页面数
+    crawl_delay: float = 1.0    # 同一域名两次打开页面的最小间隔（秒）
+    metrics_jsonl: str = ""     # 非空时每个任务结束把指标追加到这个 JSON Lines 文件
+    pipeline: bool = True       # 边滚动边下载，见 FetchStage
+    pipeline_depth: int = 64    # 流水线里同时在途的下载数上限（背压）
+    batch_capture: bool = True  # 截图模式下整页分块截图后本地裁剪，见 Job.capture_batch
+    pad_43: bool = False
+    pad_fmt: str = "PNG"        # 见 PAD_FORMATS
+    pad_bg: str = "透明"        # 见 PAD_BACKGROUNDS
+    pad_max: int = 0            # 4:3 输出最长边，0 表示不缩放
+    png_level: int = 6
+
+    def pad_opts(self):
+        """传给 PadStage / convert_to_4_3 的参数；不做 4:3 时返回 None。"""
+        if not self.pad_43:
+            return None
+        # 不透明背景时 convert_to_4_3 会保留源图模式；PNG 压缩级别越低编码越快、文件越大
+        return dict(fmt=self.pad_fmt, background_color=PAD_BACKGROUNDS[self.pad_bg],
+                    max_size=self.pad_max or None, compress_level=self.png_level)
+
+
+class Job:
+    """
+    一次抓取任务：打开 url，滚动采集，写清单，下载/截图到 out_dir。
+    log(msg) 接收日志行，progress(done, total) 接收进度；stop_flag 置位后在当前步骤结束时停下。
+    pool 为 BrowserPool 时从池里租一个 context，否则自己启动 Chromium。
+    dedup 为共用的 DedupIndex 时，被判重复的文件留给所有者（Crawl）最后统一删除。
+    cache 为下载缓存；不给且 use_cache 时用本进程共用的 shared_cache()。
+    各阶段指标记在 self.metrics，结束时打印汇总表；给了 metrics（批量/整站的汇总）时再并入其中。
+    """
+    def __init__(self, url, out_dir, opts=None, log=None, progress=None, stop_flag=None, pool=None, dedup=None,
+                 metrics=None, cache=None):
+        self.url = url
+        self.out_dir = out_dir
+        self.opts = opts or JobOptions()
+        self.log = log or print
+        self.progress = progress or (lambda done, total: None)
+        self.stop_flag = stop_flag or threading.Event()
+        self.pool = pool
+        self.dedup = dedup          # 整站抓取时各页面共用的 DedupIndex；None 表示每个任务自己建
+        self.cache = cache
+        self.metrics = Metrics()
+        self.parent_metrics = metrics
+        self._more_dead = set()     # 点过但没有引起任何 DOM 变化的“加载更多”
+        self._more_pending = None   # (上一轮点击的 key 列表, 点击前的 DOM 变更计数)
+
+    def log_put(self, msg):
+        self.log(msg)
+
+    def try_click_more(self, page):
+        """同步 Page 上点一轮“加载更多”，返回是否点到；步骤见 _click_more_steps。"""
+        return run_steps(self._click_more_steps(), PageSteps(page))
+
+    def _click_more_steps(self):
+        # 一次 evaluate 在页面内找出可点的“加载更多”，再按返回的选择器点击（步骤生成器，同步/async 共用）。
+        # 上一轮点过的按钮如果之后 DOM 一点没变，记进 _more_dead，不再点。
+        if not self.opts.try_more: return False
+        try:
+            with self.metrics.time("find_more"):
+                res = yield "page", ("evaluate", (JS_FIND_MORE, {"texts": CLICK_MORE_TEXTS,
+                                                                 "skip": sorted(self._more_dead)}), {})
+        except Exception:
+            return False
+        clicked = []
+        for c in self._more_targets(res):
+            try:
+                with self.metrics.time("click_more"):
+                    yield "element", (c["sel"], "scroll_into_view_if_needed", {"timeout": 1000})
+                    yield "element", (c["sel"], "click", {"timeout": 1500})
+                clicked.append(c["key"])
+            except Exception:
+                pass
+        return self._more_clicked(clicked, res)
+
+    def _load_steps(self, url):
+        """打开页面：导航并等 networkidle（步骤生成器，同步/async 共用）；超时只记警告，照常往下采集。"""
+        from playwright.sync_api import TimeoutError as PWTimeout   # 与 async_api 的是同一个类
+        try:
+            with self.metrics.time("navigate"):
+                yield "page", ("goto", (url,), {"timeout": 45000, "wait_until": "domcontentloaded"})
+            with self.metrics.time("load_idle"):
+                yield "page", ("wait_for_load_state", ("networkidle",), {"timeout": 15000})
+            self.log_put("[INFO] 页面已加载，开始自动滚动/加载更多…")
+        except PWTimeout:
+            self.log_put("[WARN] 页面加载超时，继续尝试采集…")
+
+    def _more_targets(self, res):
+        """按 JS_FIND_MORE 的结果结算上一轮点击（DOM 没变就记死），返回这一轮还值得点的候选。"""
+        if self._more_pending:
+            keys, muts = self._more_pending
+            if res["mutations"] == muts:
+                self._more_dead.update(keys)
+            self._more_pending = None
+        return [c for c in res["items"] if c["key"] not in self._more_dead]
+
+    def _more_clicked(self, clicked, res):
+        if clicked:
+            # 以点击前的计数为基准：下一轮计数不变说明点击没有引起任何变化
+            self._more_pending = (clicked, res["mutations"])
+        return bool(clicked)
+
+    def auto_scroll_and_collect(self, page, max_scrolls, bg_scan="full", on_items=None):
+        # 增量采集：每轮只拿页面新出现的图片，累加进同一个 dict（保持发现顺序）。
+        # 等待交给 ScrollScheduler；连续 scroll_patience 轮既没有新图、页面也没变高、也没点到“加载更多”才停。
+        # on_items(新图片列表) 每轮调用一次，流水线模式下用它边滚动边下载。
+        opts = self.opts
+        sched = ScrollScheduler(page, quiet_ms=opts.scroll_quiet_ms, round_timeout=opts.scroll_timeout)
+        try:
+            return run_steps(self._scroll_rounds(sched, max_scrolls, bg_scan), PageSteps(page, on_items))
+        finally:
+            sched.close()
+
+    def _scroll_rounds(self, sched, max_scrolls, bg_scan):
+        """
+        滚动采集的主循环，同步（auto_scroll_and_collect）和 async（AsyncRunner）共用。
+        页面操作 yield 给驱动方执行（见 run_steps / PageSteps），每轮新图片以 ("items", 列表) 交出去。
+        sched 是挂在同一页面上的 ScrollScheduler。最后返回按发现顺序的全部图片。
+        """
+        opts = self.opts
+        by_url, stalled = {}, 0
+        warned = False
+
+        def take(res):
+            fresh = []
+            for it in res["items"]:
+                if it["url"] not in by_url:
+                    by_url[it["url"]] = it
+                    fresh.append(it)
+            self.metrics.inc("items", len(fresh), stage="collect")
+            return fresh
+
+        for r in range(max_scrolls):
+            if self.stop_flag.is_set(): break
+            t0 = time.monotonic()
+            clicked = yield from self._click_more_steps()
+            if clicked:
+                yield from sched.settle_steps()
+            yield "page", ("evaluate", ("window.scrollTo(0, document.body.scrollHeight);",), {})
+            st = yield from sched.settle_steps()
+            self.metrics.observe("scroll_wait", st["secs"])
+            if st["timed_out"]:
+                self.metrics.error("scroll_wait", "Timeout")
+            try:
+                with self.metrics.time("collect"):
+                    res = yield "page", ("evaluate", (JS_COLLECT_DELTA, {"bg": bg_scan}), {})
+            except Exception:
+                res = {"items": []}
+            if bg_scan == "fast" and res.get("unreadable") and not warned:
+                warned = True
+                self.log_put(f"[WARN] {res['unreadable']} 个跨域样式表无法读取，其中的背景图可能漏采（可改用完整扫描）")
+            fresh = take(res)
+            added = len(fresh)
+            if fresh:
+                yield "items", fresh
+            stalled = 0 if (added or clicked or st["grew"] > 0) else stalled + 1
+            self.metrics.observe("scroll_round", time.monotonic() - t0)
+            note = "，等待超时" if st["timed_out"] else ""
+            self.log_put(f"[SCROLL] 第{r+1}次，新增{added}，累计图片{len(by_url)}，"
+                         f"用时 {time.monotonic() - t0:.2f}s（等待 {st['secs']:.2f}s，高度 {st['height']}{note}）")
+            if stalled >= opts.scroll_patience: break
+        if not self.stop_flag.is_set():
+            # 懒加载一直没换上真图的 <img> 每轮都先压着，收尾时按现有候选交出来
+            try:
+                with self.metrics.time("collect"):
+                    res = yield "page", ("evaluate", (JS_COLLECT_DELTA, {"bg": bg_scan, "flush": True}), {})
+            except Exception:
+                res = {"items": []}
+            fresh = take(res)
+            if fresh:
+                self.log_put(f"[SCROLL] 收尾：{len(fresh)} 张懒加载图片未换上真图，按已采到的候选下载")
+                yield "items", fresh
+        return list(by_url.values())
+
+    def download_item(self, session, man, it, out_dir, pad=None, max_bytes=None, cache=None, stats=None, netbuf=None,
+                      dedup=None):
+        """
+        在下载线程中执行：保存原图（both 模式加 -orig 后缀），可选交给 4:3 阶段，结果记入清单。
+        抓包缓冲里有就直接写盘，没有再流式下载；给了 dedup 时重复的图只记 dup_of，不做 4:3。
+        it["src"] 是按策略选中的候选地址，下载失败时退回 it["url"] 再试一次。
+        """
+        src = it.get("src") or it["url"]
+        ext = ext_from_url(src)
+        raw_name = it["name"] + ("-orig" + ext if man.mode == "both" else ext)
+        raw_path = os.path.join(out_dir, raw_name)
+        t0 = time.monotonic()
+        try:
+            hit = netbuf.write_to(src, raw_path, max_bytes) if netbuf is not None else None
+            if hit is not None:
+                (n, sha), source = hit, "page"
+            else:
+                try:
+                    n, secs, source, sha = fetch_to_file(src, raw_path, session=session, max_bytes=max_bytes, cache=cache)
+                except Exception as e:
+                    if src == it["url"] or isinstance(e, DownloadTooLarge):
+                        raise
+                    self.metrics.error("download", e)
+                    self.log_put(f"[WARN] 候选地址下载失败，改用原地址：{src}  {e}")
+                    it["src"] = it["url"]
+                    return self.download_item(session, man, it, out_dir, pad, max_bytes, cache, stats, netbuf, dedup)
+            if source == "page":
+                self.log_put(f"[SAVE] {raw_path}  {fmt_size(n)}（抓包）")
+            elif source == "cache":
+                self.log_put(f"[SAVE] {raw_path}  {fmt_size(n)}（缓存）")
+            else:
+                self.log_put(f"[SAVE] {raw_path}  {fmt_size(n)}, {fmt_size(n / max(secs, 1e-6))}/s")
+            if stats is not None:
+                stats.add(n)
+            self.metrics.observe("download", time.monotonic() - t0)
+            self.metrics.inc("bytes", n, stage="download", key=source)
+            self.metrics.inc("items", stage="download", key=source)
+            man.mark(it, True, out_dir, path=raw_name, bytes=n, sha256=sha)
+            dups = dedup.add(it, raw_path, sha, (man, out_dir)) if dedup is not None else []
+            for dup, dup_owner, keep, keep_owner in dups:
+                self._mark_dup(dup, dup_owner, keep, keep_owner)
+            # 4:3：下载原图时，按输出格式另存（同名换扩展名）
+            if pad is not None and not any(d[0] is it for d in dups):
+                pad.submit(raw_path, pad.output_for(raw_path))
+            return True
+        except Exception as e:
+            self.metrics.observe("download", time.monotonic() - t0)
+            self.metrics.error("download", e)
+            self.log_put(f"[ERR ] 下载失败：{it['url']}  {e}")
+            man.mark(it, False, out_dir, error=str(e))
+            return False
+
+    def _mark_dup(self, dup, dup_owner, keep, keep_owner):
+        """把 dup 记成 keep 的重复；两者属于不同页面时 dup_of 写相对路径，并落盘 dup 所在的清单。"""
+        d_man, d_dir = dup_owner
+        k_man, k_dir = keep_owner
+        ref = keep["name"] if k_man is d_man else os.path.relpath(os.path.join(k_dir, keep["name"]), d_dir)
+        self.log_put(f"[DEDUP] {dup['name']} 与 {ref} 重复，保留后者")
+        self.metrics.inc("items", stage="dedup")
+        d_man.mark(dup, True, d_dir, dup_of=ref, path=None)
+        if d_man is not k_man:
+            d_man.flush()
+
+    def _cap_target(self, man, it, out_dir):
+        cap_name = it["name"] + ("-cap.png" if man.mode == "both" else ".png")
+        return cap_name, os.path.join(out_dir, cap_name)
+
+    def _cap_done(self, man, it, out_dir, cap_name, cap_path, pad, stats):
+        self.log_put(f"[CAP ] {cap_path}")
+        if stats is not None:
+            stats.add()
+        if pad is not None:
+            pad.submit(cap_path, pad.output_for(cap_path))
+        man.mark(it, True, out_dir, cap_path=cap_name)
+
+    def capture_item(self, page, man, it, out_dir, pad=None, stats=None):
+        """在任务线程中执行：元素截图（both 模式加 -cap 后缀），可选交给 4:3 阶段，结果记入清单。"""
+        cap_name, cap_path = self._cap_target(man, it, out_dir)
+        try:
+            # 有 css 选择器就做元素级截图；没有就退化到视窗截图
+            with self.metrics.time("capture"):
+                if it.get("css"):
+                    el = page.locator(it["css"]).first
+                    el.scroll_into_view_if_needed(timeout=2000)
+                    el.screenshot(path=cap_path)
+                else:
+                    page.screenshot(path=cap_path, full_page=False)
+            self._cap_done(man, it, out_dir, cap_name, cap_path, pad, stats)
+            return True
+        except Exception as e:
+            self.log_put(f"[ERR ] 截图失败：{e}")
+            man.mark(it, False, out_dir, error=str(e))
+            return False
+
+    def capture_batch(self, page, man, items, out_dir, pad=None, stats=None, tick=None):
+        """
+        批量截图：一次 evaluate 拿到全部元素位置，按块做整页截图，再用 Pillow 在本地裁剪。
+        找不到位置、fixed/transform、超出单块高度的元素不在这里处理，返回给调用方逐个截图。
+        tick() 每完成一张调用一次，用来推进度。
+        """
+        from PIL import Image
+        with_css = [it for it in items if it.get("css")]
+        rest = [it for it in items if not it.get("css")]
+        if not with_css:
+            return rest
+        try:
+            with self.metrics.time("capture_boxes"):
+                info = page.evaluate(JS_CAPTURE_BOXES, [it["css"] for it in with_css])
+        except Exception as e:
+            self.log_put(f"[WARN] 批量截图取位置失败，改为逐个截图：{e}")
+            return items
+        dpr = info["dpr"] or 1
+        tile_h = CAPTURE_TILE_PX / dpr
+        boxes, batch = [], []
+        for it, b in zip(with_css, info["boxes"]):
+            if b is None or b["single"] or b["h"] > tile_h or b["x"] < 0 or b["y"] < 0:
+                rest.append(it)
+            else:
+                boxes.append(b)
+                batch.append(it)
+        plans = plan_capture_tiles(boxes, tile_h)
+        self.log_put(f"[CAP ] 批量截图：{len(batch)} 张分 {len(plans)} 块，逐个截图 {len(rest)} 张")
+        for clip, idxs in plans:
+            if self.stop_flag.is_set(): break
+            try:
+                with self.metrics.time("capture_tile"):
+                    tile = Image.open(io.BytesIO(page.screenshot(clip=clip, full_page=True)))
+                    tile.load()
+            except Exception as e:
+                self.log_put(f"[WARN] 整页截图失败，该块改为逐个截图：{e}")
+                rest.extend(batch[i] for i in idxs)
+                continue
+            for i in idxs:
+                it, b = batch[i], boxes[i]
+                cap_name, cap_path = self._cap_target(man, it, out_dir)
+                left, top = round((b["x"] - clip["x"]) * dpr), round((b["y"] - clip["y"]) * dpr)
+                box = (left, top, min(tile.width, left + max(1, round(b["w"] * dpr))),
+                       min(tile.height, top + max(1, round(b["h"] * dpr))))
+                try:
+                    with self.metrics.time("capture_crop"):
+                        tile.crop(box).save(cap_path, format="PNG")
+                    self._cap_done(man, it, out_dir, cap_name, cap_path, pad, stats)
+                except Exception as e:
+                    self.log_put(f"[ERR ] 截图失败：{e}")
+                    man.mark(it, False, out_dir, error=str(e))
+                if tick is not None:
+                    tick()
+            tile.close()
+        return rest
+
+    def make_pad(self):
+        """按选项建 4:3 阶段；不做 4:3 时返回 None。"""
+        pad_opts = self.opts.pad_opts()
+        if pad_opts is None:
+            return None
+        return PadStage(on_done=lambda path, ok: self.log_put(f"[4:3] {path}" if ok else f"[ERR ] 4:3 转换失败：{path}"),
+                        metrics=self.metrics, **pad_opts)
+
+    def process_items(self, page, man, cache, netbuf=None, stage=None):
+        """
+        处理清单里尚未完成的下载/截图；下载并发执行，截图依赖 page，只能留在当前线程串行。
+        stage 为滚动时已经在跑的 FetchStage（流水线模式）：剩下的下载接着交给它，交过的条目不再处理。
+        """
+        opts, out_dir = self.opts, self.out_dir
+        fed = stage.seen if stage is not None else ()
+        dl_todo, cap_todo = [], []
+        skipped = 0
+        for it in man.items:
+            if id(it) in fed:
+                # 下载已在流水线里，只看还要不要截图；状态由下载线程更新，这里不碰
+                if man.needs(it, out_dir)[1]:
+                    cap_todo.append(it)
+                continue
+            need_dl, need_cap = man.needs(it, out_dir)
+            if need_dl or need_cap:
+                it["status"] = "pending"
+            else:
+                skipped += 1
+            if need_dl:
+                dl_todo.append(it)
+            if need_cap:
+                cap_todo.append(it)
+        if skipped:
+            self.log_put(f"[INFO] 跳过已完成 {skipped} 张")
+
+        # 4:3 补边是独立的多进程阶段，下载/截图只负责把文件交过去
+        if stage is None:
+            pad = self.make_pad() if dl_todo or cap_todo else None
+            stage = FetchStage(self, man, cache, netbuf, pad, opts.pipeline_depth)
+        pad = stage.pad
+        cap_stats = StageStats("截图")
+        caps = 0
+        try:
+            # 清单里的条目已全部在内存里，不必限流，先全部提交，下载与下面的截图并行
+            stage.feed(dl_todo, bounded=False)
+            n_cap = len(cap_todo)
+
+            def tick():
+                # 下载失败时尺寸变体会补提交，下载总数按当前的算
+                self.progress(caps + stage.finished(), len(stage.futures) + n_cap)
+            tick()
+            if cap_todo and page is not None:
+                cap_stats.start()
+
+                def cap_tick():
+                    nonlocal caps
+                    caps += 1
+                    tick()
+                rest = cap_todo
+                if opts.batch_capture:
+                    rest = self.capture_batch(page, man, cap_todo, out_dir, pad, cap_stats, cap_tick)
+                for it in rest:
+                    if self.stop_flag.is_set(): break
+                    self.capture_item(page, man, it, out_dir, pad, cap_stats)
+                    cap_tick()
+            stage.wait(tick)
+        finally:
+            stage.close()
+            if pad is not None:
+                pad.close()
+            dedup = stage.dedup
+            if dedup is not None and self.dedup is None and stage.seen:
+                # 4:3 阶段已结束，可以安全删除被判重复的原图及其 4:3 输出
+                remove_discarded(dedup.take_discard(), pad.ext if pad is not None else None)
+                self.log_put(f"[DEDUP] {dedup.summary()}")
+            man.flush()
+            if cache is not None and stage.futures:
+                cache.save()
+                self.log_put(f"[CACHE] {cache.summary()}")
+            if netbuf is not None and stage.futures:
+                self.log_put(f"[NET ] {netbuf.summary()}")
+        for st in (stage.stats, cap_stats) + ((pad.stats,) if pad is not None else ()):
+            if st.count:
+                self.log_put(f"[STAT] {st.summary()}")
+        self.log_put(f"[INFO] 完成 {man.count('done')} / {len(man.items)}，失败 {man.count('failed')}")
+
+    @contextlib.contextmanager
+    def open_page(self):
+        """有浏览器池时租一个 context 开页面；否则本任务自己启动并关闭 Chromium。"""
+        if self.pool is not None:
+            with self.pool.lease() as lease:
+                yield lease.new_page()
+        else:
+            from playwright.sync_api import sync_playwright
+            with sync_playwright() as p:
+                browser = p.chromium.launch(headless=self.opts.headless)
+                try:
+                    yield browser.new_context().new_page()
+                finally:
+                    browser.close()
+
+    def run(self):
+        """执行任务，返回最终的 Manifest。"""
+        t0 = time.monotonic()
+        try:
+            return self._run()
+        finally:
+            self.metrics.observe("job", time.monotonic() - t0)
+            self.report()
+
+    def report(self):
+        """打印本任务的指标汇总表；按选项追加 JSON Lines，并入上级汇总。"""
+        for line in self.metrics.table():
+            self.log_put(f"[STAT] {line}")
+        if self.opts.metrics_jsonl:
+            try:
+                self.metrics.write_jsonl(self.opts.metrics_jsonl, url=self.url, out_dir=self.out_dir)
+            except OSError as e:
+                self.log_put(f"[WARN] 指标写入失败：{e}")
+        if self.parent_metrics is not None:
+            self.parent_metrics.merge(self.metrics)
+
+    def download_cache(self):
+        if not self.opts.use_cache:
+            return None
+        return self.cache or shared_cache(self.opts.cache_mb * 1024 * 1024)
+
+    def load_manifest(self):
+        """断点续传：读已有清单，只重试未完成的条目；不续传或清单不可用时新建。"""
+        opts, url, out_dir = self.opts, self.url, self.out_dir
+        man_path = os.path.join(out_dir, MANIFEST_NAME)
+        man = None
+        if opts.resume and os.path.exists(man_path):
+            try:
+                man = Manifest.load(man_path)
+            except Exception as e:
+                self.log_put(f"[WARN] 清单读取失败，重新开始：{e}")
+            if man is not None and man.url and man.url != url:
+                self.log_put(f"[WARN] 清单对应的网址是 {man.url}，与本次不同，重新开始")
+                man = None
+            if man is not None:
+                self.log_put(f"[INFO] 断点续传：清单已有 {len(man.items)} 张，已完成 {man.count('done')}")
+        if man is None:
+            man = Manifest(man_path)
+        man.url, man.mode = url, opts.mode
+        return man
+
+    def page_hooks(self):
+        """
+        按选项建 (抓包缓冲, 请求拦截)，不用的为 None；同步和 async 两条路径共用。
+        抓包要在 goto 之前挂上，首屏图片也能收进缓冲。
+        """
+        opts = self.opts
+        netbuf = ResponseBuffer() if opts.net_capture and opts.mode in ("download", "both") else None
+        policy = None
+        if opts.block_resources:
+            policy = RoutePolicy(opts.block_types, opts.block_domains, opts.allow_domains)
+        return netbuf, policy
+
+    def start_pipeline(self, man, cache, netbuf=None):
+        """
+        流水线模式下在滚动前建好下载（和 4:3）阶段，先把续传清单里没下完的交进去。
+        截图要操作页面，只能等滚动结束；只截图的任务返回 None。
+        """
+        opts = self.opts
+        if not opts.pipeline or opts.mode not in ("download", "both"):
+            return None
+        stage = FetchStage(self, man, cache, netbuf, self.make_pad(), opts.pipeline_depth)
+        stage.feed(man.items, bounded=False)
+        return stage
+
+    def _run(self):
+        opts, url, out_dir = self.opts, self.url, self.out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        cache = self.download_cache()
+        man = self.load_manifest()
+        man_path = man.path
+
+        if man.complete and not any(man.needs(it, out_dir)[1] for it in man.items):
+            # 采集阶段已跑完，且不需要截图：完全跳过浏览器
+            self.log_put("[INFO] 清单已完整，跳过浏览器滚动阶段")
+            self.process_items(None, man, cache)
+        else:
+            self.log_put("[INFO] 启动浏览器…")
+            netbuf, policy = self.page_hooks()
+            t_open = time.monotonic()
+            with self.open_page() as page:
+                self.metrics.observe("open_page", time.monotonic() - t_open)
+                if netbuf is not None:
+                    netbuf.attach(page)
+                if policy is not None:
+                    policy.attach(page)
+                run_steps(self._load_steps(url), PageSteps(page))
+
+                stage = None
+                try:
+                    # 流水线：每轮新采到的图片立即并入清单并开始下载，滚动与下载重叠
+                    stage = self.start_pipeline(man, cache, netbuf)
+                    added = 0
+
+                    def feed_round(new):
+                        nonlocal added
+                        fresh = man.merge(new)
+                        added += len(fresh)
+                        man.flush(force=False)
+                        stage.feed(fresh, pump=lambda: page.wait_for_timeout(50))
+                        self.progress(stage.finished(), len(stage.futures))
+
+                    with self.metrics.time("scroll_total"):
+                        items = self.auto_scroll_and_collect(page, opts.max_scrolls, opts.bg_scan,
+                                                             feed_round if stage is not None else None)
+                    if opts.crawl_depth > 0:
+                        try:
+                            man.links = page.evaluate(JS_LINKS)
+                        except Exception as e:
+                            self.log_put(f"[WARN] 读取页面链接失败：{e}")
+                    if policy is not None:
+                        self.log_put(f"[NET ] {policy.summary()}")
+                    man.complete = man.complete or not self.stop_flag.is_set()
+                    added += len(man.merge(items))
+                    man.flush()
+                    self.log_put(f"[INFO] 采集到 {len(items)} 张图片（清单新增 {added}），已写入清单：{man_path}")
+
+                    self.process_items(page, man, cache, netbuf, stage)
+                finally:
+                    if stage is not None:
+                        # 滚动中途出错时 process_items 没跑到，这里收尾；重复关闭无害
+                        stage.close()
+                        if stage.pad is not None:
+                            stage.pad.close()
+                    if netbuf is not None:
+                        netbuf.close()
+
+        self.log_put("[DONE] 任务完成。")
+        return man
+
+
+# ---- 长驻 Chromium + context 租借池 ----
+def _devtools_endpoint(browser, timeout=10.0):
+    """
+    读 --remote-debugging-port=0 时 Chromium 实际监听的端口：
+    用户目录由 Playwright 临时创建，从浏览器命令行里取出，再读其中的 DevToolsActivePort（第一行是端口）。
+    端口由 Chromium 自己绑定后才写这个文件，不存在“先查空闲端口、再被别人占走”的竞争。
+    """
+    cdp = browser.new_browser_cdp_session()
+    try:
+        argv = cdp.send("Browser.getBrowserCommandLine")["arguments"]
+    finally:
+        cdp.detach()
+    data_dir = next((a.split("=", 1)[1] for a in argv if a.startswith("--user-data-dir=")), None)
+    if data_dir is None:
+        raise RuntimeError("找不到 Chromium 的用户目录，无法读取调试端口")
+    path = os.path.join(data_dir.strip('"'), "DevToolsActivePort")
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with open(path, encoding="utf-8") as f:
+                port = f.readline().strip()
+            if port.isdigit():
+                return f"http://127.0.0.1:{port}"
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("Chromium 没有写出 DevToolsActivePort")
+        time.sleep(0.05)
+
+
+class Lease:
+    """一次租约：在租到的 context 上开页面；归还时由 BrowserPool 统计并关闭这些页面。"""
+    def __init__(self, context):
+        self.context = context
+        self.pages = []
+
+    def new_page(self):
+        page = self.context.new_page()
+        self.pages.append(page)
+        return page
+
+
+class BrowserPool:
+    """
+    Chromium 只启动一次，按需借出 context，省掉每个任务 1–3 秒的启动和几百 MB 内存。
+    - 同时最多 size 个租约；lease() 在额度用完时阻塞。
+    - Playwright 同步 API 不能跨线程：start() 所在线程直接用启动时的连接，
+      其它线程第一次租借时用自己的 Playwright 实例 connect_over_cdp 连到同一个 Chromium，
+      线程结束前调用 release_thread() 断开。
+    - 调试端口没有鉴权，本机任何进程都能连上读 cookie：只有 cross_thread=True（别的线程也要租借）
+      才打开，端口由 Chromium 自己选（--remote-debugging-port=0），不预先占坑。
+      已启动的 Chromium 不能再补开端口，所以要在构造时说明；只在 start() 线程租借的（GUI 单页）不开。
+    - 归还的 context 留在本线程复用（cookie/缓存会延续）；累计开过 max_pages 个页面，
+      或归还时页面 JS 堆超过 max_heap_mb，就关闭重建。
+    """
+    def __init__(self, size=4, headless=True, max_pages=20, max_heap_mb=512, cross_thread=True):
+        self.size = max(1, int(size))
+        self.headless = headless
+        self.cross_thread = cross_thread
+        self.max_pages = max_pages
+        self.max_heap_mb = max_heap_mb
+        self.endpoint = None
+        self.contexts_created = 0
+        self.contexts_recycled = 0
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._owner = None
+        self._pw = None
+        self._browser = None
+
+    def start(self):
+        from playwright.sync_api import sync_playwright
+        self._pw = sync_playwright().start()
+        try:
+            # Browser.getBrowserCommandLine 要求带 --enable-automation（_devtools_endpoint 靠它找用户目录）
+            args = ["--remote-debugging-port=0", "--enable-automation"] if self.cross_thread else []
+            self._browser = self._pw.chromium.launch(headless=self.headless, args=args)
+            if self.cross_thread:
+                self.endpoint = _devtools_endpoint(self._browser)
+        except BaseException:
+            self.close()
+            raise
+        self._owner = threading.get_ident()
+        return self
+
+    def alive(self):
+        """本线程看到的 Chromium 连接是否还在（其它线程不碰 start() 线程的对象）。"""
+        st = self._local
+        browser = st.browser if hasattr(st, "idle") else self._browser
+        return browser is not None and browser.is_connected()
+
+    def _thread_state(self):
+        st = self._local
+        if not hasattr(st, "idle"):
+            st.idle, st.pw = [], None
+            if threading.get_ident() == self._owner:
+                st.browser = self._browser
+            elif self.endpoint is None:
+                del st.idle
+                raise RuntimeError("浏览器池没有开放跨线程连接（cross_thread=False），只能在 start() 的线程里租借")
+            else:
+                from playwright.sync_api import sync_playwright
+                st.pw = sync_playwright().start()
+                st.browser = st.pw.chromium.connect_over_cdp(self.endpoint)
+        return st
+
+    def _js_heap_mb(self, page):
+        try:
+            cdp = page.context.new_cdp_session(page)
+            try:
+                metrics = cdp.send("Performance.getMetrics")["metrics"]
+            finally:
+                cdp.detach()
+        except Exception:
+            return 0.0
+        return next((m["value"] for m in metrics if m["name"] == "JSHeapUsedSize"), 0) / 1024 / 1024
+
+    @contextlib.contextmanager
+    def lease(self):
+        self._slots.acquire()
+        try:
+            st = self._thread_state()
+            if st.idle:
+                entry = st.idle.pop()
+            else:
+                entry = {"ctx": st.browser.new_context(), "pages": 0}
+                with self._lock:
+                    self.contexts_created += 1
+            lease = Lease(entry["ctx"])
+            ok = False
+            try:
+                yield lease
+                ok = True
+            finally:
+                self._give_back(st, entry, lease, ok)
+        finally:
+            self._slots.release()
+
+    def _give_back(self, st, entry, lease, ok):
+        heap = 0.0
+        for page in lease.pages:
+            if not page.is_closed():
+                heap = max(heap, self._js_heap_mb(page))
+                try:
+                    page.close()
+                except Exception:
+                    pass
+        entry["pages"] += len(lease.pages)
+        worn = entry["pages"] >= self.max_pages or (self.max_heap_mb and heap > self.max_heap_mb)
+        if ok and not worn and st.browser.is_connected():
+            st.idle.append(entry)
+            return
+        try:
+            entry["ctx"].close()
+        except Exception:
+            pass
+        with self._lock:
+            self.contexts_recycled += 1
+
+    def release_thread(self):
+        """关闭本线程的空闲 context 并断开本线程的连接（不会关掉共享的 Chromium）。"""
+        st = self._local
+        if not hasattr(st, "idle"):
+            return
+        for entry in st.idle:
+            try:
+                entry["ctx"].close()
+            except Exception:
+                pass
+        if st.pw is not None:
+            try:
+                st.browser.close()
+            finally:
+                st.pw.stop()
+        del st.idle
+
+    def close(self):
+        """在 start() 所在线程调用：关闭空闲 context 和 Chromium。"""
+        self.release_thread()
+        try:
+            if self._browser is not None:
+                self._browser.close()
+        finally:
+            if self._pw is not None:
+                self._pw.stop()
+            self._browser = self._pw = None
+
+
+# ---- 整站抓取：链接前沿队列 + 域名限速 + 跨页面去重 ----
+CRAWL_MANIFEST = "crawl.json"
+
+
+def canonical_url(url):
+    """前沿去重用的规范形式：小写主机、去默认端口和 #片段，空路径补成 /。"""
+    u = urlparse(url)
+    netloc = u.netloc.lower()
+    host, _, port = netloc.rpartition(":")
+    if host and (u.scheme, port) in (("http", "80"), ("https", "443")):
+        netloc = host
+    return u._replace(netloc=netloc, path=u.path or "/", fragment="").geturl()
+
+
+def site_of(url):
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class DomainLimiter:
+    """同一域名两次打开页面至少间隔 delay 秒；多个线程共用，按预约顺序排队。"""
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host, stop_flag=None):
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next.get(host, 0.0))
+            self._next[host] = at + self.delay
+        while True:
+            left = at - time.monotonic()
+            if left <= 0 or (stop_flag is not None and stop_flag.is_set()):
+                return
+            if stop_flag is not None:
+                stop_flag.wait(min(left, 0.5))
+            else:
+                time.sleep(left)
+
+
+class Crawl:
+    """
+    整站抓取：从 url 出发，沿同站链接（域名相同或为其子域，按 crawl_include/crawl_exclude 过滤）
+    扩展到 crawl_depth 层、最多 crawl_max_pages 个页面；每个页面是一个 Job，输出到 out_dir 下的 NNN-… 子目录。
+    - crawl_workers 个线程从前沿队列取页面，共用一个 BrowserPool（没给就自己启动一个）；
+    - 同一域名打开页面受 DomainLimiter 限速；
+    - 所有页面共用一个 DedupIndex，同一张图全站只下载/保留一份，被淘汰的文件在最后统一删除；
+    - crawl.json 记录每个页面的目录、深度和状态，resume 时沿用原来的目录；
+    - 各页面的指标并入 self.metrics，结束时打印全站汇总表；给了 metrics 时再并入其中；
+    - 各页面共用同一个下载缓存（cache，不给时为 shared_cache()）。
+    """
+    def __init__(self, url, out_dir, opts=None, log=None, progress=None, stop_flag=None, pool=None, metrics=None,
+                 cache=None):
+        self.url = canonical_url(url)
+        self.out_dir = out_dir
+        self.opts = opts or JobOptions()
+        self.log = log or print
+        self.progress = progress or (lambda done, total: None)
+        self.stop_flag = stop_flag or threading.Event()
+        self.pool = pool
+        self.cache = cache
+        self.site = site_of(self.url)
+        self.include = re.compile(self.opts.crawl_include) if self.opts.crawl_include else None
+        self.exclude = re.compile(self.opts.crawl_exclude) if self.opts.crawl_exclude else None
+        self.pages = {}             # 规范化 url -> {"dir", "depth", "status", "images", "failed"}
+        self.metrics = Metrics()
+        self.parent_metrics = metrics
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def allowed(self, url):
+        host = (urlparse(url).hostname or "").lower()
+        if not (host == self.site or host.endswith("." + self.site)):
+            return False
+        if self.include is not None and not self.include.search(url):
+            return False
+        return not (self.exclude is not None and self.exclude.search(url))
+
+    def _load(self):
+        path = os.path.join(self.out_dir, CRAWL_MANIFEST)
+        if not (self.opts.resume and os.path.exists(path)):
+            return {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f).get("pages", {})
+        except Exception as e:
+            self.log(f"[WARN] 抓取记录读取失败，重新开始：{e}")
+            return {}
+
+    def _save(self):
+        with self._lock:
+            data = {"url": self.url, "depth": self.opts.crawl_depth, "pages": self.pages}
+            path = os.path.join(self.out_dir, CRAWL_MANIFEST)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(path + ".tmp", path)
+
+    def run(self):
+        """执行整站抓取，返回 pages 记录。"""
+        opts = self.opts
+        os.makedirs(self.out_dir, exist_ok=True)
+        old = self._load()
+        frontier = queue.Queue()
+        pending = [0]
+        done = [0]
+
+        def enqueue(url, depth):
+            url = canonical_url(url)
+            with self._lock:
+                if url in self.pages or len(self.pages) >= opts.crawl_max_pages:
+                    return
+                prev = old.get(url) or {}
+                self.pages[url] = {"dir": prev.get("dir") or url_dir_name(len(self.pages) + 1, url),
+                                   "depth": depth, "status": "pending"}
+                pending[0] += 1
+            frontier.put((url, depth))
+
+        shared = DedupIndex(opts.dedup_distance) if opts.dedup else None
+        limiter = DomainLimiter(opts.crawl_delay)
+
+        def visit(url, depth):
+            rec = self.pages[url]
+            tag = rec["dir"].split("-", 1)[0]
+            log = lambda msg: self.log(f"[#{tag}] {msg}")
+            limiter.wait(urlparse(url).hostname or "", self.stop_flag)
+            if self.stop_flag.is_set():
+                return
+            log(f"[CRAWL] 第 {depth} 层：{url}")
+            try:
+                man = Job(url, os.path.join(self.out_dir, rec["dir"]), opts, log=log,
+                          stop_flag=self.stop_flag, pool=pool, dedup=shared, metrics=self.metrics,
+                          cache=self.cache).run()
+                # 各工作线程同时改 failures 和页面记录，_save() 也在锁里序列化 pages
+                with self._lock:
+                    rec.update(status="done", images=len(man.items), failed=man.count("failed"))
+                    if man.count("failed"):
+                        self.failures += 1
+            except Exception as e:
+                log(f"[ERR ] 页面处理失败：{e}")
+                with self._lock:
+                    rec.update(status="failed", error=str(e))
+                    self.failures += 1
+                return
+            if depth < opts.crawl_depth:
+                for link in man.links:
+                    if self.allowed(link):
+                        enqueue(link, depth + 1)
+
+        def worker():
+            try:
+                while not self.stop_flag.is_set():
+                    try:
+                        url, depth = frontier.get(timeout=0.2)
+                    except queue.Empty:
+                        with self._lock:
+                            if pending[0] == 0:
+                                return
+                        continue
+                    try:
+                        visit(url, depth)
+                    finally:
+                        with self._lock:
+                            pending[0] -= 1
+                            done[0] += 1
+                        self.progress(done[0], len(self.pages))
+                        self._save()
+            finally:
+                pool.release_thread()
+
+        n = max(1, opts.crawl_workers)
+        own_pool = self.pool is None
+        pool = self.pool or BrowserPool(size=n, headless=opts.headless).start()
+        enqueue(self.url, 0)
+        self.log(f"[CRAWL] 开始：{self.url}，深度 {opts.crawl_depth}，最多 {opts.crawl_max_pages} 页，{n} 个页面并行")
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(n)]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            if own_pool:
+                pool.close()
+            if shared is not None:
+                # 所有页面的 4:3 阶段都已结束，统一删除被淘汰的重复文件
+                remove_discarded(shared.take_discard(), PAD_FORMATS[opts.pad_fmt] if opts.pad_43 else None)
+                self.log(f"[DEDUP] 全站：{shared.summary()}")
+            self._save()
+            self.metrics.inc("pages", len(self.pages), stage="crawl")
+            for line in self.metrics.table():
+                self.log(f"[STAT] 全站 {line}")
+            if self.parent_metrics is not None:
+                self.parent_metrics.merge(self.metrics)
+        n_done = sum(1 for p in self.pages.values() if p["status"] == "done")
+        self.log(f"[DONE] 整站抓取完成：{n_done} / {len(self.pages)} 页，"
+                 f"图片 {sum(p.get('images', 0) for p in self.pages.values())} 张")
+        return self.pages
+
+
+# ---- asyncio 版：一个线程里的事件循环同时驱动多个页面 ----
+class AsyncRunner:
+    """
+    批量抓取的 asyncio 版：一个事件循环、一个 Chromium 同时开 concurrency 个页面，不再每个任务占一个线程。
+    每个网址仍是一个 Job（清单、日志、指标、去重、FetchStage 流水线照旧），只有页面操作换成 async API；
+    下载仍在 FetchStage 的线程池里走 requests 和下载缓存，协程通过 _blocking 把新图片交过去，
+    背压只挂起对应页面的协程，事件循环照常推进其他页面。会阻塞的调用（feed 等背压、process_items 等下载收尾）
+    走本 runner 自己的 concurrency 个线程：每个页面同一时刻最多占一个，不会像默认 executor 那样被别的页面占满。
+    抓包缓冲和请求拦截用各自的 async 回调（attach_async）。只做下载：截图要逐个操作页面，仍用 Job.run。
+    """
+    def __init__(self, opts=None, concurrency=4, stop_flag=None, metrics=None, cache=None):
+        self.opts = opts or JobOptions()
+        self.concurrency = max(1, int(concurrency))
+        self.stop_flag = stop_flag or threading.Event()
+        self.metrics = metrics
+        self.cache = cache
+        self._threads = None
+
+    def run(self, tasks):
+        """tasks 为 [(url, out_dir, log)]；按顺序返回每个任务的 Manifest，异常结束的返回异常对象。"""
+        import asyncio
+        if self.opts.mode != "download":
+            raise ValueError("AsyncRunner 只支持 download 模式")
+        return asyncio.run(self._main(tasks))
+
+    async def _main(self, tasks):
+        import asyncio
+        from playwright.async_api import async_playwright
+        sem = asyncio.Semaphore(self.concurrency)
+        self._threads = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="async-page")
+        try:
+            async with async_playwright() as p:
+                browser = await p.chromium.launch(headless=self.opts.headless)
+                try:
+                    return await asyncio.gather(*(self._one(browser, sem, *t) for t in tasks),
+                                                return_exceptions=True)
+                finally:
+                    await browser.close()
+        finally:
+            self._threads.shutdown(wait=False)
+
+    async def _blocking(self, fn, *args):
+        """在本 runner 的线程里跑会阻塞的 fn，挂起当前协程等结果。"""
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(self._threads, fn, *args)
+
+    async def _one(self, browser, sem, url, out_dir, log):
+        async with sem:
+            job = Job(url, out_dir, self.opts, log=log, stop_flag=self.stop_flag, metrics=self.metrics,
+                      cache=self.cache)
+            t0 = time.monotonic()
+            try:
+                return await self._job(browser, job)
+            except Exception as e:
+                job.log_put(f"[ERR ] 任务异常结束：{e}")
+                raise
+            finally:
+                job.metrics.observe("job", time.monotonic() - t0)
+                job.report()
+
+    async def _job(self, browser, job):
+        opts = self.opts
+        os.makedirs(job.out_dir, exist_ok=True)
+        cache = job.download_cache()
+        man = job.load_manifest()
+        netbuf, policy = job.page_hooks() if not man.complete else (None, None)
+        stage = FetchStage(job, man, cache, netbuf, job.make_pad(), opts.pipeline_depth)
+        try:
+            stage.feed(man.items, bounded=False)
+            if man.complete:
+                job.log_put("[INFO] 清单已完整，跳过浏览器滚动阶段")
+            else:
+                await self._scroll(browser, job, man, stage, netbuf, policy)
+            await self._blocking(job.process_items, None, man, cache, netbuf, stage)
+        finally:
+            stage.close()
+            if stage.pad is not None:
+                stage.pad.close()
+            if netbuf is not None:
+                netbuf.close()
+        job.log_put("[DONE] 任务完成。")
+        return man
+
+    async def _scroll(self, browser, job, man, stage, netbuf=None, policy=None):
+        """同 Job.auto_scroll_and_collect：每轮新图片并入清单后立即交给下载阶段。"""
+        opts = self.opts
+        t_open = time.monotonic()
+        ctx = await browser.new_context()
+        try:
+            page = await ctx.new_page()
+            job.metrics.observe("open_page", time.monotonic() - t_open)
+            if netbuf is not None:
+                netbuf.attach_async(page)
+            if policy is not None:
+                await policy.attach_async(page)
+            await run_steps_async(job._load_steps(job.url), PageSteps(page))
+
+            added = 0
+
+            async def feed(fresh):
+                nonlocal added
+                new = man.merge(fresh)
+                added += len(new)
+                man.flush(force=False)
+                # 在途下载满了 feed 会阻塞，放到线程里等
+                await self._blocking(stage.feed, new)
+
+            sched = ScrollScheduler(page, quiet_ms=opts.scroll_quiet_ms, round_timeout=opts.scroll_timeout)
+            try:
+                with job.metrics.time("scroll_total"):
+                    items = await run_steps_async(job._scroll_rounds(sched, opts.max_scrolls, opts.bg_scan),
+                                                  PageSteps(page, feed))
+            finally:
+                sched.close()
+            if policy is not None:
+                job.log_put(f"[NET ] {policy.summary()}")
+        finally:
+            await ctx.close()
+        man.complete = man.complete or not job.stop_flag.is_set()
+        man.flush()
+        job.log_put(f"[INFO] 采集到 {len(items)} 张图片（清单新增 {added}），已写入清单：{man.path}")
@@ -0,0 +1,62 @@
+"""AsyncRunner._blocking：每个页面都在 feed 里等背压时，页面数超过默认 executor 大小也不会互相卡住。"""
+import asyncio, os, sys, threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper import AsyncRunner  # noqa: E402
+
+
+def test_blocking_calls_do_not_starve():
+    pages = 40                          # 比默认 executor 的上限（32）还多
+    runner = AsyncRunner(concurrency=pages)
+    barrier = threading.Barrier(pages, timeout=10)
+
+    def feed():
+        barrier.wait()                  # 所有页面都进了 feed 才放行，模拟同时等背压
+        return True
+
+    async def main():
+        runner._threads = ThreadPoolExecutor(max_workers=runner.concurrency)
+        try:
+            return await asyncio.gather(*(runner._blocking(feed) for _ in range(pages)))
+        finally:
+            runner._threads.shutdown()
+
+    assert asyncio.run(main()) == [True] * pages
+
+
+def test_async_page_hooks(tmp_path):
+    from types import SimpleNamespace
+    from scraper import ResponseBuffer, RoutePolicy
+
+    class Route:
+        def __init__(self, url, kind):
+            self.request = SimpleNamespace(url=url, resource_type=kind)
+            self.result = None
+
+        async def abort(self, reason):
+            self.result = reason
+
+        async def continue_(self):
+            self.result = "continue"
+
+    class Resp:
+        url, status = "http://img.test/a.jpg#x", 200
+        request = SimpleNamespace(resource_type="image")
+
+        async def body(self):
+            return b"png-bytes"
+
+    policy, netbuf = RoutePolicy(), ResponseBuffer()
+    media, img = Route("http://v.test/a.mp4", "media"), Route("http://img.test/a.jpg", "image")
+
+    async def main():
+        await policy._handle_async(media)
+        await policy._handle_async(img)
+        await netbuf._on_response_async(Resp())
+
+    asyncio.run(main())
+    assert (media.result, img.result) == ("blockedbyclient", "continue")
+    assert policy.blocked == {"media": 1} and policy.passed == 1
+    assert netbuf.write_to("http://img.test/a.jpg", str(tmp_path / "a.jpg"))[0] == len(b"png-bytes")
+    netbuf.close()
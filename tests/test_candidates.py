@@ -0,0 +1,72 @@
+"""pick_candidate：每种 SRC_POLICIES 在 w 描述符和 x 描述符的 srcset 上各选哪个地址。"""
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper import SRC_POLICIES, pick_candidate  # noqa: E402
+
+BASE = "http://img.test/a"
+
+# <img src="a-400.jpg" srcset="a-200.jpg 200w, a-400.jpg 400w, a-800.jpg 800w">，当前显示 400w
+W_ITEM = {"url": f"{BASE}-400.jpg", "candidates": [
+    {"url": f"{BASE}-400.jpg", "from": "current", "nw": 320, "w": 400},
+    {"url": f"{BASE}-200.jpg", "from": "srcset", "w": 200},
+    {"url": f"{BASE}-800.jpg", "from": "srcset", "w": 800},
+]}
+
+# <img src="a-1x.jpg" srcset="a-1x.jpg 1x, a-2x.jpg 2x, a-3x.jpg 3x">，当前显示 1x，1x 宽 400
+X_ITEM = {"url": f"{BASE}-1x.jpg", "candidates": [
+    {"url": f"{BASE}-1x.jpg", "from": "current", "nw": 400, "x": 1},
+    {"url": f"{BASE}-2x.jpg", "from": "srcset", "x": 2},
+    {"url": f"{BASE}-3x.jpg", "from": "srcset", "x": 3},
+]}
+
+EXPECT = {
+    # policy: (w srcset, x srcset)，closest 的目标宽度是 750
+    "largest": (f"{BASE}-800.jpg", f"{BASE}-3x.jpg"),
+    "closest": (f"{BASE}-800.jpg", f"{BASE}-2x.jpg"),
+    "smallest": (f"{BASE}-200.jpg", f"{BASE}-1x.jpg"),
+    "current": (f"{BASE}-400.jpg", f"{BASE}-1x.jpg"),
+}
+
+
+def test_every_policy_covered():
+    assert set(EXPECT) == set(SRC_POLICIES)
+
+
+@pytest.mark.parametrize("policy", SRC_POLICIES)
+def test_w_srcset(policy):
+    assert pick_candidate(W_ITEM, policy, 750) == EXPECT[policy][0]
+
+
+@pytest.mark.parametrize("policy", SRC_POLICIES)
+def test_x_srcset(policy):
+    assert pick_candidate(X_ITEM, policy, 750) == EXPECT[policy][1]
+
+
+def test_x_srcset_closest_uses_1x_width():
+    # 1x 宽 400：目标 1100 最接近 3x（1200），目标 500 最接近 1x
+    assert pick_candidate(X_ITEM, "closest", 1100) == f"{BASE}-3x.jpg"
+    assert pick_candidate(X_ITEM, "closest", 500) == f"{BASE}-1x.jpg"
+
+
+def test_x_srcset_without_natural_width():
+    # 懒加载占位时 current 没有 nw，x 候选只能彼此比较
+    it = {"url": f"{BASE}-1x.jpg", "candidates": [
+        {"url": "http://img.test/placeholder.gif", "from": "current"},
+        {"url": f"{BASE}-1x.jpg", "from": "data-srcset", "x": 1},
+        {"url": f"{BASE}-2x.jpg", "from": "data-srcset", "x": 2},
+    ]}
+    assert pick_candidate(it, "largest") == f"{BASE}-2x.jpg"
+    assert pick_candidate(it, "smallest") == f"{BASE}-1x.jpg"
+
+
+def test_legacy_current_width_counts_as_1x():
+    # 旧清单：current 的 w 是 naturalWidth，x 候选按它换算后仍参与比较
+    it = {"url": f"{BASE}-1x.jpg", "candidates": [
+        {"url": f"{BASE}-1x.jpg", "from": "current", "w": 400},
+        {"url": f"{BASE}-2x.jpg", "from": "srcset", "x": 2},
+    ]}
+    assert pick_candidate(it, "largest") == f"{BASE}-2x.jpg"
+    assert pick_candidate(it, "smallest") == f"{BASE}-1x.jpg"
@@ -0,0 +1,24 @@
+"""cli 参数校验：--async-pages 用不上的选项要报错，不能默默忽略。"""
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cli  # noqa: E402
+
+
+@pytest.mark.parametrize("extra, flag", [
+    (["-j", "3"], "-j/--jobs"),
+    (["--recycle-pages", "5"], "--recycle-pages"),
+    (["--recycle-heap-mb", "0"], "--recycle-heap-mb"),
+    (["--crawl-depth", "1"], "--crawl-depth"),
+    (["--mode", "both"], "--mode both"),
+])
+def test_async_pages_rejects_unused_flags(tmp_path, capsys, extra, flag):
+    urls = tmp_path / "urls.txt"
+    urls.write_text("http://example.test/\n", encoding="utf-8")
+    argv = [str(urls), "-o", str(tmp_path / "out"), "--browsers-path", str(tmp_path), "--async-pages", "2"]
+    with pytest.raises(SystemExit) as e:
+        cli.main(argv + extra)
+    assert e.value.code == 2
+    assert flag in capsys.readouterr().err
@@ -0,0 +1,39 @@
+"""Crawl：多个工作线程同时记失败页面，failures 不能丢计数。"""
+import os, sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scraper  # noqa: E402
+from scraper import Crawl, JobOptions  # noqa: E402
+
+PAGES = 60
+
+
+class FakeJob:
+    """起始页链到 PAGES 个子页；子页单号整页失败，双号有一张图下载失败。"""
+    def __init__(self, url, out_dir, opts, **kwargs):
+        self.url = url
+
+    def run(self):
+        if self.url.endswith("/"):
+            links = [f"http://example.test/p{i}" for i in range(PAGES)]
+            return SimpleNamespace(items=[], links=links, count=lambda status: 0)
+        if int(self.url.rsplit("p", 1)[1]) % 2:
+            raise RuntimeError("boom")
+        return SimpleNamespace(items=[{}], links=[], count=lambda status: 1 if status == "failed" else 0)
+
+
+def test_failures_counted_across_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "Job", FakeJob)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)         # 频繁切线程，放大没加锁时的丢失
+    try:
+        opts = JobOptions(crawl_depth=1, crawl_max_pages=PAGES + 1, crawl_workers=8, crawl_delay=0, dedup=False)
+        crawl = Crawl("http://example.test/", str(tmp_path), opts, log=lambda msg: None,
+                      pool=SimpleNamespace(release_thread=lambda: None))
+        pages = crawl.run()
+    finally:
+        sys.setswitchinterval(interval)
+    assert len(pages) == PAGES + 1
+    assert crawl.failures == PAGES
+    assert sum(p["status"] == "failed" for p in pages.values()) == PAGES // 2
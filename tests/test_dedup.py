@@ -0,0 +1,141 @@
+"""
+下载前去重：尺寸变体（pick_variants）和同一地址（DedupIndex.claim）只在保留的那张下载成功后才记 dup_of。
+本地起一个 HTTP 服务，?w=800 和 /missing 返回 404，用来模拟保留的那张下载失败。
+"""
+import io, os, sys, time, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper import Job, JobOptions, FetchStage, Manifest, DedupIndex, pick_variants  # noqa: E402
+
+
+def _png(w):
+    buf = io.BytesIO()
+    Image.new("RGB", (w, w * 3 // 4), (w % 256, 80, 160)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+HITS = []
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        HITS.append(self.path)
+        u = urlparse(self.path)
+        w = int(parse_qs(u.query).get("w", ["100"])[0])
+        if u.path.startswith("/missing") or w == 800:
+            time.sleep(0.2)             # 慢一点失败，让同地址的条目来得及挂上去
+            self.send_error(404)
+            return
+        body = _png(w)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def base():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+
+
+def _page(tmp_path, name, items, dedup=None):
+    out_dir = str(tmp_path / name)
+    os.makedirs(out_dir)
+    man = Manifest(os.path.join(out_dir, "images_manifest.json"), url="http://example.test/")
+    man.merge(items)
+    opts = JobOptions(use_cache=False, net_capture=False, dedup_distance=-1)
+    job = Job("http://example.test/", out_dir, opts, log=lambda msg: None, dedup=dedup)
+    return job, man, FetchStage(job, man)
+
+
+def _run(stage, items):
+    del HITS[:]
+    stage.feed(items, bounded=False)
+    stage.wait()
+    stage.close()
+
+
+def test_pick_variants_keeps_widest(base):
+    items = [{"url": f"{base}/img/a.jpg?w={w}"} for w in (200, 800, 400)]
+    items.append({"url": f"{base}/img/b.jpg?w=300"})
+    pairs = pick_variants(items)
+    assert {dup["url"] for dup, _ in pairs} == {items[0]["url"], items[2]["url"]}
+    assert all(keep is items[1] for _, keep in pairs)
+
+
+def test_failed_keeper_requeues_next_variant(base, tmp_path):
+    job, man, stage = _page(tmp_path, "p", [{"url": f"{base}/img/a.jpg?w={w}"} for w in (200, 800, 400)])
+    _run(stage, man.items)
+    by_w = {int(it["url"].rsplit("=", 1)[1]): it for it in man.items}
+    assert by_w[800]["status"] == "failed" and not by_w[800].get("dup_of")
+    assert by_w[400]["status"] == "done" and os.path.exists(os.path.join(job.out_dir, by_w[400]["path"]))
+    assert by_w[200]["dup_of"] == by_w[400]["name"]
+
+
+def test_failed_keeper_same_src_not_marked_dup(base, tmp_path):
+    # 两个条目 url 不同，但选中的下载地址相同，都下载失败：不能有哪个记成另一个的重复
+    cand = [{"url": f"{base}/missing.png", "from": "srcset", "w": 640}]
+    items = [{"url": f"{base}/missing-{k}.png", "candidates": cand} for k in "ab"]
+    job, man, stage = _page(tmp_path, "p", items)
+    _run(stage, man.items)
+    assert [it["status"] for it in man.items] == ["failed", "failed"]
+    assert not any(it.get("dup_of") for it in man.items)
+    # 续传时两张都还要下载
+    assert all(man.needs(it, job.out_dir)[0] for it in man.items)
+
+
+def test_claim_waits_for_keeper_across_pages(base, tmp_path):
+    dedup = DedupIndex(-1)
+    _, man1, stage1 = _page(tmp_path, "p1", [{"url": f"{base}/missing.png"}, {"url": f"{base}/img/c.png"}], dedup)
+    _, man2, stage2 = _page(tmp_path, "p2", [{"url": f"{base}/missing.png"}, {"url": f"{base}/img/c.png"}], dedup)
+    stage1.feed(man1.items, bounded=False)
+    stage2.feed(man2.items, bounded=False)  # 同一地址都挂在第一页的条目上
+    for stage in (stage1, stage2):
+        stage.wait()
+        stage.close()
+    missing, ok = man2.items
+    assert missing["status"] == "failed" and not missing.get("dup_of")
+    assert ok["dup_of"] == os.path.join("..", "p1", man1.items[1]["name"])
+
+
+def test_pick_variants_ignores_fragments(base):
+    items = [{"url": f"{base}/img/a.jpg?w=200#x"}, {"url": f"{base}/img/a.jpg?w=200#y"},
+             {"url": f"{base}/img/a.jpg?w=400"}]
+    assert pick_variants(items) == [(items[0], items[2])]
+
+
+def test_fragment_is_same_url_not_variant(base, tmp_path):
+    job, man, stage = _page(tmp_path, "p", [{"url": f"{base}/img/f.png#a"}, {"url": f"{base}/img/f.png#b"}])
+    _run(stage, man.items)
+    first, second = man.items
+    assert len(HITS) == 1
+    assert first["status"] == "done" and second["dup_of"] == first["name"]
+    d = stage.dedup
+    assert (d.same_url, d.variants, d.saved_bytes) == (1, 0, first["bytes"])
+
+
+def test_resume_seeds_files_on_disk(base, tmp_path):
+    job, man, stage = _page(tmp_path, "p", [{"url": f"{base}/img/r.jpg?w=400"}])
+    _run(stage, man.items)
+    kept = man.items[0]
+    assert kept["status"] == "done"
+    # 续传：新采到同地址（不同 #片段）和更小的尺寸变体，都不该再下载
+    man.merge([{"url": f"{base}/img/r.jpg?w=400#again"}, {"url": f"{base}/img/r.jpg?w=200"}])
+    stage = FetchStage(job, man)
+    _run(stage, man.items)
+    assert HITS == []
+    same, small = man.items[1:]
+    assert same["dup_of"] == kept["name"] and small["dup_of"] == kept["name"]
+    assert (stage.dedup.same_url, stage.dedup.variants) == (1, 1)
@@ -0,0 +1,25 @@
+"""ResponseBuffer.write_to：超过 max_bytes 的响应抛 DownloadTooLarge，不算抓包命中。"""
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper import ResponseBuffer, DownloadTooLarge  # noqa: E402
+
+
+@pytest.mark.parametrize("max_mem", [1024, 0])    # 0：直接溢出到磁盘
+def test_oversize_is_not_a_hit(tmp_path, max_mem):
+    buf = ResponseBuffer(max_mem=max_mem)
+    buf.put("http://img.test/big.jpg", b"x" * 100)
+    try:
+        with pytest.raises(DownloadTooLarge):
+            buf.write_to("http://img.test/big.jpg", str(tmp_path / "big.jpg"), max_bytes=50)
+        assert (buf.hits, buf.misses) == (0, 0)
+        assert not os.path.exists(tmp_path / "big.jpg.part")
+
+        assert buf.write_to("http://img.test/big.jpg#x", str(tmp_path / "big.jpg"), max_bytes=100)[0] == 100
+        assert buf.write_to("http://img.test/other.jpg", str(tmp_path / "other.jpg")) is None
+        assert (buf.hits, buf.misses) == (1, 1)
+        assert buf.summary().startswith("抓包命中 1，回退 HTTP 1")
+    finally:
+        buf.close()
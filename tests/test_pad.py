@@ -0,0 +1,43 @@
+"""PadStage：不指定 workers 的各个阶段共用一个进程池，close() 只等自己的任务、不关共用的池。"""
+import os, sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper import PadStage, shared_pad_pool  # noqa: E402
+
+
+def _src(tmp_path, name, size):
+    path = str(tmp_path / f"{name}.png")
+    Image.new("RGB", size, (200, 50, 50)).save(path)
+    return path
+
+
+def test_stages_share_one_pool(tmp_path):
+    done = []
+    a = PadStage(on_done=lambda path, ok: done.append((path, ok)))
+    b = PadStage(on_done=lambda path, ok: done.append((path, ok)))
+    assert a.pool is b.pool is shared_pad_pool()
+    assert a.pool._mp_context.get_start_method() == "spawn"   # 多线程父进程里不能 fork
+
+    src = _src(tmp_path, "a", (200, 100))
+    a.submit(src, str(tmp_path / "a-43.png"))
+    a.close()
+    # close() 返回时回调已经跑完
+    assert done == [(str(tmp_path / "a-43.png"), True)] and a.stats.count == 1
+
+    # 共用的池没被 a 关掉，b 照常可用
+    src = _src(tmp_path, "b", (100, 300))
+    b.submit(src, str(tmp_path / "b-43.png"))
+    b.close()
+    with Image.open(tmp_path / "b-43.png") as im:
+        assert im.size[0] * 3 == im.size[1] * 4
+
+
+def test_explicit_workers_own_pool(tmp_path):
+    pad = PadStage(workers=1)
+    assert pad.pool is not shared_pad_pool()
+    assert pad.pool._mp_context.get_start_method() == "spawn"
+    pad.submit(_src(tmp_path, "c", (300, 300)), str(tmp_path / "c-43.png"))
+    pad.close()
+    assert pad.stats.count == 1
@@ -0,0 +1,53 @@
+"""process_items 的进度：批量截图剩下的逐个截图时，总数不能缩水（done ≤ total）。"""
+import io, os, sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper import Job, JobOptions, Manifest, JS_CAPTURE_BOXES  # noqa: E402
+
+
+def _png(w, h):
+    buf = io.BytesIO()
+    Image.new("RGB", (w, h), (10, 120, 30)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class FakeLocator:
+    first = property(lambda self: self)
+
+    def scroll_into_view_if_needed(self, timeout=None):
+        pass
+
+    def screenshot(self, path):
+        with open(path, "wb") as f:
+            f.write(_png(20, 20))
+
+
+class FakePage:
+    """前 8 个元素能拿到位置（走批量截图），后 2 个拿不到，退回逐个截图。"""
+    def evaluate(self, js, arg=None):
+        assert js is JS_CAPTURE_BOXES
+        boxes = [{"x": 0, "y": i * 30, "w": 20, "h": 20, "single": False} if i < 8 else None
+                 for i in range(len(arg))]
+        return {"dpr": 1, "boxes": boxes}
+
+    def screenshot(self, clip=None, full_page=False, path=None):
+        return _png(int(clip["width"]), int(clip["height"]))
+
+    def locator(self, css):
+        return FakeLocator()
+
+
+def test_batch_capture_progress_total_stable(tmp_path):
+    out_dir = str(tmp_path)
+    man = Manifest(os.path.join(out_dir, "images_manifest.json"), mode="screenshot")
+    man.merge([{"url": f"http://img.test/{i}.jpg", "css": f"#i{i}"} for i in range(10)])
+    seen = []
+    opts = JobOptions(mode="screenshot", use_cache=False, net_capture=False)
+    job = Job("http://example.test/", out_dir, opts, log=lambda msg: None,
+              progress=lambda done, total: seen.append((done, total)))
+    job.process_items(FakePage(), man, None)
+    assert man.count("done") == 10
+    assert all(done <= total for done, total in seen), seen
+    assert seen[-1] == (10, 10)
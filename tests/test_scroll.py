@@ -0,0 +1,162 @@
+"""
+滚动采集（Job._load_steps / _click_more_steps / _scroll_rounds）在同步和 async 两种页面上行为一致：
+同样的导航、“加载更多”点击和指标，都等在途图片请求结束。
+"""
+import asyncio, os, sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper import (Job, JobOptions, ScrollScheduler, PageSteps, JS_SETTLE, JS_COLLECT_DELTA,  # noqa: E402
+                     JS_FIND_MORE, run_steps, run_steps_async)
+
+ROUNDS = [[{"url": "http://img.test/1.jpg"}, {"url": "http://img.test/2.jpg"}],
+          [{"url": "http://img.test/2.jpg"}, {"url": "http://img.test/3.jpg"}]]
+URLS = ["http://img.test/1.jpg", "http://img.test/2.jpg", "http://img.test/3.jpg"]
+
+
+class FakeLocator:
+    def __init__(self, page, sel):
+        self.page, self.sel = page, sel
+
+    first = property(lambda self: self)
+
+    def scroll_into_view_if_needed(self, timeout=None):
+        pass
+
+    def click(self, timeout=None):
+        self.page.clicks.append(self.sel)
+
+
+class FakePage:
+    """
+    每次滚到底发出一个图片请求，wait_for_timeout 时它才结束；每轮采集依次返回 ROUNDS。
+    第一轮有一个“加载更多”按钮，点过之后 DOM 计数不再变化，之后不该再点它。
+    """
+    def __init__(self):
+        self.rounds = [list(r) for r in ROUNDS]
+        self.handlers = {}
+        self.waits = 0
+        self.clicks = []
+        self.calls = []
+
+    def on(self, event, fn):
+        self.handlers[event] = fn
+
+    def remove_listener(self, event, fn):
+        self.handlers.pop(event, None)
+
+    def goto(self, url, **kwargs):
+        self.calls.append(("goto", url))
+
+    def wait_for_load_state(self, state, **kwargs):
+        self.calls.append(("load", state))
+
+    def locator(self, sel):
+        return FakeLocator(self, sel)
+
+    def evaluate(self, js, arg=None):
+        if js is JS_SETTLE:
+            return {"ms": 1, "grew": 0, "height": 1000, "timedOut": False}
+        if js is JS_COLLECT_DELTA:
+            return {"items": self.rounds.pop(0) if self.rounds else []}
+        if js is JS_FIND_MORE:
+            items = [] if "more" in arg["skip"] else [{"key": "more", "sel": "#more"}]
+            return {"items": items, "mutations": 5}
+        self.handlers["request"](SimpleNamespace(resource_type="image"))
+        return None
+
+    def wait_for_timeout(self, ms):
+        self.waits += 1
+        self.handlers["requestfinished"](SimpleNamespace(resource_type="image"))
+
+
+class AsyncFakeLocator(FakeLocator):
+    async def scroll_into_view_if_needed(self, timeout=None):
+        pass
+
+    async def click(self, timeout=None):
+        FakeLocator.click(self, timeout)
+
+
+class AsyncFakePage(FakePage):
+    async def goto(self, url, **kwargs):
+        FakePage.goto(self, url, **kwargs)
+
+    async def wait_for_load_state(self, state, **kwargs):
+        FakePage.wait_for_load_state(self, state, **kwargs)
+
+    def locator(self, sel):
+        return AsyncFakeLocator(self, sel)
+
+    async def evaluate(self, js, arg=None):
+        return FakePage.evaluate(self, js, arg)
+
+    async def wait_for_timeout(self, ms):
+        FakePage.wait_for_timeout(self, ms)
+
+
+def _job():
+    opts = JobOptions(scroll_patience=2)
+    return Job("http://example.test/", "unused", opts, log=lambda msg: None)
+
+
+def _check(job, page, items, fed):
+    assert [it["url"] for it in items] == URLS
+    assert [len(f) for f in fed] == [2, 1]
+    assert page.calls == [("goto", "http://example.test/"), ("load", "networkidle")]
+    assert page.clicks == ["#more"]     # 点过没反应的按钮记死，不再点
+    # 每轮滚到底都等了在途请求；两轮有新图，再两轮没变化按 patience 停下
+    assert page.waits == 4
+    assert not page.handlers
+    for stage in ("navigate", "load_idle", "find_more", "click_more", "collect", "scroll_wait"):
+        assert job.metrics.timers[stage].count > 0, stage
+
+
+def test_sync_scroll():
+    page, fed, job = FakePage(), [], _job()
+    run_steps(job._load_steps(job.url), PageSteps(page))
+    items = job.auto_scroll_and_collect(page, 10, on_items=fed.append)
+    _check(job, page, items, fed)
+
+
+def test_async_scroll_matches_sync():
+    page, fed, job = AsyncFakePage(), [], _job()
+
+    async def feed(fresh):
+        fed.append(fresh)
+
+    async def main():
+        await run_steps_async(job._load_steps(job.url), PageSteps(page))
+        sched = ScrollScheduler(page, round_timeout=1.0)
+        try:
+            return await run_steps_async(job._scroll_rounds(sched, 10, "full"), PageSteps(page, feed))
+        finally:
+            sched.close()
+
+    _check(job, page, asyncio.run(main()), fed)
+
+
+def test_collect_error_is_swallowed():
+    class BrokenPage(FakePage):
+        def evaluate(self, js, arg=None):
+            if js is JS_COLLECT_DELTA:
+                raise RuntimeError("boom")
+            return FakePage.evaluate(self, js, arg)
+    assert _job().auto_scroll_and_collect(BrokenPage(), 10) == []
+
+
+def test_unswapped_lazy_images_flushed_last():
+    # 懒加载没换上真图的 <img> 滚动时先压着，最后一轮 flush 才交出来
+    lazy = {"url": "http://img.test/lazy.jpg", "candidates": [{"url": "http://img.test/lazy.jpg", "from": "data-src"}]}
+
+    class LazyPage(FakePage):
+        def evaluate(self, js, arg=None):
+            if js is JS_COLLECT_DELTA and arg.get("flush"):
+                return {"items": [lazy, {"url": URLS[0]}]}
+            return FakePage.evaluate(self, js, arg)
+
+    page, fed, job = LazyPage(), [], _job()
+    items = job.auto_scroll_and_collect(page, 10, on_items=fed.append)
+    assert [it["url"] for it in items] == URLS + [lazy["url"]]
+    assert fed[-1] == [lazy]
+    assert job.metrics.counters[("items", "collect", "")] == 4